@@ -1,13 +1,419 @@
-from django.contrib import admin
+import os
+
+from django import forms
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from django.urls import path
+from django.contrib import admin, messages
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.html import format_html
 from .models import *
+from .attachments import thumbnail_name
+from .availability import annotate_availability
+from .line_items import save_purchase_products
+from .payments import Overpayment, check_payments
+from .pdf_batch import expire_stale_jobs, start_batch_job
+
+
+class LotChoiceField(forms.ModelChoiceField):
+    """Lot dropdown that shows the remaining kg next to each lot."""
+
+    def label_from_instance(self, obj):
+        return f"{obj} - {obj.remaining_kg} kg left"
+
+
+class SalesLotInline(admin.TabularInline):
+    model = SalesLot
+    extra = 1
+
+    def get_queryset(self, request):
+        # SalesLot.__str__ shows the lot number
+        return super().get_queryset(request).select_related('purchase_invoice')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'purchase_invoice':
+            # Offer lots that still have stock, plus the ones already on this invoice.
+            # The annotation is reused by SalesLot.clean(), so validating a
+            # multi-lot sale needs no extra availability queries.
+            object_id = request.resolver_match.kwargs.get('object_id') if request.resolver_match else None
+            in_use = SalesLot.objects.filter(sales_invoice_id=object_id).values('purchase_invoice')
+            lots = annotate_availability(PurchaseInvoice.objects.all())
+            kwargs['queryset'] = lots.filter(Q(remaining_kg__gt=0) | Q(pk__in=in_use)).order_by('-date', '-id')
+            kwargs['form_class'] = LotChoiceField
+            field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+            # The admin builds the formset several times per request and every
+            # row renders the dropdown: query the lots once and share the list.
+            if not hasattr(request, '_sales_lot_choices'):
+                request._sales_lot_choices = list(iter(field.choices))
+            field.choices = request._sales_lot_choices
+            return field
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class AttachmentPreviewMixin:
+    """Payment attachments as lazily loaded thumbnails that link to the full file."""
+    attachment_kind = None  # 'purchase' or 'sales', see views.payment_attachment
+
+    @admin.display(description="Attachment")
+    def attachment_preview(self, obj):
+        if not obj.attachment:
+            return "-"
+        url = reverse('payment_attachment', args=[self.attachment_kind, obj.pk])
+        if obj.attachment.storage.exists(thumbnail_name(obj.attachment.name)):
+            thumbnail_url = reverse('payment_attachment_thumbnail', args=[self.attachment_kind, obj.pk])
+            return format_html('<a href="{}"><img src="{}" alt="" loading="lazy" style="max-height: 80px"></a>',
+                               url, thumbnail_url)
+        return format_html('<a href="{}">{}</a>', url, os.path.basename(obj.attachment.name))
+
+
+class PrefetchedProductField(forms.ModelChoiceField):
+    """
+    Product field that takes the product from `products`, the products of all
+    submitted rows fetched once by the formset. An id missing from it is not
+    a product (any more), so no query is made per row.
+    """
+    products = {}
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.products[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+
+class PurchaseProductForm(forms.ModelForm):
+    def _get_validation_exclusions(self):
+        # The product was validated with the formset's products (see
+        # PurchaseProductFormSet): skip the per-row foreign key check.
+        exclude = super()._get_validation_exclusions()
+        exclude.add('product')
+        return exclude
+
+
+class PurchaseProductFormSet(forms.BaseInlineFormSet):
+    """Saves all line items of the lot in bulk, then sums net_total once (line_items.py)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.is_bound:
+            # The products of all submitted rows in one query, not one per row
+            submitted = (self.data.get(form.add_prefix('product'), '') for form in self.forms)
+            products = Product.objects.in_bulk({int(value) for value in submitted if value.isdigit()})
+            for form in self.forms:
+                form.fields['product'].products = products
+
+    def save(self, commit=True):
+        objects = super().save(commit=False)
+        if commit:
+            save_purchase_products(self.instance, self.new_objects, [obj for obj, _ in self.changed_objects],
+                                   self.deleted_objects)
+        return objects
+
+
+class PurchaseProductInline(admin.TabularInline):
+    model = PurchaseProduct
+    form = PurchaseProductForm
+    formset = PurchaseProductFormSet
+    extra = 1
+    fields = ('serial_number', 'product', 'quantity', 'price', 'damage', 'discount', 'rotten', 'loading_unloading',
+              'total')
+    readonly_fields = ('serial_number', 'loading_unloading', 'total')
+    autocomplete_fields = ('product',)
+    ordering = ('serial_number',)
+
+    def get_queryset(self, request):
+        # PurchaseProduct.__str__ shows the product and invoice number
+        return super().get_queryset(request).select_related('product', 'invoice')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'product':
+            kwargs['form_class'] = PrefetchedProductField
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class PaymentInline(AttachmentPreviewMixin, admin.TabularInline):
+    model = Payment
+    attachment_kind = 'purchase'
+    extra = 0
+    fields = ('amount', 'date', 'payment_mode', 'attachment', 'attachment_preview')
+    readonly_fields = ('attachment_preview',)
+
+    def get_queryset(self, request):
+        # Payment.__str__ shows the invoice number
+        return super().get_queryset(request).select_related('invoice')
+
+
+class SalesPaymentFormSet(forms.BaseInlineFormSet):
+    """
+    Checks the payments together against the invoice as submitted, so adding
+    two payments in one save cannot go over the total either.
+    """
+
+    def clean(self):
+        super().clean()
+        amounts = [form.cleaned_data['amount'] for form in self.forms
+                   if form.cleaned_data.get('amount') is not None and not self._should_delete_form(form)]
+        check_payments(self.instance, amounts)
+
+
+class SalesPaymentInline(AttachmentPreviewMixin, admin.TabularInline):
+    model = SalesPayment
+    formset = SalesPaymentFormSet
+    attachment_kind = 'sales'
+    extra = 0
+    fields = ('amount', 'date', 'payment_mode', 'attachment', 'attachment_preview')
+    readonly_fields = ('attachment_preview',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('invoice')
+
+
+class OverpaymentMixin:
+    """
+    A payment the form allowed can still be refused when it is saved, if
+    another clerk paid the same invoice in between (payments.py). Roll the
+    save back and show the refusal as an error instead of a server error.
+    """
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except Overpayment as error:
+            self.message_user(request, ' '.join(error.messages), messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+
+@admin.register(PurchaseVendor)
+class PurchaseVendorAdmin(admin.ModelAdmin):
+    list_display = ('name', 'area', 'contact_number')
+    search_fields = ('name', 'area', 'contact_number')
+    ordering = ('name',)
+
+
+@admin.register(Customer)
+class CustomerAdmin(admin.ModelAdmin):
+    list_display = ('name', 'contact_number')
+    search_fields = ('name', 'contact_number')
+    ordering = ('name',)
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('name', 'category', 'current_stock', 'threshold')
+    list_select_related = ('category',)
+    search_fields = ('name',)
+
+
+@admin.register(PurchaseInvoice)
+class PurchaseInvoiceAdmin(OverpaymentMixin, admin.ModelAdmin):
+    inlines = [PurchaseProductInline, PaymentInline]
+    list_display = ('lot_number', 'invoice_number', 'date', 'vendor', 'net_total', 'paid_amount', 'due', 'available_kg')
+    list_select_related = ('vendor',)
+    search_fields = ('lot_number', 'invoice_number', 'vendor__name')
+    autocomplete_fields = ('vendor',)
+    date_hierarchy = 'date'
+    # The sum of the line items
+    readonly_fields = ('net_total',)
+
+    def get_queryset(self, request):
+        # Paid, due and available kg for the whole page in the one list query
+        return annotate_availability(super().get_queryset(request)).annotate(
+            due_total=PurchaseInvoice.due_amount_expression(),
+        )
+
+    @admin.display(description="Due", ordering='due_total')
+    def due(self, obj):
+        return obj.due_amount
+
+    @admin.display(description="Available (kg)", ordering='remaining_kg')
+    def available_kg(self, obj):
+        return obj.available_quantity
+
+
+class PaymentStatusFilter(admin.SimpleListFilter):
+    """SalesInvoice.payment_status() as a filter, on the annotated due amount."""
+    title = "payment status"
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        return [('paid', "Paid"), ('partial', "Partial"), ('unpaid', "Unpaid")]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'paid':
+            return queryset.filter(due_total=0)
+        if self.value() == 'partial':
+            return queryset.exclude(due_total=0).exclude(paid_amount=0)
+        if self.value() == 'unpaid':
+            return queryset.exclude(due_total=0).filter(paid_amount=0)
+        return queryset
+
+
+@admin.register(SalesInvoice)
+class SalesInvoiceAdmin(OverpaymentMixin, admin.ModelAdmin):
+    inlines = [SalesLotInline, SalesPaymentInline]
+    list_display = ('invoice_number', 'date', 'vendor', 'final_total', 'paid_amount', 'due')
+    list_select_related = ('vendor',)
+    # Not the customer: that filter lists every customer on every page
+    list_filter = (PaymentStatusFilter,)
+    search_fields = ('invoice_number', 'vendor__name', 'vehicle_number')
+    autocomplete_fields = ('vendor',)
+    date_hierarchy = 'date'
+    actions = ['print_merged_pdf', 'print_zip']
+
+    def get_inlines(self, request, obj):
+        # The line items are entered on the sales page, not here, so a new
+        # invoice has no total to take payments against yet
+        if obj is None:
+            return [inline for inline in self.inlines if inline is not SalesPaymentInline]
+        return self.inlines
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            final_total_amount=SalesInvoice.total_after_packaging_expression(),
+            due_total=SalesInvoice.due_amount_expression(),
+        )
+
+    @admin.display(description="Total", ordering='final_total_amount')
+    def final_total(self, obj):
+        return obj.final_total_amount
+
+    @admin.display(description="Due", ordering='due_total')
+    def due(self, obj):
+        return obj.due_total
+
+    def _start_print_job(self, request, queryset, output_format):
+        job = InvoiceBatchJob.objects.create(
+            created_by=request.user,
+            invoice_ids=list(queryset.values_list('pk', flat=True)),
+            output_format=output_format,
+        )
+        # Rendering runs in a separate process; this request returns at once
+        start_batch_job(job)
+        url = reverse('admin:Accounts_invoicebatchjob_change', args=[job.pk])
+        self.message_user(
+            request,
+            format_html('Printing {} invoices in the background: <a href="{}">{}</a>', len(job.invoice_ids), url, job),
+            messages.SUCCESS,
+        )
+
+    @admin.action(description="Print selected invoices (merged PDF)")
+    def print_merged_pdf(self, request, queryset):
+        self._start_print_job(request, queryset, 'pdf')
+
+    @admin.action(description="Print selected invoices (ZIP of PDFs)")
+    def print_zip(self, request, queryset):
+        self._start_print_job(request, queryset, 'zip')
+
+
+@admin.register(Payment)
+class PaymentAdmin(OverpaymentMixin, AttachmentPreviewMixin, admin.ModelAdmin):
+    attachment_kind = 'purchase'
+    list_display = ('date', 'invoice', 'amount', 'payment_mode', 'attachment_preview')
+    list_filter = ('payment_mode',)
+    date_hierarchy = 'date'
+    list_select_related = ('invoice',)
+    search_fields = ('invoice__lot_number', 'invoice__invoice_number')
+    autocomplete_fields = ('invoice',)
+    readonly_fields = ('attachment_preview',)
+
+
+@admin.register(SalesPayment)
+class SalesPaymentAdmin(OverpaymentMixin, AttachmentPreviewMixin, admin.ModelAdmin):
+    attachment_kind = 'sales'
+    list_display = ('date', 'invoice', 'amount', 'payment_mode', 'attachment_preview')
+    list_filter = ('payment_mode',)
+    date_hierarchy = 'date'
+    list_select_related = ('invoice__vendor',)
+    search_fields = ('invoice__invoice_number', 'invoice__vendor__name')
+    autocomplete_fields = ('invoice',)
+    readonly_fields = ('attachment_preview',)
+
+
+@admin.register(Expense)
+class ExpenseAdmin(admin.ModelAdmin):
+    list_display = ('date', 'paid_by', 'paid_to', 'amount', 'user')
+    list_select_related = ('user',)
+    search_fields = ('paid_by', 'paid_to', 'description')
+    autocomplete_fields = ('user',)
+    date_hierarchy = 'date'
+
+
+@admin.register(Damages)
+class DamagesAdmin(admin.ModelAdmin):
+    list_display = ('date', 'name', 'due_to', 'amount_loss', 'user')
+    list_select_related = ('user',)
+    search_fields = ('name', 'due_to', 'description')
+    autocomplete_fields = ('user',)
+    date_hierarchy = 'date'
+
+
+@admin.register(InvoiceBatchJob)
+class InvoiceBatchJobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'created_at', 'created_by', 'output_format', 'status', 'progress', 'download')
+    readonly_fields = ('created_at', 'updated_at', 'created_by', 'invoice_ids', 'output_format', 'hide_payments',
+                       'status', 'total', 'done', 'output', 'error')
+
+    def has_add_permission(self, request):
+        return False
+
+    # A job whose process died would otherwise show as pending or running for good
+    def changelist_view(self, request, extra_context=None):
+        expire_stale_jobs()
+        return super().changelist_view(request, extra_context)
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        expire_stale_jobs()
+        return super().change_view(request, object_id, form_url, extra_context)
+
+    @admin.display(description="Progress")
+    def progress(self, obj):
+        return f"{obj.done}/{obj.total}"
+
+    @admin.display(description="Output")
+    def download(self, obj):
+        if obj.output:
+            url = reverse('admin:Accounts_invoicebatchjob_download', args=[obj.pk])
+            return format_html('<a href="{}">Download</a>', url)
+        return "-"
+
+    def get_urls(self):
+        urls = [
+            path('<int:job_id>/download/', self.admin_site.admin_view(self.download_view),
+                 name='Accounts_invoicebatchjob_download'),
+        ]
+        return urls + super().get_urls()
+
+    def download_view(self, request, job_id):
+        job = get_object_or_404(InvoiceBatchJob, pk=job_id, status='done')
+        if not self.has_view_permission(request, job):
+            raise PermissionDenied
+        return FileResponse(job.output.open('rb'), as_attachment=True,
+                            filename=os.path.basename(job.output.name))
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    """The ledger is append-only: movements are listed, never added or changed here."""
+    list_display = ('date', 'product', 'kind', 'quantity', 'reference', 'created_at')
+    list_filter = ('kind', 'date')
+    search_fields = ('product__name', 'reference')
+    list_select_related = ('product',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 # Register models with the standard admin site only
-admin.site.register(Product)
 admin.site.register(Category)
-admin.site.register(PurchaseVendor)
-admin.site.register(PurchaseInvoice)
-admin.site.register(SalesInvoice)
-admin.site.register(Expense)
-admin.site.register(Damages)
 admin.site.register(Packaging_Invoice)
 # Add other models as needed
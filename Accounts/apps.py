@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Accounts'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401  (connects the signal handlers)
+        from .sqlite_profile import configure_connection
+
+        connection_created.connect(configure_connection, dispatch_uid='Accounts.sqlite_profile')
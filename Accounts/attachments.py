@@ -0,0 +1,186 @@
+"""
+Content-addressed storage for payment attachments.
+
+Payment and SalesPayment attachments are stored under the SHA-256 of their
+content, so the same UPI screenshot uploaded for several payments is kept
+once:
+
+    attachments/ab/ab12...ef.png          the upload
+    attachments/thumbs/ab/ab12...ef.webp  its thumbnail (images only)
+
+The thumbnail is made when the file is first stored, so admin pages show
+small WebP (or JPEG, if Pillow has no WebP support) previews instead of
+full-resolution phone screenshots. Files are written to a temporary file and
+renamed into place, so concurrent uploads of the same file are safe, and a
+stored file is never changed: downloads are served with the hash as ETag
+and with HTTP range support (ranged_file_response).
+
+`manage.py dedupe_attachments` moves uploads stored before this into the
+hashed layout.
+
+Settings:
+
+    ATTACHMENT_THUMBNAIL_SIZE  bounding box of the thumbnails (default 320x320)
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+
+ATTACHMENT_DIR = 'attachments'
+STREAM_CHUNK_SIZE = 64 * 1024
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _digest(name):
+    """The content hash of a stored attachment name."""
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+@lru_cache(maxsize=1)
+def thumbnail_format():
+    """(Pillow format, extension) of the thumbnails."""
+    # Pillow is imported on first use, like the PDF code (pdf.py)
+    from PIL import features
+
+    return ('WEBP', '.webp') if features.check('webp') else ('JPEG', '.jpg')
+
+
+def thumbnail_name(name):
+    digest = _digest(name)
+    return f"{ATTACHMENT_DIR}/thumbs/{digest[:2]}/{digest}{thumbnail_format()[1]}"
+
+
+class ContentHashStorage(FileSystemStorage):
+    """FileSystemStorage that names files by their SHA-256 and stores each content once."""
+
+    def get_available_name(self, name, max_length=None):
+        # The name is only a hint: _save() picks the real one
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        directory = os.path.join(self.location, ATTACHMENT_DIR)
+        os.makedirs(directory, exist_ok=True)
+        # Hash while copying to a temporary file: one pass over the upload
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+            digest = digest.hexdigest()
+            name = f"{ATTACHMENT_DIR}/{digest[:2]}/{digest}{extension}"
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if not self.exists(thumbnail_name(name)):
+            self.make_thumbnail(name)
+        return name
+
+    def make_thumbnail(self, name):
+        """Write the thumbnail of an image attachment; other files have none."""
+        from PIL import Image, ImageOps, UnidentifiedImageError
+
+        image_format = thumbnail_format()[0]
+        try:
+            with Image.open(self.path(name)) as image:
+                # Phone photos are stored sideways with an EXIF rotation
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail(getattr(settings, 'ATTACHMENT_THUMBNAIL_SIZE', (320, 320)))
+                if image_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGB')
+                buffer = BytesIO()
+                image.save(buffer, format=image_format, quality=80)
+        except (UnidentifiedImageError, OSError):
+            return None
+        path = self.path(thumbnail_name(name))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+        return thumbnail_name(name)
+
+
+_storage = ContentHashStorage()
+
+
+def attachment_storage():
+    """Storage of the payment attachment fields."""
+    return _storage
+
+
+def ranged_file_response(request, path, filename=None, etag=None):
+    """
+    A response with the file at `path`, honouring a single `Range: bytes=`
+    request with a streamed 206 Partial Content response.
+    """
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    size = os.path.getsize(path)
+    if etag and request.headers.get('If-None-Match') == f'"{etag}"':
+        response = HttpResponseNotModified()
+    else:
+        match = _RANGE.match(request.headers.get('Range', ''))
+        if match and any(match.groups()):
+            start, end = match.groups()
+            if start:
+                start, end = int(start), min(int(end), size - 1) if end else size - 1
+            else:
+                # "bytes=-500": the last 500 bytes
+                start, end = max(size - int(end), 0), size - 1
+            if start > end or start >= size:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+            response = StreamingHttpResponse(_read_range(path, start, end), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type, filename=filename)
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        # Stored files never change
+        response['ETag'] = f'"{etag}"'
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def attachment_response(request, field, thumbnail=False):
+    """The stored file (or its thumbnail) of a payment attachment field, or None."""
+    if not field:
+        return None
+    name = thumbnail_name(field.name) if thumbnail else field.name
+    if not field.storage.exists(name):
+        return None
+    return ranged_file_response(request, field.storage.path(name), filename=os.path.basename(field.name),
+                                etag=_digest(field.name) + ('-thumb' if thumbnail else ''))
@@ -0,0 +1,77 @@
+"""
+Set-based lot availability.
+
+Remaining kg of a lot = purchased kg (PurchaseProduct.quantity) minus the kg
+allocated to sales (SalesLot.quantity). Per (lot, product) the sold kg are the
+gross weights of the SalesProduct rows linked to that lot.
+
+Everything here is computed with grouped subqueries, so any number of lots
+costs one query instead of one aggregate per lot and product.
+"""
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import PurchaseInvoice, PurchaseProduct, SalesLot, SalesProduct
+
+KG = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _summed(queryset, group_by, field):
+    """Correlated subquery summing `field` of `queryset` rows grouped by `group_by`."""
+    subquery = queryset.order_by().values(group_by).annotate(total=Sum(field)).values('total')
+    return Coalesce(Subquery(subquery), Value(Decimal('0.00')), output_field=KG)
+
+
+def annotate_availability(queryset, exclude_sales_lots=()):
+    """
+    Annotate a PurchaseInvoice queryset with `purchased_kg`, `used_kg` and
+    `remaining_kg`. `exclude_sales_lots` leaves the given SalesLot ids out of
+    the used quantity (e.g. the row being edited).
+    """
+    used = SalesLot.objects.filter(purchase_invoice=OuterRef('pk'))
+    if exclude_sales_lots:
+        used = used.exclude(pk__in=exclude_sales_lots)
+    return queryset.annotate(
+        purchased_kg=_summed(
+            PurchaseProduct.objects.filter(invoice=OuterRef('pk')), 'invoice', 'quantity'
+        ),
+        used_kg=_summed(used, 'purchase_invoice', 'quantity'),
+    ).annotate(
+        remaining_kg=F('purchased_kg') - F('used_kg'),
+    )
+
+
+def _lot_ids(lots):
+    return [lot.pk if isinstance(lot, PurchaseInvoice) else lot for lot in lots]
+
+
+def get_lot_availability(lots, exclude_sales_lots=()):
+    """Return {lot_id: remaining kg} for the given lots (instances or ids) in one query."""
+    rows = annotate_availability(
+        PurchaseInvoice.objects.filter(pk__in=_lot_ids(lots)), exclude_sales_lots
+    ).values_list('pk', 'remaining_kg')
+    return {pk: remaining for pk, remaining in rows}
+
+
+def get_lot_product_availability(lots):
+    """
+    Return {(lot_id, product_id): remaining kg} for every product purchased in
+    the given lots, in one query.
+    """
+    sold = SalesProduct.objects.filter(
+        lot__purchase_invoice=OuterRef('invoice'), product=OuterRef('product')
+    )
+    rows = (
+        PurchaseProduct.objects.filter(invoice__in=_lot_ids(lots))
+        .order_by()
+        .values('invoice', 'product')
+        .annotate(purchased=Sum('quantity'))
+        .annotate(sold=_summed(sold, 'product', 'gross_weight'))
+        .values_list('invoice', 'product', 'purchased', 'sold')
+    )
+    return {
+        (lot_id, product_id): (purchased or Decimal('0.00')) - sold
+        for lot_id, product_id, purchased, sold in rows
+    }
@@ -0,0 +1,85 @@
+"""
+Versioned cache for the dashboard and home page figures.
+
+The figures are cached in Django's cache under the current data version, a
+Sequence row bumped (once per transaction, after it commits) whenever an
+invoice, line item, payment, expense, damage or product changes. A worker
+reads the version (one small query) and serves the figures from its cache
+until the next write, so this works with per-process backends like LocMemCache
+as well as the shared file backend: entries of older versions are never
+looked up again and simply expire.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .models import Sequence
+
+VERSION_SEQUENCE = 'dashboard_version'
+
+
+def data_version():
+    return Sequence.objects.filter(name=VERSION_SEQUENCE).values_list('value', flat=True).first() or 0
+
+
+def _bump_version():
+    if not Sequence.objects.filter(name=VERSION_SEQUENCE).update(value=F('value') + 1):
+        try:
+            with transaction.atomic():
+                Sequence.objects.create(name=VERSION_SEQUENCE, value=1)
+        except IntegrityError:
+            Sequence.objects.filter(name=VERSION_SEQUENCE).update(value=F('value') + 1)
+
+
+class _PendingBump:
+    """The version bump of the current transaction, run once however often it is registered."""
+
+    def __init__(self):
+        self.done = False
+
+    def __call__(self):
+        if not self.done:
+            self.done = True
+            _bump_version()
+
+
+def invalidate():
+    """Mark the cached figures stale once the current transaction commits."""
+    # One bump per transaction, however many rows it writes: the callbacks
+    # registered until the bump runs share it. A rolled back transaction
+    # never runs it, and the next one reuses it. Outside a transaction
+    # on_commit() runs it at once.
+    bump = getattr(connection, 'dashboard_pending_bump', None)
+    if bump is None or bump.done:
+        bump = connection.dashboard_pending_bump = _PendingBump()
+    transaction.on_commit(bump)
+
+
+def _key(name, version, key_parts):
+    return ':'.join(map(str, ('dashboard', name, version) + key_parts))
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 3600)
+
+
+def cached(name, build, *key_parts):
+    """The result of `build()`, cached under the current data version."""
+    key = _key(name, data_version(), key_parts)
+    figures = cache.get(key)
+    if figures is None:
+        figures = build()
+        cache.set(key, figures, _timeout())
+    return figures
+
+
+async def acached(name, build, *key_parts):
+    """cached() for async views: `build` is a coroutine function."""
+    key = _key(name, await sync_to_async(data_version)(), key_parts)
+    figures = await cache.aget(key)
+    if figures is None:
+        figures = await build()
+        await cache.aset(key, figures, _timeout())
+    return figures
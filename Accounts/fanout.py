@@ -0,0 +1,58 @@
+"""
+Run independent ORM queries at the same time from async views.
+
+Django's async ORM methods (acount(), aaggregate(), ...) all go through one
+thread per request, so they still run one after the other. gather_queries()
+instead hands each query to a small, bounded pool of worker threads, each with
+its own database connection, and awaits them together: a page of N
+independent queries takes about as long as its slowest query instead of the
+sum of all of them.
+
+Settings:
+
+    ASYNC_QUERY_WORKERS  worker threads per process (default 4), i.e. at most
+                         that many extra database connections
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'ASYNC_QUERY_WORKERS', 4), thread_name_prefix='query',
+            )
+        return _executor
+
+
+def _run_query(query):
+    # The worker keeps its connection between requests, like a request
+    # thread does: drop it once it is broken or older than CONN_MAX_AGE.
+    close_old_connections()
+    try:
+        return query()
+    finally:
+        close_old_connections()
+
+
+async def gather_queries(queries):
+    """Run the {name: callable} queries concurrently, return {name: result}."""
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    names = list(queries)
+    results = await asyncio.gather(*(
+        # The copied context carries the request stats (middleware.py)
+        loop.run_in_executor(executor, contextvars.copy_context().run, _run_query, queries[name])
+        for name in names
+    ))
+    return dict(zip(names, results))
@@ -0,0 +1,95 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+# (label, WSGI view, ASGI view)
+PAGES = [
+    ('dashboard', '/accounts/dashboard/', '/accounts/async/dashboard/'),
+    ('reports', '/accounts/reports/', '/accounts/async/reports/'),
+]
+
+
+def _summary(timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return f"median {statistics.median(timings):7.1f} ms, p95 {p95:7.1f} ms"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the latency of the sync (WSGI) dashboard and reports views with their async "
+        "(ASGI) versions, in process, against the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=30, help="Requests per client and page.")
+        parser.add_argument('--concurrency', type=int, default=1, help="Clients requesting at the same time.")
+        parser.add_argument('--username', help="User to log in as (default: the first superuser).")
+        parser.add_argument('--warm', action='store_true',
+                            help="Keep the dashboard cache between requests (default: cold, every query runs).")
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(username=options['username']) if options['username'] else \
+            User.objects.filter(is_superuser=True).order_by('pk')
+        user = users.first()
+        if user is None:
+            raise CommandError("No user to log in as, pass --username.")
+
+        concurrency = options['concurrency']
+        sync_clients = [Client() for _ in range(concurrency)]
+        async_clients = [AsyncClient() for _ in range(concurrency)]
+        for client in sync_clients + async_clients:
+            client.force_login(user)
+
+        self.stdout.write(f"{options['requests']} requests x {concurrency} clients, "
+                          f"{'warm' if options['warm'] else 'cold'} dashboard cache")
+        try:
+            # The test clients send "Host: testserver"
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for label, sync_url, async_url in PAGES:
+                    wsgi = self.run_wsgi(sync_clients, sync_url, options)
+                    asgi = asyncio.run(self.run_asgi(async_clients, async_url, options))
+                    self.stdout.write(f"  {label:<10} WSGI {_summary(wsgi)} | ASGI {_summary(asgi)}")
+        finally:
+            for client in sync_clients + async_clients:
+                client.logout()
+
+    def run_wsgi(self, clients, url, options):
+        def client_loop(client):
+            timings = []
+            for _ in range(options['requests']):
+                if not options['warm']:
+                    cache.clear()
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f"{url} returned {response.status_code}")
+            return timings
+
+        with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+            return [timing for timings in pool.map(client_loop, clients) for timing in timings]
+
+    async def run_asgi(self, clients, url, options):
+        async def client_loop(client):
+            timings = []
+            for _ in range(options['requests']):
+                if not options['warm']:
+                    await sync_to_async(cache.clear)()
+                start = time.perf_counter()
+                response = await client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f"{url} returned {response.status_code}")
+            return timings
+
+        results = await asyncio.gather(*(client_loop(client) for client in clients))
+        return [timing for timings in results for timing in timings]
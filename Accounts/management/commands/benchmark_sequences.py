@@ -0,0 +1,96 @@
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Models are imported inside the workers: spawned processes import this module
+# before Django is set up.
+
+
+def _allocate(name, count):
+    """Take `count` numbers from the series, return them in allocation order."""
+    from django.db import OperationalError, connection
+    from Accounts.sequences import next_value
+
+    values, errors = [], 0
+    try:
+        for _ in range(count):
+            try:
+                values.append(next_value(name))
+            except OperationalError:
+                # e.g. "database is locked" once the busy timeout runs out
+                errors += 1
+    finally:
+        connection.close()
+    return values, errors
+
+
+def _run_threads(name, threads, count):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(lambda _: _allocate(name, count), range(threads)))
+
+
+def _process_worker(args):
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    return _run_threads(*args)
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer the invoice/lot number allocator from many threads and processes "
+        "and check that the numbers are unique, gap-free and monotonic per worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--threads', type=int, default=4, help="Threads per process.")
+        parser.add_argument('--count', type=int, default=100, help="Numbers taken by each thread.")
+
+    def handle(self, *args, **options):
+        from django.db import connections
+        from Accounts.models import Sequence
+
+        processes, threads, count = options['processes'], options['threads'], options['count']
+        name = f"benchmark:{uuid.uuid4().hex[:12]}"
+        # Children must not share the parent's database connection
+        connections.close_all()
+
+        started = time.perf_counter()
+        try:
+            if processes > 1:
+                with multiprocessing.get_context('spawn').Pool(processes) as pool:
+                    results = [
+                        worker
+                        for process_results in pool.map(_process_worker, [(name, threads, count)] * processes)
+                        for worker in process_results
+                    ]
+            else:
+                results = _run_threads(name, threads, count)
+            elapsed = time.perf_counter() - started
+        finally:
+            Sequence.objects.filter(name=name).delete()
+
+        allocated = [value for values, _ in results for value in values]
+        errors = sum(worker_errors for _, worker_errors in results)
+        workers = len(results)
+
+        self.stdout.write(
+            f"{workers} workers ({processes} processes x {threads} threads) took {len(allocated)} numbers "
+            f"in {elapsed:.2f}s ({len(allocated) / elapsed:.0f}/s), {errors} failed attempts"
+        )
+
+        problems = []
+        if len(set(allocated)) != len(allocated):
+            problems.append(f"{len(allocated) - len(set(allocated))} duplicate numbers")
+        if sorted(allocated) != list(range(1, len(allocated) + 1)):
+            problems.append("the numbers are not a gap-free 1..N series")
+        if any(values != sorted(values) for values, _ in results):
+            problems.append("a worker received numbers out of order")
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("All numbers unique, gap-free and monotonic per worker."))
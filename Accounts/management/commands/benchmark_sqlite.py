@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Accounts.sqlite_profile import pragma_statements
+
+# The workers use the sqlite3 module directly on a scratch database, so the
+# numbers show SQLite's locking, not Django overhead.
+
+SCHEMA = """
+CREATE TABLE invoice (id INTEGER PRIMARY KEY, date TEXT NOT NULL, customer_id INTEGER NOT NULL,
+                      net_total REAL NOT NULL);
+CREATE INDEX invoice_date ON invoice (date);
+CREATE TABLE summary (date TEXT PRIMARY KEY, total REAL NOT NULL, count INTEGER NOT NULL);
+"""
+FIRST_DAY = date(2025, 1, 1)
+DAYS = 120
+
+
+def _connect(path, pragmas, timeout):
+    db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    for statement in pragma_statements(pragmas):
+        db.execute(statement)
+    return db
+
+
+def _write(db, rng):
+    # Like an invoice save: insert the row and post it to the daily summary
+    day = (FIRST_DAY + timedelta(days=rng.randrange(DAYS))).isoformat()
+    total = rng.randrange(1000, 50000)
+    db.execute("BEGIN")
+    try:
+        db.execute("INSERT INTO invoice (date, customer_id, net_total) VALUES (?, ?, ?)",
+                   (day, rng.randrange(200), total))
+        db.execute("INSERT INTO summary (date, total, count) VALUES (?, ?, 1) ON CONFLICT (date) "
+                   "DO UPDATE SET total = total + excluded.total, count = count + 1", (day, total))
+        db.execute("COMMIT")
+    except sqlite3.OperationalError:
+        if db.in_transaction:
+            db.execute("ROLLBACK")
+        raise
+
+
+def _read(db, rng):
+    # Like a report: a month of invoices
+    start = FIRST_DAY + timedelta(days=rng.randrange(DAYS - 30))
+    db.execute("SELECT COUNT(*), SUM(net_total) FROM invoice WHERE date BETWEEN ? AND ?",
+               (start.isoformat(), (start + timedelta(days=30)).isoformat())).fetchone()
+
+
+def _worker(args):
+    path, pragmas, timeout, role, seconds, seed = args
+    rng = random.Random(seed)
+    db = _connect(path, pragmas, timeout)
+    operation = _write if role == 'writer' else _read
+    done, errors, longest = 0, 0, 0.0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            operation(db, rng)
+            done += 1
+        except sqlite3.OperationalError:
+            # "database is locked"
+            errors += 1
+        longest = max(longest, time.perf_counter() - start)
+    db.close()
+    return role, done, errors, longest
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare SQLite's default settings with settings.SQLITE_PRAGMAS under concurrent "
+        "reader and writer processes (on a scratch database)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help="Writer processes.")
+        parser.add_argument('--readers', type=int, default=4, help="Reader processes.")
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--rows', type=int, default=50000, help="Invoices in the database before the run.")
+        parser.add_argument('--timeout', type=float, default=5,
+                            help="Busy timeout of the default run, in seconds (Python's default is 5).")
+
+    def handle(self, *args, **options):
+        profiles = [('SQLite defaults', {}), ('SQLITE_PRAGMAS', settings.SQLITE_PRAGMAS)]
+        for label, pragmas in profiles:
+            # A fresh file each run: journal_mode=WAL sticks to the database file
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'benchmark.sqlite3')
+                self.seed(path, pragmas, options['rows'])
+                results = self.run(path, pragmas, options)
+            self.report(label, pragmas, results, options['seconds'])
+
+    def seed(self, path, pragmas, rows):
+        db = _connect(path, pragmas, 5)
+        db.executescript(SCHEMA)
+        rng = random.Random(0)
+        db.execute("BEGIN")
+        db.executemany("INSERT INTO invoice (date, customer_id, net_total) VALUES (?, ?, ?)", (
+            ((FIRST_DAY + timedelta(days=rng.randrange(DAYS))).isoformat(), rng.randrange(200),
+             rng.randrange(1000, 50000))
+            for _ in range(rows)
+        ))
+        db.execute("COMMIT")
+        db.close()
+
+    def run(self, path, pragmas, options):
+        timeout = options['timeout']
+        jobs = (
+            [(path, pragmas, timeout, 'writer', options['seconds'], seed) for seed in range(options['writers'])]
+            + [(path, pragmas, timeout, 'reader', options['seconds'], 1000 + seed)
+               for seed in range(options['readers'])]
+        )
+        with multiprocessing.get_context('spawn').Pool(len(jobs)) as pool:
+            return pool.map(_worker, jobs)
+
+    def report(self, label, pragmas, results, seconds):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{label}: {pragmas or 'no pragmas'}"))
+        for role in ('writer', 'reader'):
+            rows = [row for row in results if row[0] == role]
+            if not rows:
+                continue
+            done = sum(row[1] for row in rows)
+            errors = sum(row[2] for row in rows)
+            longest = max(row[3] for row in rows)
+            self.stdout.write(
+                f"  {len(rows)} {role}s: {done / seconds:,.0f} ops/s, {errors} 'database is locked' errors, "
+                f"longest operation {longest * 1000:.0f} ms"
+            )
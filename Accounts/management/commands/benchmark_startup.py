@@ -0,0 +1,74 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Each scenario runs in a fresh interpreter, like a new gunicorn worker or a
+# manage.py invocation.
+BOOT = (
+    "from django.core.wsgi import get_wsgi_application\n"
+    "application = get_wsgi_application()\n"
+    # Workers import the URLconf, and with it the views, on the first request
+    "from django.urls import get_resolver\n"
+    "get_resolver().url_patterns\n"
+)
+CHECK = (
+    "import django\n"
+    "django.setup()\n"
+    "from django.core.management import call_command\n"
+    "call_command('check', verbosity=0)\n"
+)
+# What the views used to do at import time
+EAGER_PDF = (
+    "import django\n"
+    "django.setup()\n"
+    "from Accounts import pdf\n"
+    "pdf.ensure_fonts()\n"
+    "pdf.get_styles()\n"
+)
+LOADED = (
+    "import sys\n"
+    "print('reportlab' in sys.modules)\n"
+)
+
+SCENARIOS = [
+    ('worker boot', BOOT),
+    ('manage.py check', CHECK),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time worker boot and `manage.py check` in fresh processes, with the PDF code loaded "
+        "on first use (as now) and at import time (as before)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Processes per scenario.")
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'Mango_project.settings'))
+        for label, code in SCENARIOS:
+            lazy, loaded = self.run(code + LOADED, env, options['runs'])
+            eager, _ = self.run(EAGER_PDF + code, env, options['runs'])
+            self.stdout.write(
+                f"  {label:<16} on first use {lazy:6.0f} ms | at import {eager:6.0f} ms | "
+                f"saved {eager - lazy:5.0f} ms ({'reportlab still imported' if loaded else 'reportlab not imported'})"
+            )
+
+    def run(self, code, env, runs):
+        """Median wall time in ms of `runs` interpreters running `code`, and its last output line."""
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env,
+                                    capture_output=True, text=True)
+            timings.append((time.perf_counter() - start) * 1000)
+            if result.returncode:
+                raise CommandError(result.stderr.strip().splitlines()[-1])
+        output = result.stdout.strip().splitlines()
+        return statistics.median(timings), bool(output) and output[-1] == 'True'
@@ -0,0 +1,266 @@
+import json
+import math
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.test import Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+
+from Accounts import views
+from Accounts.models import (
+    Customer, Damages, Expense, Payment, Product, PurchaseInvoice, PurchaseProduct, PurchaseVendor, SalesInvoice,
+    SalesLot, SalesPayment, SalesProduct, StockMovement,
+)
+from Accounts.synthetic import SCALES
+
+# The suite runs each scale in its own database: manage.py migrate, then
+# generate_data, then this command again with --measure, each in a fresh
+# process pointed at a scratch database through DB_NAME (see settings.py).
+ROW_MODELS = [
+    Customer, Damages, Expense, Payment, Product, PurchaseInvoice, PurchaseProduct, PurchaseVendor, SalesInvoice,
+    SalesLot, SalesPayment, SalesProduct, StockMovement,
+]
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _spread(queryset, count, what):
+    """
+    Iterator over `count` pks spread over the queryset (ordered by pk), one per
+    run of a case; CommandError if there are fewer.
+    """
+    step = max(1, queryset.count() // count)
+    pks = list(queryset.order_by('pk').values_list('pk', flat=True)[::step][:count])
+    if len(pks) < count:
+        raise CommandError(f"{count} {what} needed (one per run), found {len(pks)}: generate more data or "
+                           f"lower --runs.")
+    return iter(pks)
+
+
+class Cases:
+    """The measured operations, each a callable returning the response (if any)."""
+    PAYMENT = Decimal('100')
+
+    def __init__(self, user, runs):
+        self.user = user
+        self.client = Client()
+        self.client.force_login(user)
+        self.factory = RequestFactory()
+        season = SalesInvoice.objects.aggregate(first=Min('date'), last=Max('date'))
+        self.period = {'start_date': season['first'].isoformat(), 'end_date': season['last'].isoformat()}
+        self.week = {'start_date': season['first'].isoformat(),
+                     'end_date': (season['first'] + timedelta(days=6)).isoformat()}
+        vendor = PurchaseInvoice.objects.values('vendor_id').order_by('vendor_id').first()
+        self.vendor = {'vendor_id': vendor['vendor_id'], 'year': season['first'].year}
+        # A different invoice per run (and the warm-up run), so every PDF is
+        # rendered, not served from the cache, and every payment is a first one
+        self.sales_invoices = _spread(SalesInvoice.objects.all(), runs + 1, "sales invoices")
+        self.purchase_invoices = _spread(PurchaseInvoice.objects.all(), runs + 1, "purchase invoices")
+        self.unpaid_invoices = _spread(
+            SalesInvoice.objects.filter(paid_amount=0, net_total__gte=self.PAYMENT), runs + 1,
+            f"unpaid sales invoices of at least {self.PAYMENT}",
+        )
+        self.lot = PurchaseInvoice.objects.order_by('-date', '-pk').first()
+        self.customer_id = Customer.objects.values_list('pk', flat=True).first()
+        self.products = list(Product.objects.values_list('pk', flat=True)[:4])
+        # Prefixes of vehicle numbers, invoice numbers and names
+        terms = ['KA1', 'KA07', 'SA2025', 'MS2025R1', 'Farm 1', 'Customer 2', 'Alphonso']
+        self.search_terms = iter(terms * (runs // len(terms) + 1))
+
+    def all(self):
+        return [
+            # Cold: the figures are rebuilt, as after any write
+            ('dashboard', self.dashboard),
+            ('reports', lambda: self.client.get(reverse('reports'), self.period)),
+            ('sales', lambda: self.client.get(reverse('sales'))),
+            ('vendor_summary', self.vendor_summary),
+            ('search', lambda: self.client.get(reverse('search'), {'q': next(self.search_terms)})),
+            ('sales_invoice_pdf', lambda: self.client.get(
+                reverse('generate_sales_invoice_pdf', args=[next(self.sales_invoices)]))),
+            ('purchase_invoice_pdf', lambda: self.client.get(
+                reverse('generate_invoice_pdf', args=[next(self.purchase_invoices)]))),
+            ('expense_vouchers_pdf', lambda: self.client.get(reverse('vouchers_pdf', args=['expense']), self.week)),
+            ('save_sales_invoice', self.rolled_back(self.save_sales_invoice)),
+            ('save_sales_payment', self.rolled_back(self.save_sales_payment)),
+            ('save_purchase_invoice', self.rolled_back(self.save_purchase_invoice)),
+        ]
+
+    def dashboard(self):
+        cache.clear()
+        return self.client.get(reverse('dashboard'))
+
+    def vendor_summary(self):
+        # Not routed: called directly
+        request = self.factory.get('/vendor-summary/', self.vendor)
+        request.user = self.user
+        return views.vendor_summary(request)
+
+    def rolled_back(self, operation):
+        def run():
+            with transaction.atomic():
+                operation()
+                transaction.set_rollback(True)
+        return run
+
+    def save_sales_invoice(self):
+        invoice = SalesInvoice.objects.create(vendor_id=self.customer_id, no_of_crates=40,
+                                              cost_per_crate=Decimal('20'))
+        lot = SalesLot.objects.create(sales_invoice=invoice, purchase_invoice=self.lot, quantity=Decimal('40'))
+        for product_id in self.products:
+            SalesProduct.objects.create(invoice=invoice, product_id=product_id, lot=lot, gross_weight=Decimal('10'),
+                                        price=Decimal('60'))
+
+    def save_sales_payment(self):
+        SalesPayment.objects.create(invoice_id=next(self.unpaid_invoices), amount=self.PAYMENT, payment_mode='cash')
+
+    def save_purchase_invoice(self):
+        vendor_id = PurchaseVendor.objects.values_list('pk', flat=True).first()
+        invoice = PurchaseInvoice.objects.create(vendor_id=vendor_id)
+        for product_id in self.products[:2]:
+            PurchaseProduct.objects.create(invoice=invoice, product_id=product_id, quantity=Decimal('500'),
+                                           price=Decimal('40'))
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the main pages, PDF views and model saves against synthetic databases of each scale "
+        "and write the results as JSON (median, p95 and min ms, and queries per case)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', nargs='+', choices=list(SCALES), default=['small'],
+                            help="Scales to run: " + ", ".join(f"{name} ({lines:,} lines)"
+                                                               for name, lines in SCALES.items()))
+        parser.add_argument('--runs', type=int, default=5, help="Timed runs per case, after one warm-up run.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the results to this JSON file (default: stdout).")
+        parser.add_argument('--compare', help="A previous results file to print the changes against.")
+        # Internal: measure the current database and print the results
+        parser.add_argument('--measure', action='store_true', help="Measure the configured database only.")
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError("--runs must be positive.")
+        if options['measure']:
+            self.stdout.write(json.dumps(self.measure(options['runs'])))
+            return
+
+        results = {
+            'meta': {
+                'commit': _git_commit(),
+                'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'runs': options['runs'],
+                'seed': options['seed'],
+            },
+            'scales': {},
+        }
+        for scale in options['scale']:
+            results['scales'][scale] = self.run_scale(scale, options)
+
+        output = json.dumps(results, indent=2, sort_keys=True) + '\n'
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+            self.stderr.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        else:
+            self.stdout.write(output, ending='')
+        if options['compare']:
+            with open(options['compare']) as file:
+                self.compare(json.load(file), results)
+
+    def run_scale(self, scale, options):
+        lines = SCALES[scale]
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, DB_NAME=os.path.join(directory, 'db.sqlite3'))
+            # A per-process cache, so every run starts cold
+            env.pop('CACHE_DIR', None)
+            self.manage(env, 'migrate', '--noinput', '-v0')
+            self.stderr.write(f"{scale}: generating {lines:,} sales line items")
+            start = time.perf_counter()
+            self.manage(env, 'generate_data', f'--lines={lines}', f"--seed={options['seed']}")
+            generate_seconds = time.perf_counter() - start
+            self.stderr.write(f"{scale}: measuring")
+            measured = json.loads(self.manage(env, 'benchmark_suite', '--measure', f"--runs={options['runs']}"))
+        return dict(measured, lines=lines, generate_seconds=round(generate_seconds, 1))
+
+    def manage(self, env, *arguments):
+        result = subprocess.run([sys.executable, 'manage.py', *arguments], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f"manage.py {arguments[0]} failed:\n{result.stderr.strip()}")
+        return result.stdout
+
+    def measure(self, runs):
+        setup_test_environment()
+        user = User.objects.filter(is_superuser=True).order_by('pk').first()
+        if user is None:
+            raise CommandError("No superuser: run manage.py generate_data first.")
+        results = {'rows': {model.__name__: model.objects.count() for model in ROW_MODELS}, 'cases': {}}
+        with tempfile.TemporaryDirectory() as pdf_cache, override_settings(PDF_CACHE_ROOT=pdf_cache):
+            cases = Cases(user, runs)
+            for name, operation in cases.all():
+                timings, queries = [], []
+                for run in range(runs + 1):
+                    with CaptureQueriesContext(connection) as captured:
+                        start = time.perf_counter()
+                        response = operation()
+                        elapsed = (time.perf_counter() - start) * 1000
+                    if response is not None and response.status_code != 200:
+                        raise CommandError(f"{name}: HTTP {response.status_code}")
+                    if run:
+                        timings.append(elapsed)
+                        queries.append(len(captured))
+                results['cases'][name] = {
+                    'median_ms': round(statistics.median(timings), 2),
+                    'p95_ms': round(_percentile(timings, 95), 2),
+                    'min_ms': round(min(timings), 2),
+                    'queries': round(statistics.median(queries)),
+                }
+        return results
+
+    def compare(self, baseline, results):
+        self.stderr.write(f"Against {baseline['meta'].get('commit') or 'baseline'}:")
+        for scale, measured in results['scales'].items():
+            before = baseline.get('scales', {}).get(scale)
+            if not before:
+                continue
+            self.stderr.write(f"  {scale}")
+            for name, case in measured['cases'].items():
+                old = before['cases'].get(name)
+                if not old:
+                    continue
+                change = (case['median_ms'] - old['median_ms']) / old['median_ms'] * 100 if old['median_ms'] else 0
+                self.stderr.write(
+                    f"    {name:<24} {old['median_ms']:9.1f} -> {case['median_ms']:9.1f} ms ({change:+6.1f}%)"
+                    f"   queries {old['queries']:>4} -> {case['queries']:<4}"
+                )
@@ -0,0 +1,93 @@
+import os
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import find
+from django.core.management.base import BaseCommand, CommandError
+from reportlab import rl_config
+
+from Accounts.models import Damages, Expense
+from Accounts.pdf import get_base64_image, render_to_pdf
+from Accounts.vouchers import VOUCHERS, render_voucher, render_voucher_html, render_vouchers
+
+# Unsaved vouchers: rendering needs no database rows
+
+
+def _sample(kind, index):
+    day = date(2025, 1, 1) + timedelta(days=index % 365)
+    if kind == 'expense':
+        return Expense(pk=index + 1, date=day, paid_by="Office", paid_to=f"Transport {index}",
+                       amount=Decimal('1250.00') + index, description="Diesel and toll for the Hosur trip.")
+    return Damages(pk=index + 1, date=day, name=f"Lot {index}", due_to="Rain",
+                   amount_loss=Decimal('830.50') + index, description="Crates soaked on the loading bay.")
+
+
+def _render_uncached(kind, voucher):
+    """The voucher as it was rendered before: static lookups and the full-size logo per request."""
+    # ...and ASCII85 encoded images, ReportLab's default (see pdf.py)
+    use_a85, rl_config.useA85 = rl_config.useA85, 1
+    try:
+        return _render_html(kind, voucher)
+    finally:
+        rl_config.useA85 = use_a85
+
+
+def _render_html(kind, voucher):
+    font_normal = find('NotoSans.ttf')
+    font_bold = find('NotoSans-Bold.ttf')
+    logo_file_path = find('LOGO.png') or os.path.join(settings.STATIC_ROOT, 'LOGO.png')
+    context = {
+        kind: voucher,
+        'logo_path': get_base64_image(logo_file_path),
+        'noto_sans_path': f"file://{font_normal}" if font_normal else '',
+        'noto_sans_bold_path': f"file://{font_bold}" if font_bold else '',
+    }
+    return render_to_pdf(VOUCHERS[kind]['template'], context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the time to render an expense or damage voucher through the xhtml2pdf "
+        "templates with the ReportLab layout, one at a time and in bulk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(VOUCHERS), default='expense')
+        parser.add_argument('--count', type=int, default=20, help="Vouchers per renderer.")
+
+    def handle(self, *args, **options):
+        kind, count = options['kind'], options['count']
+        vouchers = [_sample(kind, index) for index in range(count)]
+        renderers = [
+            ('xhtml2pdf, lookups per request', lambda voucher: _render_uncached(kind, voucher)),
+            ('xhtml2pdf, cached assets', lambda voucher: render_voucher_html(kind, voucher)),
+            ('ReportLab', lambda voucher: render_voucher(kind, voucher)),
+        ]
+        self.stdout.write(f"{count} {kind} vouchers, first-use loading excluded")
+        baseline = None
+        for label, render in renderers:
+            # Warm up: fonts, styles, logo and templates
+            self.check_pdf(render(vouchers[0]))
+            timings = []
+            for voucher in vouchers:
+                start = time.perf_counter()
+                render(voucher)
+                timings.append((time.perf_counter() - start) * 1000)
+            baseline = self.report(label, statistics.median(timings), baseline)
+
+        start = time.perf_counter()
+        self.check_pdf(render_vouchers(kind, vouchers))
+        self.report('ReportLab, bulk', (time.perf_counter() - start) * 1000 / count, baseline)
+
+    def check_pdf(self, result):
+        content = getattr(result, 'content', result)
+        if not content.startswith(b'%PDF'):
+            raise CommandError(f"Rendering failed: {content[:200]!r}")
+
+    def report(self, label, per_voucher, baseline):
+        speedup = f" ({baseline / per_voucher:.1f}x)" if baseline else ""
+        self.stdout.write(f"  {label:<32} {per_voucher:8.1f} ms per voucher{speedup}")
+        return baseline or per_voucher
@@ -0,0 +1,50 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Accounts.attachments import ATTACHMENT_DIR
+from Accounts.models import Payment, SalesPayment
+
+
+class Command(BaseCommand):
+    help = (
+        "Move payment attachments uploaded before the content-hashed storage into it: "
+        "identical files are stored once and get a thumbnail."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-originals', action='store_true',
+                            help="Leave the old files in place (default: delete them once moved).")
+
+    def handle(self, *args, **options):
+        moved, missing, originals = 0, 0, set()
+        for model in (Payment, SalesPayment):
+            payments = model.objects.exclude(attachment='').exclude(attachment__isnull=True) \
+                .exclude(attachment__startswith=f'{ATTACHMENT_DIR}/').only('attachment')
+            with transaction.atomic():
+                changed = []
+                for payment in payments.iterator():
+                    field = payment.attachment
+                    if not field.storage.exists(field.name):
+                        self.stderr.write(f"{model.__name__} {payment.pk}: {field.name} is missing")
+                        missing += 1
+                        continue
+                    with field.storage.open(field.name, 'rb') as original:
+                        originals.add(field.name)
+                        # Stored under its content hash, once per content
+                        payment.attachment = field.storage.save(field.name, File(original))
+                    changed.append(payment)
+                # Not save(): that would re-run the payment validation and signals
+                model.objects.bulk_update(changed, ['attachment'], batch_size=500)
+            moved += len(changed)
+
+        stored = {name for model in (Payment, SalesPayment)
+                  for name in model.objects.exclude(attachment='').exclude(attachment__isnull=True)
+                  .values_list('attachment', flat=True)}
+        if not options['keep_originals']:
+            storage = Payment._meta.get_field('attachment').storage
+            for name in originals - stored:
+                storage.delete(name)
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} attachments, {len(stored)} distinct files in use ({missing} missing)."
+        ))
@@ -0,0 +1,41 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Accounts.synthetic import SCALES, generate
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic mango season for benchmarks: vendors, lots, customers, "
+        "sales invoices, payments, expenses and damages, written in bulk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(SCALES), default='small',
+                            help="Sales line items: " + ", ".join(f"{name} {lines:,}" for name, lines in SCALES.items()))
+        parser.add_argument('--lines', type=int, help="Sales line items, instead of --scale.")
+        parser.add_argument('--seed', type=int, default=0, help="Same seed, same data.")
+        parser.add_argument('--start', type=date.fromisoformat, default=date(2025, 3, 1),
+                            help="First day of the season (YYYY-MM-DD).")
+        parser.add_argument('--days', type=int, default=120, help="Length of the season.")
+
+    def handle(self, *args, **options):
+        lines = options['lines'] or SCALES[options['scale']]
+        if lines < 1 or options['days'] < 1:
+            raise CommandError("--lines and --days must be positive.")
+        verbosity = options['verbosity']
+
+        def progress(stage, done, total):
+            if verbosity > 1:
+                self.stdout.write(f"  {stage}: {done:,}/{total:,}")
+
+        start = time.perf_counter()
+        added = generate(lines, seed=options['seed'], start=options['start'], days=options['days'],
+                         progress=progress)
+        seconds = time.perf_counter() - start
+        for model, count in sorted(added.items()):
+            self.stdout.write(f"  {model:<16} {count:>10,}")
+        self.stdout.write(self.style.SUCCESS(f"Generated {added.get('SalesProduct', 0):,} sales line items "
+                                             f"in {seconds:.1f} s."))
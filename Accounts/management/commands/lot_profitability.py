@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Accounts.profitability import numpy, season_report
+
+
+class Command(BaseCommand):
+    help = "Print each lot's cost, kg sold, attributed revenue, damage/rotten loss and margin, with the totals."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help="First lot date (YYYY-MM-DD), default: all.")
+        parser.add_argument('--end-date', help="Last lot date (YYYY-MM-DD), default: all.")
+        parser.add_argument('--worst', type=int, help="Only the N lots with the lowest margin.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        lots, totals = season_report(options['start_date'], options['end_date'])
+        seconds = time.perf_counter() - start
+        if options['worst']:
+            lots = sorted(lots, key=lambda figures: figures['margin'])[:options['worst']]
+
+        self.stdout.write(f"{'Lot':<12} {'Date':<10} {'Vendor':<20} {'Sold kg':>10} {'Loss kg':>9} "
+                          f"{'Cost':>13} {'Revenue':>13} {'Margin':>13} {'%':>7}")
+        for figures in [*lots, dict(totals, lot_number="Total", date='', vendor='')]:
+            percent = figures['margin_percent']
+            self.stdout.write(
+                f"{figures['lot_number']:<12} {str(figures['date']):<10} {figures['vendor'][:20]:<20} "
+                f"{figures['sold_kg']:>10,} {figures['loss_kg']:>9,} {figures['cost']:>13,} "
+                f"{figures['revenue']:>13,} {figures['margin']:>13,} {'' if percent is None else percent:>7}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(lots):,} lots in {seconds:.2f} s ({'NumPy' if numpy is not None else 'Python'} allocation)."
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from Accounts.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales/purchase rollup tables from the raw invoices, expenses and damages."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help="First day to rebuild (YYYY-MM-DD), default: all.")
+        parser.add_argument('--end-date', help="Last day to rebuild (YYYY-MM-DD), default: all.")
+
+    def handle(self, *args, **options):
+        days, products, customers = rebuild_rollups(options['start_date'], options['end_date'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {days} daily summaries, {products} product rows and {customers} customer rows."
+        ))
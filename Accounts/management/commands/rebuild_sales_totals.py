@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from Accounts import dashboard_cache
+from Accounts.models import SalesInvoice, SalesProduct, SalesPayment
+
+
+def _summed(model, field):
+    subquery = (
+        model.objects.filter(invoice=OuterRef('pk'))
+        .order_by()
+        .values('invoice')
+        .annotate(total=Sum(field))
+        .values('total')
+    )
+    return Coalesce(Subquery(subquery), Value(0), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or verify with --verify) the stored SalesInvoice totals from line items and payments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only report mismatches, exit with an error if any are found.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        verify = options['verify']
+        batch_size = options['batch_size']
+
+        invoices = SalesInvoice.objects.only('pk', 'invoice_number', *SalesInvoice.TOTAL_FIELDS).annotate(
+            expected_net_total=_summed(SalesProduct, 'total'),
+            expected_total_gross_weight=_summed(SalesProduct, 'gross_weight'),
+            expected_paid_amount=_summed(SalesPayment, 'amount'),
+        ).order_by('pk')
+
+        checked = 0
+        stale = []
+        for invoice in invoices.iterator(chunk_size=batch_size):
+            checked += 1
+            changed = False
+            for field in SalesInvoice.TOTAL_FIELDS:
+                expected = getattr(invoice, f'expected_{field}')
+                if getattr(invoice, field) != expected:
+                    if verify:
+                        self.stdout.write(
+                            f"{invoice.invoice_number}: {field} is {getattr(invoice, field)}, expected {expected}"
+                        )
+                    setattr(invoice, field, expected)
+                    changed = True
+            if changed:
+                stale.append(invoice)
+
+        if verify:
+            if stale:
+                raise CommandError(f"{len(stale)} of {checked} sales invoices have stale totals.")
+            self.stdout.write(self.style.SUCCESS(f"All {checked} sales invoices have correct totals."))
+            return
+
+        with transaction.atomic():
+            SalesInvoice.objects.bulk_update(stale, SalesInvoice.TOTAL_FIELDS, batch_size=batch_size)
+            # The totals appear on the invoice PDF, so drop the cached copies
+            SalesInvoice.objects.filter(pk__in=[invoice.pk for invoice in stale]).update(version=F('version') + 1)
+            dashboard_cache.invalidate()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt totals for {len(stale)} of {checked} sales invoices."))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Accounts.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the global search index (sales and purchase invoices, customers, vendors and products), "
+        "e.g. after bulk imports."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count:,} objects in {time.perf_counter() - start:.1f} s."))
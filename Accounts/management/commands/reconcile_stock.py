@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Accounts.stock import reconcile_stock, stock_mismatches
+
+
+class Command(BaseCommand):
+    help = "Check Product.current_stock against the stock movement ledger and rebuild it from the ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only report mismatches (exits with an error if there are any).")
+
+    def handle(self, *args, **options):
+        mismatches = stock_mismatches()
+        for product, current, ledger in mismatches:
+            self.stdout.write(f"{product.name}: current stock {current}, ledger {ledger}")
+        if options['verify']:
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} products do not match the stock ledger.")
+            self.stdout.write(self.style.SUCCESS("Stock matches the ledger."))
+            return
+        reconcile_stock()
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {len(mismatches)} products with the stock ledger."))
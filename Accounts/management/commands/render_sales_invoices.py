@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Accounts.models import Customer, InvoiceBatchJob, SalesInvoice
+from Accounts.pdf_batch import render_invoice_batch, run_batch_job
+
+
+class Command(BaseCommand):
+    help = "Render many sales invoices in a process pool into one merged PDF or a ZIP file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help="First invoice date (YYYY-MM-DD).")
+        parser.add_argument('--end-date', help="Last invoice date (YYYY-MM-DD).")
+        parser.add_argument('--customer', help="Customer id or exact name.")
+        parser.add_argument('--format', choices=['pdf', 'zip'], default='pdf')
+        parser.add_argument('--output', help="Output file (default: sales_invoices.pdf / .zip).")
+        parser.add_argument('--hide-payments', action='store_true')
+        parser.add_argument('--workers', type=int, help="Worker processes (default: CPU count, max 8).")
+        parser.add_argument('--job', type=int, help="Run a queued InvoiceBatchJob (used by the admin action).")
+
+    def handle(self, *args, **options):
+        if options['job']:
+            try:
+                job = InvoiceBatchJob.objects.get(pk=options['job'])
+            except InvoiceBatchJob.DoesNotExist:
+                raise CommandError(f"Print job {options['job']} does not exist.")
+            run_batch_job(job, workers=options['workers'])
+            return
+
+        invoices = SalesInvoice.objects.order_by('-date', '-id')
+        if options['start_date']:
+            invoices = invoices.filter(date__gte=options['start_date'])
+        if options['end_date']:
+            invoices = invoices.filter(date__lte=options['end_date'])
+        if options['customer']:
+            customer = options['customer']
+            customers = Customer.objects.filter(pk=customer) if customer.isdigit() else Customer.objects.filter(name=customer)
+            if not customers.exists():
+                raise CommandError(f"Customer {customer!r} not found.")
+            invoices = invoices.filter(vendor__in=customers)
+
+        invoice_ids = list(invoices.values_list('pk', flat=True))
+        if not invoice_ids:
+            raise CommandError("No sales invoices match the given filters.")
+
+        output = options['output'] or f"sales_invoices.{options['format']}"
+
+        def progress(done, total):
+            self.stdout.write(f"\r[{done}/{total}] invoices rendered", ending='')
+            self.stdout.flush()
+
+        render_invoice_batch(
+            invoice_ids,
+            output,
+            output_format=options['format'],
+            hide_payments=options['hide_payments'],
+            workers=options['workers'],
+            progress=progress,
+        )
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(invoice_ids)} invoices to {output}"))
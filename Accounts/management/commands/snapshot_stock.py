@@ -0,0 +1,20 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Accounts.stock import take_snapshot
+
+
+class Command(BaseCommand):
+    help = "Snapshot the stock of every product at the end of a day (run daily, after midnight)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Day to snapshot (YYYY-MM-DD), default: yesterday.")
+
+    def handle(self, *args, **options):
+        try:
+            day = date.fromisoformat(options['date']) if options['date'] else None
+            count = take_snapshot(day)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Snapshotted the stock of {count} products."))
@@ -0,0 +1,231 @@
+"""
+Per-request query count and latency instrumentation.
+
+RequestStatsMiddleware times every request and records, per view:
+the number of SQL queries, the time spent in the database, the time spent
+rendering templates (including queries run lazily from the template) and the
+total latency. Slow requests are logged with their most repeated SQL, and the
+per-view aggregates are shown on the staff-only request stats page
+(views.request_stats_view). The request's own figures go out in a
+Server-Timing header, only when DEBUG is on or to staff users, since they
+tell how long the queries behind a page take.
+
+Queries are recorded by a wrapper installed once on every database
+connection, which looks up the request in a context variable. So queries
+run on other threads (sync views under ASGI, the worker threads of the async
+views in fanout.py) count towards the request that started them. Template
+time is measured by wrapping the Django backend's Template.render once per
+process; outside a request the wrapper only calls through. Requests that
+match no URL are recorded together under UNRESOLVED.
+
+The aggregates live in memory, so each server process keeps its own and they
+reset on restart. Settings:
+
+    REQUEST_STATS_SLOW_MS       log requests slower than this (default 500)
+    REQUEST_STATS_SLOW_QUERIES  log requests with more queries (default 50)
+
+Either can be None to turn that check off (the test settings do both).
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template as DjangoTemplate
+
+logger = logging.getLogger('Accounts.request_stats')
+
+_current = ContextVar('request_stats', default=None)
+_lock = threading.Lock()
+_view_stats = {}
+_slow_requests = deque(maxlen=25)
+# One row for every request no URL pattern matched (404s, scanners), not one per path
+UNRESOLVED = '<unresolved>'
+
+# Collapse IN (...) lists so "same query, different ids" count as one
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class RequestStats:
+    """Figures for the request being handled."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.sql = Counter()
+        # Async views run queries on several threads at once
+        self._lock = threading.Lock()
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.db_time += elapsed
+                self.queries += 1
+                self.sql[_IN_LIST.sub('IN (...)', sql)] += 1
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats.record_query(execute, sql, params, many, context)
+
+
+def _instrument_connection(sender=None, connection=None, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _instrument_queries():
+    # Connections are per thread: new ones are instrumented as they connect
+    connection_created.connect(_instrument_connection, dispatch_uid='Accounts.request_stats')
+    for connection in connections.all():
+        _instrument_connection(connection=connection)
+
+
+def _timed_template_render(render):
+    def wrapper(self, *args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return render(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            stats.template_time += time.perf_counter() - start
+    wrapper._request_stats = True
+    return wrapper
+
+
+def _instrument_templates():
+    if not getattr(DjangoTemplate.render, '_request_stats', False):
+        DjangoTemplate.render = _timed_template_render(DjangoTemplate.render)
+
+
+def get_view_stats():
+    """Per view aggregates, slowest average first."""
+    with _lock:
+        rows = [dict(row, view=view) for view, row in _view_stats.items()]
+    for row in rows:
+        row['avg_ms'] = row['total_ms'] / row['requests']
+        row['avg_queries'] = row['queries'] / row['requests']
+        row['avg_db_ms'] = row['db_ms'] / row['requests']
+        row['avg_template_ms'] = row['template_ms'] / row['requests']
+    return sorted(rows, key=lambda row: row['avg_ms'], reverse=True)
+
+
+def get_slow_requests():
+    """The most recent slow requests, newest first."""
+    with _lock:
+        return list(reversed(_slow_requests))
+
+
+def reset_stats():
+    with _lock:
+        _view_stats.clear()
+        _slow_requests.clear()
+
+
+class RequestStatsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'REQUEST_STATS_SLOW_MS', 500)
+        self.slow_queries = getattr(settings, 'REQUEST_STATS_SLOW_QUERIES', 50)
+        _instrument_templates()
+        _instrument_queries()
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, start)
+
+    def finish(self, request, response, stats, start):
+        total_ms = (time.perf_counter() - start) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else UNRESOLVED
+        self.record(request, view, stats, total_ms)
+
+        user = getattr(request, 'user', None)
+        if settings.DEBUG or getattr(user, 'is_staff', False):
+            response['Server-Timing'] = (
+                f'db;dur={stats.db_time * 1000:.1f}, tpl;dur={stats.template_time * 1000:.1f}, '
+                f'total;dur={total_ms:.1f}'
+            )
+        return response
+
+    def is_slow(self, stats, total_ms):
+        return (
+            (self.slow_ms is not None and total_ms >= self.slow_ms)
+            or (self.slow_queries is not None and stats.queries > self.slow_queries)
+        )
+
+    def record(self, request, view, stats, total_ms):
+        db_ms = stats.db_time * 1000
+        template_ms = stats.template_time * 1000
+        with _lock:
+            row = _view_stats.setdefault(view, {
+                'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0, 'max_queries': 0,
+                'db_ms': 0.0, 'template_ms': 0.0,
+            })
+            row['requests'] += 1
+            row['total_ms'] += total_ms
+            row['max_ms'] = max(row['max_ms'], total_ms)
+            row['queries'] += stats.queries
+            row['max_queries'] = max(row['max_queries'], stats.queries)
+            row['db_ms'] += db_ms
+            row['template_ms'] += template_ms
+
+        if not self.is_slow(stats, total_ms):
+            return
+        repeated = [(sql, count) for sql, count in stats.sql.most_common(5) if count > 1]
+        with _lock:
+            _slow_requests.append({
+                'method': request.method,
+                'path': request.get_full_path(),
+                'view': view,
+                'total_ms': total_ms,
+                'queries': stats.queries,
+                'db_ms': db_ms,
+                'template_ms': template_ms,
+                'repeated': repeated,
+            })
+        logger.warning(
+            "Slow request %s %s (%s): %.0f ms, %d queries (%.0f ms DB, %.0f ms templates)%s",
+            request.method, request.get_full_path(), view, total_ms, stats.queries, db_ms, template_ms,
+            ''.join(f"\n  {count}x {sql}" for sql, count in repeated),
+        )
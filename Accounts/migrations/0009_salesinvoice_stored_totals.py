@@ -0,0 +1,53 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:04
+
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    SalesInvoice = apps.get_model('Accounts', 'SalesInvoice')
+    SalesProduct = apps.get_model('Accounts', 'SalesProduct')
+    SalesPayment = apps.get_model('Accounts', 'SalesPayment')
+
+    def summed(model, field):
+        subquery = (
+            model.objects.filter(invoice=OuterRef('pk'))
+            .order_by()
+            .values('invoice')
+            .annotate(total=Sum(field))
+            .values('total')
+        )
+        return Coalesce(Subquery(subquery), Value(0), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+    SalesInvoice.objects.update(
+        net_total=summed(SalesProduct, 'total'),
+        total_gross_weight=summed(SalesProduct, 'gross_weight'),
+        paid_amount=summed(SalesPayment, 'amount'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0008_product_category_product_price_product_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salesinvoice',
+            name='net_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Sum of all line item totals', max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='salesinvoice',
+            name='paid_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Sum of all related payments', max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='salesinvoice',
+            name='total_gross_weight',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Sum of gross weights of all sales products', max_digits=14),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:06
+
+import re
+
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    """Start every series after the highest number already issued."""
+    PurchaseInvoice = apps.get_model('Accounts', 'PurchaseInvoice')
+    SalesInvoice = apps.get_model('Accounts', 'SalesInvoice')
+    Sequence = apps.get_model('Accounts', 'Sequence')
+
+    values = {}
+
+    def seen(name, number):
+        values[name] = max(values.get(name, 0), int(number))
+
+    for number in PurchaseInvoice.objects.values_list('invoice_number', flat=True):
+        match = re.fullmatch(r'MS(\d{4})R(\d+)', number or '')
+        if match:
+            seen(f'purchase_invoice:{match.group(1)}', match.group(2))
+    for number in PurchaseInvoice.objects.values_list('lot_number', flat=True):
+        match = re.fullmatch(r'LOT-(\d+)', number or '')
+        if match:
+            seen('lot', match.group(1))
+    for number in SalesInvoice.objects.values_list('invoice_number', flat=True):
+        match = re.fullmatch(r'SA(\d{4})S(\d+)', number or '')
+        if match:
+            seen(f'sales_invoice:{match.group(1)}', match.group(2))
+
+    Sequence.objects.bulk_create([Sequence(name=name, value=value) for name, value in values.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0009_salesinvoice_stored_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='purchaseinvoice',
+            name='lot_number',
+            field=models.CharField(editable=False, max_length=20, unique=True),
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0010_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseinvoice',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='salesinvoice',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
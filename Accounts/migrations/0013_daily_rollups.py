@@ -0,0 +1,114 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:20
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+ZERO = Decimal('0.00')
+
+
+def backfill_rollups(apps, schema_editor):
+    SalesInvoice = apps.get_model('Accounts', 'SalesInvoice')
+    SalesProduct = apps.get_model('Accounts', 'SalesProduct')
+    PurchaseInvoice = apps.get_model('Accounts', 'PurchaseInvoice')
+    Expense = apps.get_model('Accounts', 'Expense')
+    Damages = apps.get_model('Accounts', 'Damages')
+    DailySummary = apps.get_model('Accounts', 'DailySummary')
+    DailyProductSales = apps.get_model('Accounts', 'DailyProductSales')
+    DailyCustomerSales = apps.get_model('Accounts', 'DailyCustomerSales')
+
+    summaries = defaultdict(dict)
+    sources = [
+        (SalesProduct, 'invoice__date', {'sales_total': Sum('total', default=ZERO),
+                                         'sales_gross_weight': Sum('gross_weight', default=ZERO)}),
+        (SalesInvoice, 'date', {'sales_count': Count('pk')}),
+        (PurchaseInvoice, 'date', {'purchases_total': Sum('net_total', default=ZERO),
+                                   'purchases_count': Count('pk')}),
+        (Expense, 'date', {'expenses_total': Sum('amount', default=ZERO)}),
+        (Damages, 'date', {'damages_total': Sum('amount_loss', default=ZERO)}),
+    ]
+    for model, day, sums in sources:
+        for row in model.objects.order_by().values(day).annotate(**sums):
+            summaries[row.pop(day)].update(row)
+    DailySummary.objects.bulk_create(DailySummary(date=day, **fields) for day, fields in summaries.items())
+
+    DailyProductSales.objects.bulk_create(
+        DailyProductSales(date=row['invoice__date'], product_id=row['product'], gross_weight=row['line_gross_weight'],
+                          net_weight=row['line_net_weight'], total=row['line_total'])
+        for row in SalesProduct.objects.order_by().values('invoice__date', 'product').annotate(
+            line_gross_weight=Sum('gross_weight', default=ZERO),
+            line_net_weight=Sum('net_weight', default=ZERO),
+            line_total=Sum('total', default=ZERO),
+        )
+    )
+
+    customers = defaultdict(dict)
+    for row in SalesInvoice.objects.order_by().values('date', 'vendor').annotate(invoice_count=Count('pk')):
+        customers[row['date'], row['vendor']]['invoice_count'] = row['invoice_count']
+    for row in SalesProduct.objects.order_by().values('invoice__date', 'invoice__vendor').annotate(
+        line_total=Sum('total', default=ZERO),
+    ):
+        customers[row['invoice__date'], row['invoice__vendor']]['net_total'] = row['line_total']
+    DailyCustomerSales.objects.bulk_create(
+        DailyCustomerSales(date=day, customer_id=customer_id, **fields)
+        for (day, customer_id), fields in customers.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0012_invoicebatchjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('sales_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('sales_gross_weight', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('sales_count', models.IntegerField(default=0)),
+                ('purchases_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('purchases_count', models.IntegerField(default=0)),
+                ('expenses_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('damages_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Daily Summary',
+                'verbose_name_plural': 'Daily Summaries',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCustomerSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('net_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='Accounts.customer')),
+            ],
+            options={
+                'unique_together': {('date', 'customer')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('gross_weight', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('net_weight', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='Accounts.product')),
+            ],
+            options={
+                'unique_together': {('date', 'product')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:29
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def opening_movements(apps, schema_editor):
+    # The stock held before the ledger existed becomes each product's opening movement
+    Product = apps.get_model('Accounts', 'Product')
+    StockMovement = apps.get_model('Accounts', 'StockMovement')
+    StockMovement.objects.bulk_create(
+        StockMovement(product_id=product_id, kind='opening', quantity=stock, reference='ledger start')
+        for product_id, stock in Product.objects.exclude(current_stock=0).values_list('pk', 'current_stock')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0013_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(default=datetime.date.today)),
+                ('kind', models.CharField(choices=[('opening', 'Opening Stock'), ('purchase', 'Purchase'), ('sale', 'Sale'), ('damage', 'Damage'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('quantity', models.IntegerField(help_text='Signed change in stock')),
+                ('reference', models.CharField(blank=True, help_text='e.g. sales_invoice:12', max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='Accounts.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'date'], name='Accounts_st_product_d5add7_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='Accounts.product')),
+            ],
+            options={
+                'unique_together': {('product', 'date')},
+            },
+        ),
+        migrations.RunPython(opening_movements, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0014_stock_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='damages',
+            index=models.Index(fields=['date'], name='Accounts_da_date_76c74d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['date'], name='Accounts_ex_date_0d6a31_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseinvoice',
+            index=models.Index(fields=['date', 'id'], name='Accounts_pu_date_b22122_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseinvoice',
+            index=models.Index(fields=['vendor', 'date'], name='Accounts_pu_vendor__db9758_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesinvoice',
+            index=models.Index(fields=['date', 'id'], name='Accounts_sa_date_ddb7d1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesinvoice',
+            index=models.Index(fields=['vendor', 'date'], name='Accounts_sa_vendor__36ecbd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saleslot',
+            index=models.Index(fields=['purchase_invoice', 'quantity'], name='Accounts_sa_purchas_3eb77a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salespayment',
+            index=models.Index(fields=['date', 'payment_mode'], name='Accounts_sa_date_d2b6d7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesproduct',
+            index=models.Index(fields=['invoice', 'serial_number'], name='Accounts_sa_invoice_fb95d8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesproduct',
+            index=models.Index(fields=['product', 'invoice'], name='Accounts_sa_product_1629f3_idx'),
+        ),
+    ]
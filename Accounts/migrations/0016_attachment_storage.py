@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:47
+
+import Accounts.attachments
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0015_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=Accounts.attachments.attachment_storage, upload_to='payment_attachments/', verbose_name='Payment Attachment'),
+        ),
+        migrations.AlterField(
+            model_name='salespayment',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=Accounts.attachments.attachment_storage, upload_to='sales_payment_attachments/', verbose_name='Payment Attachment'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:05
+
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_paid_amount(apps, schema_editor):
+    PurchaseInvoice = apps.get_model('Accounts', 'PurchaseInvoice')
+    Payment = apps.get_model('Accounts', 'Payment')
+
+    paid = (
+        Payment.objects.filter(invoice=OuterRef('pk'))
+        .order_by()
+        .values('invoice')
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    PurchaseInvoice.objects.update(
+        paid_amount=Coalesce(Subquery(paid), Value(0), output_field=DecimalField(max_digits=14, decimal_places=2)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0016_attachment_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseinvoice',
+            name='paid_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Sum of all related payments', max_digits=14),
+        ),
+        migrations.RunPython(backfill_paid_amount, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# Accounts/search.py keeps this table up to date; rowid = pk * 8 + kind code.
+TABLE = 'Accounts_searchindex'
+
+
+def _joined(*columns):
+    # The non-empty values separated by single spaces, as search._document() writes them
+    return "RTRIM(" + " || ".join(f"COALESCE(NULLIF({column}, '') || ' ', '')" for column in columns) + ")"
+
+
+BACKFILL = [
+    ('Accounts_salesinvoice', 0, _joined('invoice_number'),
+     _joined('vehicle_number', 'reference',
+             "NULLIF(REPLACE(REPLACE(vehicle_number, ' ', ''), '-', ''), vehicle_number)")),
+    ('Accounts_purchaseinvoice', 1, _joined('lot_number', 'invoice_number'), "''"),
+    ('Accounts_customer', 2, _joined('name'), _joined('contact_number', 'address')),
+    ('Accounts_purchasevendor', 3, _joined('name'), _joined('contact_number', 'area')),
+    ('Accounts_product', 4, _joined('name'), "''"),
+]
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite only; elsewhere search.py falls back to icontains filters
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+        "title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    for table, code, title, body in BACKFILL:
+        schema_editor.execute(
+            f"INSERT INTO {TABLE} (rowid, title, body) SELECT id * 8 + {code}, {title}, {body} FROM {table}"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0017_purchaseinvoice_paid_amount'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
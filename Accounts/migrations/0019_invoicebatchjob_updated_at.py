@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0018_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoicebatchjob',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
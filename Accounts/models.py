@@ -1,15 +1,61 @@
-from django.db import models
+from django.db import models, transaction
 from datetime import date
 from decimal import Decimal, ROUND_HALF_UP
 from django.core.exceptions import ValidationError
 from django.db.models import Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 
+from . import payments
+from .attachments import attachment_storage
+
+
+class GroupConcat(models.Aggregate):
+    """Comma separated list of the grouped values (GROUP_CONCAT / STRING_AGG)."""
+    function = 'GROUP_CONCAT'
+    template = "%(function)s(%(distinct)s%(expressions)s, ', ')"
+    allow_distinct = True
+    output_field = models.TextField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='STRING_AGG', **extra_context)
+
+
+def _update_fields_excluding(instance, excluded):
+    """Concrete fields to write on an UPDATE, leaving out DB-maintained columns."""
+    return [
+        f.name for f in instance._meta.concrete_fields
+        if not f.primary_key and f.name not in excluded
+    ]
+
+
+class Sequence(models.Model):
+    """Counter row behind the invoice and lot numbers (see sequences.py)."""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+def _loaded_printed(instance):
+    """Stored values of the fields printed on the invoice PDFs (see signals.py)."""
+    return {name: instance.__dict__.get(name) for name in instance.PRINTED_FIELDS}
+
+
 class PurchaseVendor(models.Model):
     name = models.CharField(max_length=100)
     contact_number = models.CharField(max_length=15)
     area = models.CharField(max_length=100)
 
+    PRINTED_FIELDS = ('name', 'contact_number', 'area')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_printed = _loaded_printed(instance)
+        return instance
+
     def __str__(self):
         return self.name
 
@@ -34,34 +80,31 @@ class Payment(models.Model):
     # New field: Attachment for screenshot/reference
     attachment = models.FileField(
         upload_to='payment_attachments/', 
+        storage=attachment_storage,  # stored by content hash, see attachments.py
         blank=True, 
         null=True,
         verbose_name="Payment Attachment"
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stored invoice and amount, so a change is posted as a delta (payments.py).
+        instance._loaded_totals = {
+            'invoice_id': instance.__dict__.get('invoice_id'),
+            'amount': instance.__dict__.get('amount'),
+        }
+        return instance
+
     def clean(self):
-        invoice = self.invoice
-        # Calculate the total of all payments for this invoice excluding the current instance if it exists.
-        if self.pk:
-            # Existing payment: exclude self from the total.
-            current_total = invoice.payments.exclude(pk=self.pk).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        else:
-            # New payment: there is no current value.
-            current_total = Decimal('0')
-            
-        # Calculate what the new total would be after this payment is added/updated.
-        new_total = current_total + self.amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        
-        net_total_after_cash_cutting = invoice.net_total_after_cash_cutting
+        # Against the stored paid amount; save() checks again, atomically.
+        payments.check_payment(self)
 
-        if new_total > net_total_after_cash_cutting:
-            raise ValidationError(
-                f"Total payment cannot exceed the net total after 2% cash cutting: ₹{net_total_after_cash_cutting}."
-            )
-                
     def save(self, *args, **kwargs):
-        self.clean()
-        super().save(*args, **kwargs)
+        # Post the amount to the invoice first: its UPDATE refuses an
+        # overpayment and locks the invoice until this payment is written.
+        with transaction.atomic():
+            payments.save_payment(self, lambda: super(Payment, self).save(*args, **kwargs))
 
     def __str__(self):
         return f"Payment of ₹{self.amount} for Invoice {self.invoice.invoice_number}"
@@ -69,7 +112,7 @@ class Payment(models.Model):
 
 class PurchaseInvoice(models.Model):
     invoice_number = models.CharField(max_length=20, unique=True, editable=False)
-    lot_number = models.CharField(max_length=10, unique=True, editable=False)
+    lot_number = models.CharField(max_length=20, unique=True, editable=False)
     date = models.DateField(default=date.today)
     vendor = models.ForeignKey('PurchaseVendor', on_delete=models.CASCADE, related_name='invoices')
     net_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
@@ -79,61 +122,108 @@ class PurchaseInvoice(models.Model):
         blank=True,
         null=True
     )
-    
+    # Stored running total of the payments, posted with a conditional UPDATE
+    # that refuses overpayments (payments.py).
+    paid_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False,
+                                      help_text="Sum of all related payments")
+    # Bumped on every change to the invoice, its products or payments; part of
+    # the cached PDF key (pdf_cache.py). Only ever written with F() updates.
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    @classmethod
+    def bump_version(cls, invoice_id):
+        if invoice_id:
+            cls.objects.filter(pk=invoice_id).update(version=models.F('version') + 1)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stored date and total, so the signal handlers can post rollup deltas.
+        instance._loaded_rollup = {
+            'date': instance.__dict__.get('date'),
+            'net_total': instance.__dict__.get('net_total'),
+        }
+        return instance
+
     def save(self, *args, **kwargs):
-        # --- Generate invoice_number if not set (only for new objects) ---
-        if not self.invoice_number and self.pk is None:
-            last_invoice = PurchaseInvoice.objects.order_by("-id").first()
-            if last_invoice and last_invoice.invoice_number:
-                try:
-                    # Extract the last two digits and increment
-                    last_number = int(last_invoice.invoice_number[-2:])
-                except ValueError:
-                    last_number = 0
-                self.invoice_number = f"MS2025R{last_number + 1:02d}"
-            else:
-                self.invoice_number = "MS2025R01"  # Default starting number
-
-        # --- Generate lot_number if not set (only for new objects) ---
-        if not self.lot_number and self.pk is None:
-            last_lot = PurchaseInvoice.objects.order_by("-id").first()
-            if last_lot and last_lot.lot_number:
-                try:
-                    last_lot_number = int(last_lot.lot_number.split("-")[-1])
-                except ValueError:
-                    last_lot_number = 0
-                self.lot_number = f"LOT-{last_lot_number + 1:02d}"
-            else:
-                self.lot_number = "LOT-01"  # Default starting lot number
+        from .sequences import next_purchase_invoice_number, next_lot_number
 
-        # --- First save to ensure the instance gets a primary key ---
-        super().save(*args, **kwargs)
+        # paid_amount belongs to the payments (payments.py), never written by save().
+        updating = self.pk is not None and not self._state.adding
+        if updating and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = _update_fields_excluding(self, ('paid_amount', 'version'))
+
+        # Numbers are allocated in the same transaction as the insert, so a
+        # failed save rolls the counters back and leaves no gaps.
+        with transaction.atomic():
+            # --- Generate invoice_number if not set (only for new objects) ---
+            if not self.invoice_number and self.pk is None:
+                self.invoice_number = next_purchase_invoice_number(self.date)
+
+            # --- Generate lot_number if not set (only for new objects) ---
+            if not self.lot_number and self.pk is None:
+                self.lot_number = next_lot_number()
 
-        # --- Update net_total after saving ---
-        calculated_total = sum(product.total for product in self.purchase_products.all())
-        if self.net_total != calculated_total:
-            self.net_total = calculated_total
-            # Update only the net_total field
-            super().save(update_fields=["net_total"])
+            # --- net_total is the sum of the line items, written with the same UPDATE ---
+            if not updating:
+                # A new invoice has no line items yet
+                self.net_total = Decimal('0.00')
+            elif 'net_total' in kwargs['update_fields']:
+                self.net_total = self.line_items_total()
+
+            super().save(*args, **kwargs)
+
+        if updating:
+            PurchaseInvoice.bump_version(self.pk)
+
+    def line_items_total(self):
+        """Sum of the line item totals, added up by the database."""
+        return self.purchase_products.aggregate(total=Sum('total'))['total'] or Decimal('0.00')
+
+    def refresh_net_total(self):
+        """
+        Store net_total after line items were written without save(), e.g. by
+        line_items.save_purchase_products(): one aggregate, plus one UPDATE if
+        it changed. Returns the total.
+        """
+        total = self.line_items_total()
+        if self.net_total != total:
+            self.net_total = total
+            # Only net_total: the post_save handler posts the change to the rollups
+            super().save(update_fields=['net_total'])
+        return total
 
     @property
     def available_quantity(self):
-        # Existing purchased quantity
-        total_purchased = sum(product.quantity for product in self.purchase_products.all())
-        
-        # Sum of quantities used in ALL sales invoices
-        total_used = self.sales_lots.aggregate(total=Sum('quantity'))['total'] or Decimal('0.00')
-        
-        return total_purchased - total_used      
+        """Remaining kg in this lot (purchased minus used in ALL sales invoices)."""
+        # Querysets built with availability.annotate_availability() already carry it
+        if getattr(self, 'remaining_kg', None) is not None:
+            return self.remaining_kg
+        from .availability import get_lot_availability
+        return get_lot_availability([self.pk]).get(self.pk, Decimal('0.00'))
 
     @property
     def net_total_after_cash_cutting(self):
         # Calculate net total after deducting 2%
         return round(self.net_total - (self.net_total * Decimal('0.02')), 2)
 
-    @property
-    def paid_amount(self):
-        return round(sum(payment.amount for payment in self.payments.all()), 2)
+    @staticmethod
+    def paid_amount_expression():
+        """Sum of the payments as a database expression, to check or rebuild paid_amount."""
+        payments = (
+            Payment.objects.filter(invoice=models.OuterRef('pk')).order_by().values('invoice')
+            .annotate(total=Sum('amount')).values('total')
+        )
+        return Coalesce(models.Subquery(payments), Decimal('0.00'),
+                        output_field=models.DecimalField(max_digits=14, decimal_places=2))
+
+    @staticmethod
+    def due_amount_expression():
+        """due_amount as a database expression, for annotate()."""
+        return models.ExpressionWrapper(
+            models.F('net_total') * Decimal('0.98') - models.F('paid_amount'),
+            output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        )
 
     @property
     def due_amount(self):
@@ -156,25 +246,26 @@ class PurchaseInvoice(models.Model):
         )
 
     def get_product_quantities(self):
-        products = {}
-        for purchase_product in self.purchase_products.all():
-            sold = SalesProduct.objects.filter(
-                invoice__lot=self,
-                product=purchase_product.product
-            ).aggregate(total=Sum('quantity'))['total'] or 0
-            available = purchase_product.quantity - sold
-            products[purchase_product.product.name] = available
-        return products
+        """Remaining kg per product name in this lot."""
+        from .availability import get_lot_product_availability
+        available = get_lot_product_availability([self.pk])
+        names = Product.objects.in_bulk([product_id for _, product_id in available])
+        return {names[product_id].name: quantity for (_, product_id), quantity in available.items()}
     class Meta:
         verbose_name = "Lot"
         verbose_name = "Purchase Invoice"  # Singular name
         verbose_name_plural = "Purchase Invoices"  # Plural name
+        indexes = [
+            models.Index(fields=['date', 'id']),
+            # The vendor ledger: one vendor's lots, filtered by year
+            models.Index(fields=['vendor', 'date']),
+        ]
 class Purchase(models.Model):
     invoice = models.OneToOneField(PurchaseInvoice, on_delete=models.CASCADE, related_name='purchase_invoice')
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     def save(self, *args, **kwargs):
-        self.total_amount = sum(product.total for product in self.invoice.purchase_products.all())
+        self.total_amount = self.invoice.line_items_total()
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -194,12 +285,46 @@ class Category(models.Model):
 
 class Product(models.Model):
     name = models.CharField(max_length=100)
+    # Only ever changed through StockMovement rows (see stock.py): saving a
+    # different value posts the difference as an adjustment.
     current_stock = models.IntegerField(default=0)
     threshold = models.IntegerField(default=5)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name="products")
     stock = models.IntegerField(default=0)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
+    PRINTED_FIELDS = ('name',)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stored stock, so a changed value can be posted as a movement.
+        instance._loaded_stock = instance.__dict__.get('current_stock')
+        instance._loaded_printed = _loaded_printed(instance)
+        return instance
+
+    def save(self, *args, **kwargs):
+        from .stock import post_movement
+
+        stock = self._meta.get_field('current_stock').to_python(self.current_stock) or 0
+        if self._state.adding:
+            # The opening stock is the first movement of the product
+            self.current_stock = 0
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                post_movement(self.pk, stock, 'opening')
+            self.current_stock = self._loaded_stock = stock
+            return
+
+        if kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = _update_fields_excluding(self, ('current_stock',))
+        loaded = getattr(self, '_loaded_stock', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if loaded is not None and stock != loaded:
+                post_movement(self.pk, stock - loaded, 'adjustment')
+        self.current_stock = self._loaded_stock = stock
+
     def __str__(self):
         return self.name
     
@@ -227,7 +352,11 @@ class PurchaseProduct(models.Model):
             else:
                 self.serial_number = 1  # Start from 1 for the first product in the invoice
 
-    # Calculate total
+        self.calculate_amounts()
+        super().save(*args, **kwargs)
+
+    def calculate_amounts(self):
+        """Set loading_unloading and total from the quantity, deductions and price (no query)."""
         discount_quantity = (self.quantity * self.discount) / 100
         damage_quantity = (self.quantity * self.damage) / 100
         remaining_quantity = self.quantity - discount_quantity - damage_quantity - self.rotten
@@ -238,7 +367,17 @@ class PurchaseProduct(models.Model):
         # Calculate total (price * remaining quantity after all deductions + loading/unloading cost)
         self.total = (remaining_quantity * self.price) - self.loading_unloading
 
-        super().save(*args, **kwargs)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stored quantities, so the signal handlers can post stock movements.
+        instance._loaded_stock = {
+            'product_id': instance.__dict__.get('product_id'),
+            'quantity': instance.__dict__.get('quantity'),
+            'damage': instance.__dict__.get('damage'),
+            'rotten': instance.__dict__.get('rotten'),
+        }
+        return instance
 
     def __str__(self):
         return f"{self.product.name} in Invoice {self.invoice.invoice_number}"
@@ -284,34 +423,130 @@ class SalesInvoice(models.Model):
         ('completed', 'Completed'),
         ('failed', 'Failed'),
     ], default='pending')
-    
+
+    # Stored totals, kept in sync by the SalesProduct signal handlers in
+    # signals.py and by SalesPayment.save() (payments.py). Rebuild them with
+    # `manage.py rebuild_sales_totals`.
+    net_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False,
+                                    help_text="Sum of all line item totals")
+    total_gross_weight = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False,
+                                             help_text="Sum of gross weights of all sales products")
+    paid_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False,
+                                      help_text="Sum of all related payments")
+
+    # Bumped on every change to the invoice, its line items, lots or payments;
+    # part of the cached PDF key (pdf_cache.py).
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    # Columns owned by the line items and payments, never written by save().
+    TOTAL_FIELDS = ('net_total', 'total_gross_weight', 'paid_amount')
+
+    class Meta:
+        indexes = [
+            # Date ranges of the reports and the newest-first lists (-date, -id)
+            models.Index(fields=['date', 'id']),
+            # A customer's invoices over a period
+            models.Index(fields=['vendor', 'date']),
+        ]
+
     def save(self, *args, **kwargs):
-        # Auto-generate invoice number if not set.
-        if not self.invoice_number and self.pk is None:
-            last_invoice = SalesInvoice.objects.order_by("-id").first()
-            if last_invoice and last_invoice.invoice_number:
-                try:
-                    last_number = int(last_invoice.invoice_number[-2:])
-                except ValueError:
-                    last_number = 0
-                self.invoice_number = f"SA2025S{last_number + 1:02d}"
-            else:
-                self.invoice_number = "SA2025S01"
-        super().save(*args, **kwargs)
-    
-    # Computed properties for totals:
-    @property
-    def total_gross_weight(self):
-        """Sum of gross weights of all sales products."""
-        total = self.sales_products.aggregate(total=models.Sum('gross_weight'))['total'] or Decimal('0.00')
-        return total
-    
-    @property
-    def net_total(self):
-        """Sum of all line item totals."""
-        total = self.sales_products.aggregate(total=models.Sum('total'))['total'] or Decimal('0.00')
-        return total
-    
+        from .sequences import next_sales_invoice_number
+
+        # An in-memory instance may hold stale totals once line items or
+        # payments change, so updates never write the stored total columns.
+        updating = self.pk is not None and not self._state.adding
+        if updating and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = _update_fields_excluding(self, self.TOTAL_FIELDS + ('version',))
+
+        # Allocate the invoice number in the insert's transaction (no gaps).
+        with transaction.atomic():
+            if not self.invoice_number and self.pk is None:
+                self.invoice_number = next_sales_invoice_number(self.date)
+            super().save(*args, **kwargs)
+
+        if updating:
+            SalesInvoice.bump_version(self.pk)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stored date and customer, so a change can be moved in the daily rollups.
+        instance._loaded_rollup = {
+            'date': instance.__dict__.get('date'),
+            'vendor_id': instance.__dict__.get('vendor_id'),
+        }
+        return instance
+
+    @classmethod
+    def bump_version(cls, invoice_id):
+        if invoice_id:
+            cls.objects.filter(pk=invoice_id).update(version=models.F('version') + 1)
+
+    @classmethod
+    def apply_totals_delta(cls, invoice_id, net_total=0, gross_weight=0, paid_amount=0):
+        """Atomically shift the stored totals of one invoice by the given deltas and bump its version."""
+        changes = {'version': models.F('version') + 1}
+        if net_total:
+            changes['net_total'] = models.F('net_total') + net_total
+        if gross_weight:
+            changes['total_gross_weight'] = models.F('total_gross_weight') + gross_weight
+        if paid_amount:
+            changes['paid_amount'] = models.F('paid_amount') + paid_amount
+        if invoice_id:
+            cls.objects.filter(pk=invoice_id).update(**changes)
+
+    def calculate_totals(self):
+        """Aggregate the totals from the line items and payments (2 queries)."""
+        products = self.sales_products.aggregate(
+            net_total=Sum('total'), total_gross_weight=Sum('gross_weight')
+        )
+        paid = self.payments.aggregate(total=Sum('amount'))['total']
+        return {
+            'net_total': products['net_total'] or Decimal('0.00'),
+            'total_gross_weight': products['total_gross_weight'] or Decimal('0.00'),
+            'paid_amount': paid or Decimal('0.00'),
+        }
+
+    def refresh_totals(self):
+        """Recalculate and store the totals from scratch."""
+        totals = self.calculate_totals()
+        for field, value in totals.items():
+            setattr(self, field, value)
+        SalesInvoice.objects.filter(pk=self.pk).update(version=models.F('version') + 1, **totals)
+        return totals
+
+    @staticmethod
+    def total_after_packaging_expression(prefix=''):
+        """
+        net_total_after_packaging as a database expression, for annotate().
+        Use prefix='invoice__' when querying from the line items.
+        """
+        return models.ExpressionWrapper(
+            models.F(f'{prefix}net_total') + models.F(f'{prefix}total_gross_weight')
+            + Coalesce(models.F(f'{prefix}no_of_crates') * models.F(f'{prefix}cost_per_crate'), Decimal('0.00')),
+            output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        )
+
+    @staticmethod
+    def lot_numbers_expression():
+        """Comma separated lot numbers used by the invoice, as a subquery for annotate()."""
+        lots = (
+            SalesLot.objects.filter(sales_invoice=models.OuterRef('pk'))
+            .order_by()
+            .values('sales_invoice')
+            .annotate(numbers=GroupConcat('purchase_invoice__lot_number'))
+            .values('numbers')
+        )
+        return models.Subquery(lots, output_field=models.TextField())
+
+    @staticmethod
+    def due_amount_expression(prefix=''):
+        """due_amount as a database expression, for annotate()."""
+        return models.ExpressionWrapper(
+            SalesInvoice.total_after_packaging_expression(prefix) - models.F(f'{prefix}paid_amount'),
+            output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        )
+
     @property
     def net_total_after_commission(self):
         """
@@ -336,11 +571,6 @@ class SalesInvoice(models.Model):
         Final invoice total = Net Total After Commission + Packaging Total.
         """
         return self.net_total_after_commission + self.packaging_total
-    
-    @property
-    def paid_amount(self):
-        """Sum of all related payments"""
-        return self.payments.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
 
     @property
     def due_amount(self):
@@ -386,13 +616,39 @@ class SalesProduct(models.Model):
             last_item = SalesProduct.objects.filter(invoice=self.invoice).order_by('-serial_number').first()
             self.serial_number = last_item.serial_number + 1 if last_item else 1
         
+        self.calculate_amounts()
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # An invoice's line items in order, and the next serial number
+            models.Index(fields=['invoice', 'serial_number']),
+            # Per-product sales joined to the invoice date
+            models.Index(fields=['product', 'invoice']),
+        ]
+
+    def calculate_amounts(self):
+        """Set net_weight and total from the weights, discount and price (no query)."""
         # Calculate net_weight:
         # net_weight = gross_weight - (gross_weight * discount/100) - rotten
-        self.net_weight = self.gross_weight - ((self.gross_weight * self.discount) / Decimal('100.00')) - self.rotten
+        net_weight = self.gross_weight - ((self.gross_weight * self.discount) / Decimal('100.00')) - self.rotten
+        # Round to the stored precision so the invoice totals match the columns.
+        self.net_weight = net_weight.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
         # Calculate total:
-        self.total = self.net_weight * self.price
-        
-        super().save(*args, **kwargs)
+        self.total = (net_weight * self.price).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so save() can post the change as a delta.
+        instance._loaded_totals = {
+            'invoice_id': instance.__dict__.get('invoice_id'),
+            'total': instance.__dict__.get('total'),
+            'gross_weight': instance.__dict__.get('gross_weight'),
+            'product_id': instance.__dict__.get('product_id'),
+            'net_weight': instance.__dict__.get('net_weight'),
+        }
+        return instance
     
     def __str__(self):
         return f"{self.serial_number}. {self.product.name} in Invoice {self.invoice.invoice_number}"
@@ -425,11 +681,34 @@ class SalesPayment(models.Model):
     )
     attachment = models.FileField(
         upload_to='sales_payment_attachments/', 
+        storage=attachment_storage,  # stored by content hash, see attachments.py
         blank=True, 
         null=True,
         verbose_name="Payment Attachment"
     )
+
+    class Meta:
+        # Collections by day and payment method on the reports page
+        indexes = [models.Index(fields=['date', 'payment_mode'])]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so save() can post the change as a delta.
+        instance._loaded_totals = {
+            'invoice_id': instance.__dict__.get('invoice_id'),
+            'amount': instance.__dict__.get('amount'),
+        }
+        return instance
+
+    def clean(self):
+        payments.check_payment(self)
+
+    def save(self, *args, **kwargs):
+        # Posted to the invoice's paid_amount before the insert (see Payment.save)
+        with transaction.atomic():
+            payments.save_payment(self, lambda: super(SalesPayment, self).save(*args, **kwargs))
+
     def __str__(self):
         return f"Payment of ₹{self.amount} for Sales Invoice {self.invoice.invoice_number}"
     
@@ -437,6 +716,14 @@ class Customer(models.Model):
     name = models.CharField(max_length=100)
     contact_number = models.CharField(max_length=15, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
+
+    PRINTED_FIELDS = ('name', 'contact_number')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_printed = _loaded_printed(instance)
+        return instance
     
     def __str__(self):
         return self.name
@@ -449,6 +736,20 @@ class Expense(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stored date and amount, so the signal handlers can post rollup deltas.
+        instance._loaded_rollup = {
+            'date': instance.__dict__.get('date'),
+            'amount': instance.__dict__.get('amount'),
+        }
+        return instance
+
+    class Meta:
+        indexes = [models.Index(fields=['date'])]
+
     def __str__(self):
         return f"{self.date} - {self.paid_to} - ₹{self.amount}"
 class Damages(models.Model):
@@ -460,11 +761,23 @@ class Damages(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stored date and amount, so the signal handlers can post rollup deltas.
+        instance._loaded_rollup = {
+            'date': instance.__dict__.get('date'),
+            'amount_loss': instance.__dict__.get('amount_loss'),
+        }
+        return instance
+
     def __str__(self):
         return f"{self.date} - {self.due_to} - ₹{self.amount_loss}"
     class Meta:
         verbose_name = "Damage"  # Singular form
         verbose_name_plural = "Damages"  # Explicitly set plural name
+        indexes = [models.Index(fields=['date'])]
 
 class SalesLot(models.Model):
     """Tracks which lots (from purchase invoices) are used in a sales invoice"""
@@ -487,6 +800,10 @@ class SalesLot(models.Model):
 
     class Meta:
         unique_together = ('sales_invoice', 'purchase_invoice')  # Prevent duplicates
+        indexes = [
+            # Kg used per lot (availability.py) without reading the table rows
+            models.Index(fields=['purchase_invoice', 'quantity']),
+        ]
 
     def __str__(self):
         return f"{self.quantity}kg from {self.purchase_invoice.lot_number}"
@@ -494,20 +811,27 @@ class SalesLot(models.Model):
     def clean(self):
         super().clean()
         
-        # Check available quantity
-        if self.quantity > self.purchase_invoice.available_quantity:
+        # Check available quantity. The lot may come from a queryset annotated
+        # by availability.annotate_availability(); then this costs no query.
+        available = self.purchase_invoice.available_quantity
+        if self.pk:
+            # Don't count this row's own stored quantity as used
+            available += SalesLot.objects.filter(
+                pk=self.pk, purchase_invoice_id=self.purchase_invoice_id
+            ).values_list('quantity', flat=True).first() or Decimal('0.00')
+        if self.quantity > available:
             raise ValidationError(
-                f"Only {self.purchase_invoice.available_quantity}kg available in {self.purchase_invoice.lot_number}"
+                f"Only {available}kg available in {self.purchase_invoice.lot_number}"
             )
 
         # Skip product check if SalesInvoice is unsaved (no primary key)
-        if not self.sales_invoice.pk:
+        if not self.sales_invoice_id:
             return  # Skip validation until parent is saved
 
         # Check product consistency (only after SalesInvoice is saved)
-        sales_products = self.sales_invoice.sales_products.all()
-        if sales_products.exists():
-            sales_product = sales_products.first().product
+        first_item = self.sales_invoice.sales_products.select_related('product').first()
+        if first_item:
+            sales_product = first_item.product
             if not self.purchase_invoice.purchase_products.filter(product=sales_product).exists():
                 raise ValidationError(
                     f"Lot {self.purchase_invoice.lot_number} doesn't contain {sales_product.name}"
@@ -524,4 +848,134 @@ class Packaging_Invoice(models.Model):
             # Return the total cost by multiplying no_of_crates and cost_per_crate
             return Decimal(self.no_of_crates) * self.cost_per_crate
         # Return 0.00 if either no_of_crates or cost_per_crate is None
-        return Decimal('0.00')
\ No newline at end of file
+        return Decimal('0.00')
+
+class InvoiceBatchJob(models.Model):
+    """A background run that prints many sales invoices into one PDF or ZIP (see pdf_batch.py)."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    FORMAT_CHOICES = [
+        ('pdf', 'Merged PDF'),
+        ('zip', 'ZIP of PDFs'),
+    ]
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set on every status or progress change; a job quiet for too long has died
+    updated_at = models.DateTimeField(auto_now=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True)
+    invoice_ids = models.JSONField(default=list)
+    output_format = models.CharField(max_length=3, choices=FORMAT_CHOICES, default='pdf')
+    hide_payments = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    total = models.PositiveIntegerField(default=0)
+    done = models.PositiveIntegerField(default=0)
+    output = models.FileField(upload_to='invoice_batches/', blank=True, null=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = "Invoice Print Job"
+        verbose_name_plural = "Invoice Print Jobs"
+
+    def __str__(self):
+        return f"Print job #{self.pk} ({self.done}/{self.total} invoices, {self.get_status_display()})"
+
+
+# -------------------------------------------
+# Daily rollups (see rollups.py)
+# -------------------------------------------
+class DailySummary(models.Model):
+    """Per day totals of sales, purchases, expenses and damages."""
+    date = models.DateField(unique=True)
+    sales_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    sales_gross_weight = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    sales_count = models.IntegerField(default=0)
+    purchases_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    purchases_count = models.IntegerField(default=0)
+    expenses_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    damages_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Daily Summary"
+        verbose_name_plural = "Daily Summaries"
+
+    def __str__(self):
+        return f"{self.date} - Sales ₹{self.sales_total}, Purchases ₹{self.purchases_total}"
+
+
+class DailyProductSales(models.Model):
+    """Per day and product sums of the sales line items."""
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    gross_weight = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    net_weight = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'product')
+
+    def __str__(self):
+        return f"{self.date} - {self.product_id}: {self.net_weight}kg, ₹{self.total}"
+
+
+class DailyCustomerSales(models.Model):
+    """Per day and customer sales invoice counts and line item totals."""
+    date = models.DateField()
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='daily_sales')
+    invoice_count = models.IntegerField(default=0)
+    net_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'customer')
+
+    def __str__(self):
+        return f"{self.date} - {self.customer_id}: {self.invoice_count} invoices, ₹{self.net_total}"
+
+
+# -------------------------------------------
+# Stock ledger (see stock.py)
+# -------------------------------------------
+class StockMovement(models.Model):
+    """One change of a product's stock. Rows are only ever added."""
+    KIND_CHOICES = [
+        ('opening', 'Opening Stock'),
+        ('purchase', 'Purchase'),
+        ('sale', 'Sale'),
+        ('damage', 'Damage'),
+        ('adjustment', 'Adjustment'),
+    ]
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    date = models.DateField(default=date.today)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    quantity = models.IntegerField(help_text="Signed change in stock")
+    reference = models.CharField(max_length=50, blank=True, help_text="e.g. sales_invoice:12")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['product', 'date'])]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Stock movements cannot be changed, post a correcting movement instead.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Stock movements cannot be deleted, post a correcting movement instead.")
+
+    def __str__(self):
+        return f"{self.date} {self.get_kind_display()} {self.quantity:+d} of {self.product_id}"
+
+
+class StockSnapshot(models.Model):
+    """Stock of a product at the end of a day, so stock_as_of() only sums later movements."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    date = models.DateField()
+    quantity = models.IntegerField()
+
+    class Meta:
+        unique_together = ('product', 'date')
+
+    def __str__(self):
+        return f"{self.product_id} on {self.date}: {self.quantity}"
@@ -0,0 +1,129 @@
+"""
+Race-free payment posting.
+
+PurchaseInvoice and SalesInvoice store the running sum of their payments in
+`paid_amount`. A payment is posted with one conditional UPDATE that checks
+the limit and takes the amount at once:
+
+    UPDATE ... SET paid_amount = paid_amount + :amount, version = version + 1
+     WHERE id = :invoice AND ROUND(paid_amount + :amount, 2) <= ROUND(<limit>, 2)
+
+The UPDATE write-locks the row (the database, on SQLite) until the payment's
+transaction commits, so a second clerk paying the same invoice at the same
+time waits, then sees the first payment in paid_amount. If no row was
+updated, the payment would overpay and is refused with a ValidationError.
+Neither the check nor the posting sums the existing payments.
+
+Limits: a lot's net total after the 2% cash cutting, a sales invoice's total
+after commission and packaging. Payment.save() and SalesPayment.save() post
+through here; deleting a payment takes its amount off again. A refused
+payment raises Overpayment, a ValidationError the admin shows as an error.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.db.models.functions import Round
+
+
+def _limit_expression(invoice_model):
+    from .models import SalesInvoice
+
+    if invoice_model is SalesInvoice:
+        return SalesInvoice.total_after_packaging_expression()
+    return F('net_total') * Decimal('0.98')
+
+
+def _limit(invoice):
+    from .models import SalesInvoice
+
+    if isinstance(invoice, SalesInvoice):
+        return invoice.net_total_after_packaging
+    return invoice.net_total_after_cash_cutting
+
+
+class Overpayment(ValidationError):
+    """A payment that would take the paid amount past the invoice's limit."""
+
+
+def _overpayment(invoice):
+    from .models import SalesInvoice
+
+    if isinstance(invoice, SalesInvoice):
+        return Overpayment(f"Total payment cannot exceed the invoice total: ₹{_limit(invoice):.2f}.")
+    return Overpayment(
+        f"Total payment cannot exceed the net total after 2% cash cutting: ₹{_limit(invoice)}."
+    )
+
+
+def _cents(amount):
+    return Decimal(amount or 0).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def post_payment(invoice_model, invoice_id, amount):
+    """
+    Add `amount` to the stored paid amount of an invoice, or raise a
+    ValidationError if that would pay more than the invoice's limit.
+    Negative amounts (payments removed or reduced) are always posted. The
+    invoice's version is bumped even for a zero amount: a payment's date or
+    mode is printed on the invoice too.
+    """
+    amount = _cents(amount)
+    if not invoice_id:
+        return
+    invoice = invoice_model.objects.filter(pk=invoice_id)
+    if not amount:
+        invoice.update(version=F('version') + 1)
+        return
+    if amount > 0:
+        invoice = invoice.alias(
+            paid_after=Round(F('paid_amount') + amount, 2), limit=Round(_limit_expression(invoice_model), 2),
+        ).filter(paid_after__lte=F('limit'))
+    if not invoice.update(paid_amount=F('paid_amount') + amount, version=F('version') + 1) and amount > 0:
+        raise _overpayment(invoice_model.objects.get(pk=invoice_id))
+
+
+def _change(payment):
+    """(old invoice id, old amount) of a payment, from when it was loaded."""
+    old = None if payment._state.adding else getattr(payment, '_loaded_totals', None)
+    return (old['invoice_id'], old['amount']) if old else (None, None)
+
+
+def save_payment(payment, save):
+    """
+    Post the change a payment makes to its invoice's paid amount, then write
+    the payment with `save()`; run inside a transaction.
+    """
+    invoice_model = payment._meta.get_field('invoice').related_model
+    old_invoice_id, old_amount = _change(payment)
+    if old_invoice_id and old_invoice_id != payment.invoice_id:
+        # Moved to another invoice: take it off the old one
+        post_payment(invoice_model, old_invoice_id, -_cents(old_amount))
+        old_amount = None
+    post_payment(invoice_model, payment.invoice_id, _cents(payment.amount) - _cents(old_amount))
+    save()
+    payment._loaded_totals = {'invoice_id': payment.invoice_id, 'amount': payment.amount}
+
+
+def check_payment(payment):
+    """
+    Form validation: would this payment overpay its invoice as it is stored
+    now? One query for the invoice, not one per payment; save() checks again.
+    """
+    if payment.amount is None or not payment.invoice_id:
+        return
+    invoice = payment.invoice
+    old_invoice_id, old_amount = _change(payment)
+    paid = invoice.paid_amount - (_cents(old_amount) if old_invoice_id == payment.invoice_id else 0)
+    if invoice.pk and paid + _cents(payment.amount) > _limit(invoice):
+        raise _overpayment(invoice)
+
+
+def check_payments(invoice, amounts):
+    """
+    Formset validation: would payments of these amounts, all the invoice's
+    payments, overpay it? The invoice may be unsaved or changed in the same
+    form, so its limit is taken from the instance, not the database.
+    """
+    if sum((_cents(amount) for amount in amounts), Decimal('0.00')) > _limit(invoice):
+        raise _overpayment(invoice)
@@ -0,0 +1,613 @@
+"""
+PDF rendering: the ReportLab invoices and the xhtml2pdf voucher templates.
+
+ReportLab and xhtml2pdf take over a second to import and the TTF fonts have
+to be parsed before they can be used, so none of it happens when the views
+are imported: views.py imports this module inside the PDF views, and the
+fonts, paragraph styles and logo are loaded on first use and then kept for
+the life of the process:
+
+    ensure_fonts()      registers the DejaVuSans/NotoSans fonts (once)
+    get_styles()        the sample stylesheet plus the invoice styles
+    get_logo_image()    a flowable of the logo, read and downscaled once
+    html_pdf_assets()   logo and font URLs for the xhtml2pdf templates
+
+`manage.py benchmark_startup` shows what this saves on worker boot and
+`manage.py check`.
+"""
+import base64
+import os
+import threading
+from decimal import Decimal
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import find
+from django.http import HttpResponse
+from django.template.loader import get_template
+from PIL import Image as PILImage
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Image, LongTable, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from xhtml2pdf import pisa
+
+from .models import SalesInvoice
+from .pdf_cache import get_cached_pdf
+
+# Embed images as binary streams: without ReportLab's C accelerator, ASCII85
+# encoding the logo is most of the time of a one-page document.
+rl_config.useA85 = 0
+
+FONT_DIR = os.path.join(os.path.dirname(__file__), 'Font')
+FONT_PATH = os.path.join(FONT_DIR, 'NotoSans.ttf')
+BOLD_FONT_PATH = os.path.join(FONT_DIR, 'NotoSans-Bold.ttf')
+# The layouts use the DejaVuSans names; both are the Noto files
+FONTS = [
+    ('DejaVuSans', FONT_PATH),
+    ('DejaVuSans-Bold', BOLD_FONT_PATH),
+    ('NotoSans', FONT_PATH),
+    ('NotoSans-Bold', BOLD_FONT_PATH),
+]
+
+_fonts_lock = threading.Lock()
+_fonts_registered = False
+
+
+def ensure_fonts():
+    """Register the TTF fonts with ReportLab, once per process."""
+    global _fonts_registered
+    if _fonts_registered:
+        return
+    with _fonts_lock:
+        if not _fonts_registered:
+            for name, path in FONTS:
+                pdfmetrics.registerFont(TTFont(name, path))
+            _fonts_registered = True
+
+
+@lru_cache(maxsize=1)
+def get_styles():
+    """The sample stylesheet with the invoice and voucher styles added."""
+    ensure_fonts()
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle('InvoiceTitle', parent=styles['Title'], fontSize=16,
+                              alignment=1, textColor=colors.black))
+    styles.add(ParagraphStyle('InvoiceFooter', parent=styles['Normal'], fontSize=10,
+                              leading=12, textColor=colors.darkgrey))
+    # vouchers.py
+    styles.add(ParagraphStyle('VoucherTitle', parent=styles['Heading2'], fontName='NotoSans-Bold',
+                              alignment=1, spaceAfter=30))
+    styles.add(ParagraphStyle('VoucherCell', parent=styles['Normal'], fontName='NotoSans', fontSize=10, leading=13))
+    styles.add(ParagraphStyle('VoucherHeader', parent=styles['VoucherCell'], fontName='NotoSans-Bold'))
+    return styles
+
+
+@lru_cache(maxsize=1)
+def _logo_bytes():
+    """LOGO.png read and downscaled once per process for the ReportLab invoices."""
+    for directory in (settings.STATICFILES_DIRS[0], settings.STATIC_ROOT):
+        logo_path = os.path.join(directory, 'LOGO.png')
+        if os.path.exists(logo_path):
+            break
+    else:
+        print(f"Logo file not found at {logo_path}")
+        return None
+    with PILImage.open(logo_path) as logo:
+        # 2 x 1.5 inch at 200 dpi is plenty for print
+        logo.thumbnail((400, 300))
+        buffer = BytesIO()
+        logo.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def get_logo_image(width=2*inch, height=1.5*inch):
+    """
+    A ReportLab Image of the cached logo, or None if there is no logo. The
+    flowable itself is new each time: documents set its alignment and layout.
+    """
+    logo_bytes = _logo_bytes()
+    if logo_bytes is None:
+        return None
+    return Image(BytesIO(logo_bytes), width=width, height=height)
+
+
+def get_base64_image(image_path):
+    with open(image_path, "rb") as image_file:
+        encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
+    return f"data:image/png;base64,{encoded_string}"
+
+
+@lru_cache(maxsize=1)
+def html_pdf_assets():
+    """Template context for the xhtml2pdf vouchers: the embedded logo and the font URLs."""
+    # The downscaled logo of the ReportLab invoices, encoded once
+    logo_bytes = _logo_bytes()
+    if logo_bytes is None:
+        raise FileNotFoundError("LOGO.png not found in static files!")
+
+    # Fix path for fonts
+    def fix_path(path):
+        return path.replace('\\', '/') if os.name == 'nt' else path
+
+    # Static copies of the fonts win over the bundled ones
+    font_normal = find('NotoSans.ttf') or FONT_PATH
+    font_bold = find('NotoSans-Bold.ttf') or BOLD_FONT_PATH
+    return {
+        'logo_path': f"data:image/png;base64,{base64.b64encode(logo_bytes).decode('ascii')}",
+        'noto_sans_path': f"file://{fix_path(font_normal)}",
+        'noto_sans_bold_path': f"file://{fix_path(font_bold)}",
+    }
+
+
+def render_purchase_invoice_pdf(invoice):
+    """Build the purchase invoice with ReportLab and return the PDF bytes."""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=30, leftMargin=30, topMargin=20, bottomMargin=30)
+
+    elements = []  # Correct indentation here
+
+    title_style = get_styles()['InvoiceTitle']
+
+    # Add Title
+    elements.append(Paragraph("PURCHASE INVOICE", title_style))
+
+    # Add logo
+    logo = get_logo_image()
+    if logo is not None:
+        logo.hAlign = 'CENTER'  # Align the logo to the center of its cell
+    else:
+        logo = ""
+
+    # Add Vendor Info Table with yellow highlights
+    vendor_data = [
+        ["Name:", invoice.vendor.name, "DATE", invoice.date.strftime('%d-%m-%Y')],
+        ["Contact No:", invoice.vendor.contact_number, "INVOICE NO.", invoice.invoice_number],
+        ["Area:", invoice.vendor.area, "LOT NO.", invoice.lot_number],
+        
+    ]
+    vendor_table = Table(vendor_data, colWidths=[1*inch, 2*inch, 1*inch, 1.15*inch])
+    vendor_table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),  # Grid lines for table
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),  # Align text to the left
+        ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),  # Font for the table
+        ('FONTSIZE', (0, 0), (-1, -1), 10),  # Font size
+        ('BACKGROUND', (0, 0), (0, 0), colors.yellow),  # Highlight "Name:" in yellow
+        ('BACKGROUND', (0, 1), (0, 1), colors.yellow),  # Highlight "Contact No:" in yellow
+        ('BACKGROUND', (0, 2), (0, 2), colors.yellow),  # Highlight "Area:" in yellow
+        ('BACKGROUND', (2, 0), (2, 0), colors.yellow),  # Highlight "DATE" in yellow
+        ('BACKGROUND', (2, 1), (2, 1), colors.yellow),  # Highlight "INVOICE NO." in yellow
+        ('BACKGROUND', (2, 2), (2, 2), colors.yellow),  # Highlight "LOT NO." in yellow
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),  # Black text for headers
+    ]))
+
+    # Create a new table to place the logo and vendor info side by side
+    side_by_side_table = Table([[logo, vendor_table]], colWidths=[2.5*inch, 5*inch])  # Adjust widths as needed
+
+    # Add the side-by-side table to the elements list
+    elements.append(side_by_side_table)
+    elements.append(Spacer(1, 20))  # Add space after the logo and table
+
+    
+
+    # Product Table with yellow header
+    product_data = [
+        ["S/No", "Product Name", "QTY in Kg's", "UNIT PRICE", "Damage", "Discount", "Rotten", "Unloading", "TOTAL"]
+    ]
+    for idx, product in enumerate(invoice.purchase_products.all(), start=1):
+        product_data.append([
+            idx, product.product.name, f"{product.quantity:.2f}", f"₹{product.price:.2f}",
+            f"{product.damage:.2f}%", f"{product.discount:.2f}%", f"{product.rotten:.2f}",
+            f"₹{product.loading_unloading:.2f}", f"₹{product.total:.2f}"
+        ])
+    product_table = LongTable(product_data, colWidths=[0.4*inch, 1.5*inch, 0.8*inch, 0.8*inch, 1*inch, 0.8*inch, 0.8*inch, 1*inch, 0.9*inch])
+    product_table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.yellow),  # Yellow background for header
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 1), (-1, -1), 'DejaVuSans'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),  # Black text for header
+    ]))
+    elements.append(product_table)
+    elements.append(Spacer(1, 20))
+
+    # Paid Amounts Section
+    paid_data = [["Paid Amount", "Date"]]
+    for payment in invoice.payments.all():  # Assuming 'payments' is a related name for payments in the PurchaseInvoice model
+        paid_data.append([f"₹{payment.amount:.2f}", payment.date.strftime('%Y-%m-%d')])
+
+    paid_data.append(["Total Paid:", f"₹{invoice.paid_amount:.2f}"])
+
+    paid_table = Table(paid_data, colWidths=[2*inch, 1.8*inch])
+    paid_table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
+        ('BACKGROUND', (0, 0), (0, 0), colors.yellow),  # Yellow header for "Paid Amount" and "Date"
+        ('FONTNAME', (0, -1), (-1, -1), 'DejaVuSans-Bold'),  # Bold for Total Paid row
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),  # Black text for header
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('FONTSIZE', (0, -1), (-1, -1), 12),  # Larger font for Total Paid
+    ]))
+    
+    # Payment Summary with yellow highlighting
+    payment_data = [
+        ["NET TOTAL", f"₹{invoice.net_total:.2f}"],
+        ["2% CASH COMMISSION", f"₹{(invoice.net_total * Decimal('0.02')):.2f}"],
+        ["NET TOTAL AFTER CASH CUTTING", f"₹{invoice.net_total_after_cash_cutting:.2f}"],
+        ["TOTAL PAID", f"₹{invoice.paid_amount:.2f}"],
+        ["BALANCE DUE", f"₹{invoice.due_amount:.2f}"],
+    ]
+    
+
+    payment_table = Table(payment_data, colWidths=[2.5*inch, 1.4*inch])
+    payment_table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
+        ('FONTNAME', (0, -1), (-1, -1), 'DejaVuSans-Bold'),  
+    
+
+        ('BACKGROUND', (0, 0), (-1, 0), colors.yellow),  # Yellow background for the header
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),  # Black text for header
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ]))
+    
+    #elements.append(payment_table)
+    paid_and_payment_table = Table(
+        [[paid_table, payment_table]],  # Add both tables as cells in a single row
+        colWidths=[4*inch, 4*inch]  # Adjust column widths as needed
+    )
+
+    
+
+    # Add the combined table to the elements list
+    elements.append(paid_and_payment_table)
+    elements.append(Spacer(1, 20))
+    
+    # Build PDF
+    doc.build(elements)
+    return buffer.getvalue()
+
+def get_sales_invoice_pdf(invoice, hide_payments=False):
+    """Path of the cached sales invoice PDF, rendering it on a cache miss."""
+    def render():
+        full_invoice = SalesInvoice.objects.select_related('vendor').prefetch_related(
+            'sales_products__product', 'sales_lots__purchase_invoice', 'payments'
+        ).get(pk=invoice.pk)
+        return render_sales_invoice_pdf(full_invoice, hide_payments=hide_payments)
+
+    # The variant without payments is a different document
+    variant = 'hide_payments' if hide_payments else ''
+    return get_cached_pdf('sales_invoice', invoice, render, variant=variant)
+
+
+def render_sales_invoice_pdf(invoice, hide_payments=False):
+    """Build the sales invoice with ReportLab and return the PDF bytes."""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=letter,
+        rightMargin=20,
+        leftMargin=20,
+        topMargin=20,
+        bottomMargin=30
+    )
+
+    elements = []
+    title_style = get_styles()['InvoiceTitle']
+
+    
+
+    # Add Title
+    elements.append(Paragraph("SALES INVOICE", title_style))
+    elements.append(Spacer(1, 12))
+
+    # Add logo
+    # Logo and Header Section
+    logo_header_table = []
+
+    # Add Logo (if available)
+    logo = get_logo_image()
+    if logo is not None:
+        try:
+            logo.hAlign = 'CENTER'
+            # Create a logo cell with proper padding
+            logo_cell = [[logo]]
+            logo_table = Table(logo_cell, hAlign='LEFT')
+            logo_table.setStyle(TableStyle([
+                ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+                ('LEFTPADDING', (0,0), (-1,-1), 10),
+            ]))
+            logo_header_table.append(logo_table)
+        except Exception as e:
+            print(f"Error loading logo: {str(e)}")
+
+    # Create header table
+    header_data = [
+        ["",""],
+        [ "Invoice Number:", invoice.invoice_number, "Date:", invoice.date.strftime('%d-%m-%Y')],
+        ["Vendor Name:", invoice.vendor.name,],
+        ["Contact No:", invoice.vendor.contact_number or "N/A", "Vehicle No.", invoice.vehicle_number or "N/A" ],
+        [ "Reference", invoice.reference or "", "Gross Vehicle Weight:", f"{invoice.gross_vehicle_weight}"],
+        ["LOT NO:", ", ".join([sl.purchase_invoice.lot_number for sl in invoice.sales_lots.all()]) or "N/A", "", ""],
+    ]
+
+    header_table = Table(header_data, colWidths=[1.25*inch, 1.5*inch, 1.75*inch, 1.5*inch])
+    header_table.setStyle(TableStyle([
+      
+        
+        ('SPAN', (1, 5), (3, 5)),  # (col_start, row_start), (col_end, row_end)
+        ('SPAN', (1, 2), (3, 2)),  # (col_start, row_start), (col_end, row_end)
+    # Align LOT NO text to the left
+        ('ALIGN', (1, 5), (3, 5), 'LEFT'),
+        ('GRID', (0,1), (-1,-1), 0.5, colors.grey),
+        ('FONTNAME', (2,1), (3,-1), 'Helvetica-Bold'),
+        ('FONTNAME', (0,1), (3,-1), 'Helvetica-Bold'),
+        ('ALIGN', (2,1), (3,-1), 'RIGHT'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('BACKGROUND', (0, 1), (0, 1), colors.yellow), 
+        ('BACKGROUND', (0, 2), (0, 2), colors.yellow), 
+        ('BACKGROUND', (0, 3), (0, 3), colors.yellow), 
+        ('BACKGROUND', (0, 4), (0, 4), colors.yellow),
+        ('BACKGROUND', (2, 1), (2, 1), colors.yellow), 
+        ('BACKGROUND', (2, 3), (2, 3), colors.yellow), 
+       
+        ('BACKGROUND', (2, 4), (2, 4), colors.yellow),
+        ('BACKGROUND', (0, 5), (0, 5), colors.yellow),
+    ]))
+
+    # Combine logo and header into a single row
+    if logo_header_table:
+        final_header = [[logo_header_table[0], header_table]]
+        col_widths = [2.5*inch, 6.5*inch]
+    else:
+        final_header = [[header_table]]
+        col_widths = [8.5*inch]
+
+    main_header = Table(final_header, colWidths=col_widths)
+    main_header.setStyle(TableStyle([
+        ('VALIGN', (0,0), (-1,-1), 'TOP'),
+        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+    ]))
+
+    elements.append(main_header)
+    elements.append(Spacer(1, 20))
+
+    # Sales Product Table - Improved layout
+    product_header = [
+        "S/No", "Product", "Gross Weight", "Net Weight", 
+        "Price/Kg", "Discount", "Rotten", "Total"
+    ]
+    product_data = [product_header]
+    
+    for idx, sp in enumerate(invoice.sales_products.all(), start=1):
+        product_data.append([
+            str(idx),
+            sp.product.name,
+            f"{sp.gross_weight:.2f} Kg",
+            f"{sp.net_weight:.2f} Kg",
+            f"₹ {sp.price:.2f}",
+            f"{sp.discount:.2f}%",
+            f"{sp.rotten:.2f} Kg",
+            f"₹{sp.total:.2f}"
+        ])
+    
+    product_table = Table(product_data, 
+                         colWidths=[0.4*inch, 1.8*inch, 1*inch, 1*inch, 
+                                   0.9*inch, 0.8*inch, 0.9*inch, 1.2*inch])
+    
+    product_table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.yellow),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'DejaVuSans-Bold'),
+        ('FONTNAME', (0, 1), (-1, -1), 'DejaVuSans'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ]))
+    
+    elements.append(product_table)
+    elements.append(Spacer(1, 20))
+
+    # Enhanced Summary Section
+    summary_data = [
+        ["Total Gross Weight:", f"{invoice.total_gross_weight:.2f} Kg"],
+        ["Net Total:", f"₹{invoice.net_total:.2f}"],
+        ["Commission:", f"₹{invoice.net_total_after_commission - invoice.net_total:.2f}"],
+        ["Net Total After Commission:", f"₹{invoice.net_total_after_commission:.2f}"],
+        ["Number of Crates:", f"{invoice.no_of_crates or 0}"],
+        ["Cost Per Crate:", f"₹{invoice.cost_per_crate or 0:.2f}"],
+        ["Packaging & Loading Cost:", f"₹{invoice.packaging_total:.2f}"],
+        ["Final Total:", f"₹{invoice.net_total_after_packaging:.2f}"]
+        #["TOTAL PAID", f"₹{invoice.paid_amount:.2f}"],
+        #["BALANCE DUE", f"₹{invoice.due_amount:.2f}"],
+    ]
+    
+    summary_table = Table(summary_data, colWidths=[2.5*inch, 1.5*inch])
+    summary_table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
+        ('FONTNAME', (0, 0), (0, -1), 'DejaVuSans-Bold'),
+        ('BACKGROUND', (0, 0), (0, 0), colors.yellow),
+        ('BACKGROUND', (0, 0), (0, 1), colors.yellow),
+        ('BACKGROUND', (0, 0), (0, 2), colors.yellow),
+        ('BACKGROUND', (0, 0), (0, 3), colors.yellow),
+        ('BACKGROUND', (0, 0), (0, 4), colors.yellow),
+        ('BACKGROUND', (0, 0), (0, 5), colors.yellow),
+        ('BACKGROUND', (0, 0), (0, 6), colors.yellow),
+        ('BACKGROUND', (0, 0), (0, 7), colors.yellow),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+         ('FONTSIZE', (0, 7), (0, 7), 14),
+         ('FONTSIZE', (1, 7), (1, 7), 14),
+         ('FONTNAME', (1, 7), (1, 7), 'DejaVuSans-Bold'),
+        ('TEXTCOLOR', (0, -1), (0, -1), colors.black),
+        ('BOTTOMPADDING', (0, -1), (-1, -1), 12),
+    ]))
+    
+    left_aligned_summary = Table([[summary_table]], colWidths=[4*inch])
+    left_aligned_summary.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 140),
+    ]))
+
+    elements.append(left_aligned_summary)
+    elements.append(Spacer(1, 25))
+    if not hide_payments:
+    # Payment Details Section
+    # Payment Details Section - Updated to match purchase invoice style
+        paid_data = [["Paid Amount", "Date"]]
+        for payment in invoice.payments.all():
+            paid_data.append([f"₹{payment.amount:.2f}", payment.date.strftime('%Y-%m-%d')])
+        paid_data.append(["Total Paid:", f"₹{invoice.paid_amount:.2f}"])
+
+        paid_table = Table(paid_data, colWidths=[2*inch, 1.8*inch])
+        paid_table.setStyle(TableStyle([
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
+            ('BACKGROUND', (0, 0), (0, 0), colors.yellow),
+            ('BACKGROUND', (1, 0), (1, 0), colors.yellow),
+            ('FONTNAME', (0, -1), (-1, -1), 'DejaVuSans-Bold'),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('FONTSIZE', (0, -1), (-1, -1), 12),
+        ]))
+
+        # Payment Summary Table with yellow highlights
+        payment_summary_data = [
+            ["NET TOTAL", f"₹{invoice.net_total_after_packaging:.2f}"],
+            ["TOTAL PAID", f"₹{invoice.paid_amount:.2f}"],
+            ["BALANCE DUE", f"₹{invoice.due_amount:.2f}"],
+        ]
+        
+        payment_summary_table = Table(payment_summary_data, colWidths=[2.5*inch, 1.4*inch])
+        payment_summary_table.setStyle(TableStyle([
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
+            ('FONTNAME', (0, -1), (-1, -1), 'DejaVuSans-Bold'),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.yellow),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ]))
+
+        # Combine payment tables side by side
+        combined_payments = Table([[paid_table, payment_summary_table]],
+                                colWidths=[4*inch, 4*inch])
+        
+        elements.append(combined_payments)
+        elements.append(Spacer(1, 20))
+
+    # Build PDF
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def render_to_pdf(template_path, context):
+    response = HttpResponse(content_type='application/pdf')
+    response['Content-Disposition'] = 'filename="document.pdf"'
+    
+    template = get_template(template_path)
+    html = template.render(context)
+
+    pisa_status = pisa.CreatePDF(
+        html, dest=response,
+        encoding='UTF-8'
+    )
+
+    if pisa_status.err:
+        return HttpResponse('Error generating PDF')
+    return response
+
+
+def render_packaging_invoice_pdf(invoice):
+    """Build the packaging invoice with ReportLab and return the PDF bytes."""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter,
+                          rightMargin=20, leftMargin=20,
+                          topMargin=20, bottomMargin=30)
+    
+    elements = []
+    
+    # Add Logo and Header
+    logo_header = []
+    logo = get_logo_image()
+    
+    if logo is not None:
+        try:
+            logo.hAlign = 'LEFT'
+            logo_table = Table([[logo]], colWidths=[2*inch])
+            logo_table.setStyle(TableStyle([
+                ('VALIGN', (0,0), (-1,-1), 'LEFT'),
+                ('LEFTPADDING', (0,0), (-1,-1), -50),
+            ]))
+            logo_header.append(logo_table)
+        except Exception as e:
+            print(f"Error loading logo: {str(e)}")
+    
+    # Create header table
+    header_data = [
+        ["PACKAGING INVOICE", ""],
+        ["Invoice ID:", f"PKG-{invoice.id}"],  # Using invoice ID instead of date
+    ]
+    
+    header_table = Table(header_data, colWidths=[3*inch, 3*inch])
+    header_table.setStyle(TableStyle([
+        ('FONTNAME', (0,0), (-1,-1), 'DejaVuSans'),
+        ('FONTSIZE', (0,0), (-1,0), 14),
+        ('FONTNAME', (0,0), (-1,0), 'DejaVuSans-Bold'),
+        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+    ]))
+    
+    # Combine logo and header
+    if logo_header:
+        main_header = Table([[logo_header[0], header_table]], 
+                          colWidths=[2*inch, 4*inch])
+    else:
+        main_header = header_table
+        
+    elements.append(main_header)
+    elements.append(Spacer(1, 20))
+    
+    invoice_data = [
+        ["Number of Crates:", str(invoice.no_of_crates)],
+        ["Cost Per Crate:", f"₹{invoice.cost_per_crate:.2f}"],
+        ["Total Packaging Cost:", f"₹{invoice.packaging_total:.2f}"]
+    ]
+    
+    invoice_table = Table(invoice_data, colWidths=[2*inch, 4*inch])
+    invoice_table.setStyle(TableStyle([
+        ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
+        ('FONTNAME', (0,0), (-1,0), 'DejaVuSans-Bold'),
+        ('FONTNAME', (0,1), (-1,-1), 'DejaVuSans'),
+        ('BACKGROUND', (0,0), (-1,0), colors.yellow),
+        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+    ]))
+    
+    elements.append(invoice_table)
+    elements.append(Spacer(1, 20))
+    
+    # Footer
+    footer_style = get_styles()['InvoiceFooter']
+    footer_text = '''<para>
+    Prepared By: _______________________ &nbsp;&nbsp;&nbsp;&nbsp; 
+    Approved By: _______________________<br/>
+    Signature: _______________________ &nbsp;&nbsp;&nbsp;&nbsp; 
+    Signature: _______________________
+    </para>'''
+    
+    elements.append(Paragraph(footer_text, footer_style))
+    
+    doc.build(elements)
+    return buffer.getvalue()
@@ -0,0 +1,181 @@
+"""
+Batch printing of sales invoices.
+
+Invoices are rendered in a pool of worker processes with the same ReportLab
+layout as the single invoice view, going through the PDF cache so anything
+printed before is reused. The results are merged into one PDF or packed into
+a ZIP. The render_sales_invoices command runs this from the shell, and the
+admin action runs the same command in a detached process so no web worker
+waits on it.
+
+The detached process writes its output to invoice_batches/invoices_<id>.log
+and touches the job's updated_at with every status and progress change. A
+process that dies without marking its job failed (killed, or crashed before
+Django was set up) leaves it pending or running: expire_stale_jobs(), called
+by the admin, fails jobs not heard from in settings.PRINT_JOB_TIMEOUT seconds
+(default 300) with the end of their log as the error.
+"""
+import os
+import subprocess
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+import multiprocessing
+
+from django.conf import settings
+from django.utils import timezone
+
+# Models are imported inside the functions: spawned workers import this module
+# before Django is set up.
+
+
+def _init_worker():
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def _render_invoice(invoice_id, hide_payments):
+    """Worker: render (or fetch from the cache) one invoice, return its file path."""
+    from .models import SalesInvoice
+    from .pdf import get_sales_invoice_pdf
+
+    invoice = SalesInvoice.objects.only('id', 'invoice_number', 'version').get(pk=invoice_id)
+    path = get_sales_invoice_pdf(invoice, hide_payments=hide_payments)
+    return invoice_id, invoice.invoice_number, str(path)
+
+
+def render_invoice_batch(invoice_ids, output_path, output_format='pdf', hide_payments=False,
+                         workers=None, progress=None):
+    """
+    Render the given sales invoices in a process pool and write them, in the
+    given order, to `output_path` as one merged PDF or a ZIP file.
+    `progress(done, total)` is called as invoices finish.
+    """
+    from django.db import connections
+
+    invoice_ids = list(invoice_ids)
+    total = len(invoice_ids)
+    workers = workers or min(os.cpu_count() or 1, 8)
+    rendered = {}
+
+    # Worker processes open their own connections
+    connections.close_all()
+    if workers > 1 and total > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+        ) as pool:
+            futures = [pool.submit(_render_invoice, pk, hide_payments) for pk in invoice_ids]
+            for future in as_completed(futures):
+                invoice_id, number, path = future.result()
+                rendered[invoice_id] = (number, path)
+                if progress:
+                    progress(len(rendered), total)
+    else:
+        for pk in invoice_ids:
+            invoice_id, number, path = _render_invoice(pk, hide_payments)
+            rendered[invoice_id] = (number, path)
+            if progress:
+                progress(len(rendered), total)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    if output_format == 'zip':
+        with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for pk in invoice_ids:
+                number, path = rendered[pk]
+                archive.write(path, arcname=f"sales_invoice_{number}.pdf")
+    else:
+        from pypdf import PdfWriter
+
+        writer = PdfWriter()
+        for pk in invoice_ids:
+            writer.append(rendered[pk][1])
+        with open(output_path, 'wb') as output_file:
+            writer.write(output_file)
+    return output_path
+
+
+def run_batch_job(job, workers=None):
+    """Run an InvoiceBatchJob, recording progress and the output file on it."""
+    from .models import InvoiceBatchJob, SalesInvoice
+
+    jobs = InvoiceBatchJob.objects.filter(pk=job.pk)
+
+    def update(**fields):
+        # update() skips auto_now
+        jobs.update(updated_at=timezone.now(), **fields)
+
+    name = f"invoice_batches/invoices_{job.pk}.{job.output_format}"
+    try:
+        # Keep the order of the sales list: newest first
+        invoice_ids = list(
+            SalesInvoice.objects.filter(pk__in=job.invoice_ids).order_by('-date', '-id').values_list('pk', flat=True)
+        )
+        update(status='running', total=len(invoice_ids), done=0)
+        render_invoice_batch(
+            invoice_ids,
+            os.path.join(settings.MEDIA_ROOT, name),
+            output_format=job.output_format,
+            hide_payments=job.hide_payments,
+            workers=workers,
+            progress=lambda done, total: update(done=done),
+        )
+    except Exception as e:
+        update(status='failed', error=str(e))
+        raise
+    update(status='done', output=name)
+
+
+def job_log_path(job_id):
+    return os.path.join(settings.MEDIA_ROOT, 'invoice_batches', f"invoices_{job_id}.log")
+
+
+def start_batch_job(job):
+    """
+    Run the job in a detached `manage.py render_sales_invoices --job` process,
+    its output going to the job's log. Returns the Popen.
+    """
+    log_path = job_log_path(job.pk)
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, 'ab') as log:
+        return subprocess.Popen(
+            [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'render_sales_invoices',
+             '--job', str(job.pk)],
+            cwd=settings.BASE_DIR,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+
+
+def _log_tail(job_id, size=2000):
+    try:
+        with open(job_log_path(job_id), 'rb') as log:
+            log.seek(0, os.SEEK_END)
+            log.seek(max(log.tell() - size, 0))
+            return log.read().decode('utf-8', 'replace').strip()
+    except OSError:
+        return ''
+
+
+def expire_stale_jobs():
+    """
+    Fail the pending or running jobs whose process has not updated them in
+    PRINT_JOB_TIMEOUT seconds. Returns the number of jobs failed.
+    """
+    from .models import InvoiceBatchJob
+
+    timeout = timedelta(seconds=getattr(settings, 'PRINT_JOB_TIMEOUT', 300))
+    stale = InvoiceBatchJob.objects.filter(status__in=('pending', 'running'),
+                                           updated_at__lt=timezone.now() - timeout)
+    expired = 0
+    for job_id in stale.values_list('pk', flat=True):
+        error = f"The print process stopped without finishing the job.\n{_log_tail(job_id)}".strip()
+        # Unless the process finished it in the meantime
+        expired += stale.filter(pk=job_id).update(status='failed', error=error, updated_at=timezone.now())
+    return expired
@@ -0,0 +1,71 @@
+"""
+Content-addressed cache for rendered invoice PDFs.
+
+A PDF is stored under the SHA-256 of (kind, invoice id, invoice version,
+variant, layout version). The invoice `version` column is bumped whenever the
+invoice, its line items, lots or payments change, so a stale copy is never
+looked up again; storing the new copy deletes the invoice's older copies of
+the same variant, so the cache holds one file per invoice and variant. Files
+live in settings.PDF_CACHE_ROOT under <kind>/<invoice id>/, shared by all
+workers, and are written atomically so a concurrent reader never sees half a
+PDF (one already streaming a deleted copy keeps reading it).
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse
+
+# Bump when the ReportLab layout code changes to invalidate every cached PDF.
+LAYOUT_VERSION = 1
+
+
+def pdf_cache_root():
+    return Path(getattr(settings, 'PDF_CACHE_ROOT', Path(settings.BASE_DIR) / 'pdf_cache'))
+
+
+def pdf_cache_key(kind, invoice, variant=''):
+    raw = f"{kind}:{invoice.pk}:{invoice.version}:{variant}:{LAYOUT_VERSION}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def pdf_cache_path(kind, invoice, variant=''):
+    directory = pdf_cache_root() / kind / str(invoice.pk)
+    return directory / f"{variant or 'default'}-{pdf_cache_key(kind, invoice, variant)}.pdf"
+
+
+def _remove_stale_copies(path):
+    """Delete the other copies of the same invoice and variant (older versions or layouts)."""
+    prefix = path.name.split('-', 1)[0] + '-'
+    for stale in path.parent.glob(f"{prefix}*.pdf"):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+
+
+def get_cached_pdf(kind, invoice, render, variant=''):
+    """
+    Return the path of the cached PDF for this invoice version, calling
+    `render()` (which returns the PDF bytes) only on a cache miss.
+    """
+    path = pdf_cache_path(kind, invoice, variant)
+    if not path.exists():
+        content = render()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        _remove_stale_copies(path)
+    return path
+
+
+def pdf_file_response(path, filename):
+    """Stream a cached PDF from disk."""
+    return FileResponse(open(path, 'rb'), content_type='application/pdf', filename=filename)
@@ -0,0 +1,188 @@
+"""
+Per-lot profitability: what a lot cost, what it sold for and what was lost.
+
+For each lot (PurchaseInvoice):
+
+    cost     the purchase total (PurchaseProduct.total) plus loading/unloading
+    loss     damaged and rotten kg (damage % of the quantity plus rotten kg)
+             and their value at the purchase price
+    sold     kg taken from the lot by sales invoices (SalesLot.quantity)
+    revenue  each sales invoice's line item total (net_total), shared among
+             the lots it used pro rata by SalesLot.quantity
+    margin   revenue - cost
+
+lot_margins() handles any number of lots with grouped queries: one for the
+cache keys, then, for the lots not cached, one for the purchase sums and one
+for their SalesLot rows with the invoice total and kg. The revenue is then
+allocated in one vectorised step with NumPy (bincount over the SalesLot rows,
+fetched as floats; NumPy is in requirements.txt), or a plain Decimal loop
+where it is missing; both round to paise.
+
+Each lot's figures are cached under its version and a hash of the (id,
+version) pairs of the sales invoices it was sold on. Line items, lots,
+SalesLot rows and payments all bump those, so a change simply makes a new key
+and the old entry is never read again. The lot number, date and vendor name
+come from the key query, not the cache, so a renamed vendor shows at once.
+"""
+import hashlib
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import (
+    CharField, DecimalField, ExpressionWrapper, F, FloatField, OuterRef, Subquery, Sum, Value,
+)
+from django.db.models.functions import Cast, Coalesce, Concat
+
+from .models import GroupConcat, PurchaseInvoice, PurchaseProduct, SalesLot
+from .reporting import filter_report_dates
+
+try:
+    import numpy
+except ImportError:  # the allocation falls back to a Decimal loop
+    numpy = None
+
+AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+ZERO = Decimal('0.00')
+# Lots per query, to stay well inside SQLite's limit on query parameters
+CHUNK_SIZE = 2000
+
+FIELDS = (
+    'lot_number', 'date', 'vendor', 'purchased_kg', 'sold_kg', 'loss_kg', 'loss_value', 'purchase_total',
+    'loading_unloading', 'cost', 'revenue', 'margin', 'margin_percent',
+)
+# Summed by season_report()
+TOTAL_FIELDS = (
+    'purchased_kg', 'sold_kg', 'loss_kg', 'loss_value', 'purchase_total', 'loading_unloading', 'cost', 'revenue',
+    'margin',
+)
+
+
+def _cents(value):
+    return Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def _timeout():
+    return getattr(settings, 'LOT_PROFIT_CACHE_TIMEOUT', 24 * 3600)
+
+
+def _cache_key(lot):
+    # GROUP_CONCAT has no defined order: sort the "invoice id:version" pairs
+    pairs = sorted(lot['sales_invoices'].split(', ')) if lot['sales_invoices'] else []
+    digest = hashlib.sha256(' '.join(pairs).encode('ascii')).hexdigest()
+    return f"lot_margin:{lot['pk']}:{lot['version']}:{digest}"
+
+
+def _purchase_sums(lot_ids):
+    lost_kg = F('quantity') * F('damage') / 100 + F('rotten')
+    return {
+        row.pop('invoice'): row
+        for row in PurchaseProduct.objects.filter(invoice__in=lot_ids).order_by().values('invoice').annotate(
+            purchased_kg=Sum('quantity'),
+            purchase_total=Sum('total'),
+            loading_unloading=Sum('loading_unloading'),
+            loss_kg=Sum(ExpressionWrapper(lost_kg, output_field=AMOUNT)),
+            loss_value=Sum(ExpressionWrapper(lost_kg * F('price'), output_field=AMOUNT)),
+        )
+    }
+
+
+def _sales_rows(lot_ids):
+    """
+    (lot id, kg, invoice net_total, invoice kg over all its lots) per SalesLot
+    of the lots; as floats for NumPy, which skips the Decimal conversions.
+    """
+    output_field = FloatField() if numpy is not None else AMOUNT
+    invoice_kg = (
+        SalesLot.objects.filter(sales_invoice=OuterRef('sales_invoice')).order_by().values('sales_invoice')
+        .annotate(total=Sum('quantity')).values('total')
+    )
+    return list(
+        SalesLot.objects.filter(purchase_invoice__in=lot_ids).annotate(
+            kg=Cast('quantity', output_field),
+            invoice_total=Cast('sales_invoice__net_total', output_field),
+            invoice_kg=Coalesce(Subquery(invoice_kg), Value(0), output_field=output_field),
+        ).values_list('purchase_invoice_id', 'kg', 'invoice_total', 'invoice_kg')
+    )
+
+
+def allocate(lot_ids, rows):
+    """
+    {lot id: (sold kg, revenue)} from (lot id, kg, invoice total, invoice kg)
+    rows: every invoice total is shared among its lots by kg.
+    """
+    if numpy is not None and rows:
+        positions = {lot_id: position for position, lot_id in enumerate(lot_ids)}
+        lots = numpy.fromiter((positions[row[0]] for row in rows), dtype=numpy.intp, count=len(rows))
+        kg, totals, invoice_kg = (numpy.array(column, dtype=float) for column in list(zip(*rows))[1:])
+        share = numpy.divide(kg, invoice_kg, out=numpy.zeros_like(kg), where=invoice_kg > 0)
+        sold = numpy.bincount(lots, weights=kg, minlength=len(lot_ids))
+        revenue = numpy.bincount(lots, weights=totals * share, minlength=len(lot_ids))
+        return {
+            lot_id: (_cents(sold[position]), _cents(revenue[position])) for lot_id, position in positions.items()
+        }
+
+    sold, revenue = defaultdict(Decimal), defaultdict(Decimal)
+    for lot_id, kg, total, invoice_kg in rows:
+        sold[lot_id] += kg
+        if invoice_kg:
+            revenue[lot_id] += total * kg / invoice_kg
+    return {lot_id: (_cents(sold[lot_id]), _cents(revenue[lot_id])) for lot_id in lot_ids}
+
+
+def _margins(lots):
+    """Figures of the given lot rows (dicts with pk), without lot_number, date and vendor."""
+    lot_ids = [lot['pk'] for lot in lots]
+    purchases = _purchase_sums(lot_ids)
+    sales = allocate(lot_ids, _sales_rows(lot_ids))
+    margins = {}
+    for lot in lots:
+        bought = purchases.get(lot['pk'], {})
+        figures = {field: _cents(bought.get(field) or ZERO) for field in (
+            'purchased_kg', 'loss_kg', 'loss_value', 'purchase_total', 'loading_unloading')}
+        figures['sold_kg'], figures['revenue'] = sales[lot['pk']]
+        figures['cost'] = figures['purchase_total'] + figures['loading_unloading']
+        figures['margin'] = figures['revenue'] - figures['cost']
+        figures['margin_percent'] = (
+            _cents(figures['margin'] / figures['revenue'] * 100) if figures['revenue'] else None
+        )
+        margins[lot['pk']] = figures
+    return margins
+
+
+def lot_margins(lots=None):
+    """
+    {lot id: figures} for a PurchaseInvoice queryset (all lots by default),
+    in its order. Figures is a dict with the FIELDS keys.
+    """
+    lots = PurchaseInvoice.objects.all() if lots is None else lots
+    if not lots.query.order_by:
+        lots = lots.order_by('date', 'pk')
+    rows = list(lots.annotate(
+        sales_invoices=GroupConcat(Concat(
+            'sales_lots__sales_invoice', Value(':'), 'sales_lots__sales_invoice__version', output_field=CharField(),
+        )),
+    ).values('pk', 'version', 'sales_invoices', 'lot_number', 'date', 'vendor__name'))
+
+    keys = {lot['pk']: _cache_key(lot) for lot in rows}
+    cached = cache.get_many(keys.values())
+    margins = {lot_id: cached[key] for lot_id, key in keys.items() if key in cached}
+    missing = [lot for lot in rows if lot['pk'] not in margins]
+    for start in range(0, len(missing), CHUNK_SIZE):
+        computed = _margins(missing[start:start + CHUNK_SIZE])
+        cache.set_many({keys[lot_id]: figures for lot_id, figures in computed.items()}, _timeout())
+        margins.update(computed)
+    return {
+        lot['pk']: {**margins[lot['pk']], 'lot_number': lot['lot_number'], 'date': lot['date'],
+                    'vendor': lot['vendor__name']}
+        for lot in rows
+    }
+
+
+def season_report(start_date=None, end_date=None):
+    """The figures of the lots bought in the date range, and their totals."""
+    margins = lot_margins(filter_report_dates(PurchaseInvoice.objects.all(), start_date, end_date))
+    totals = {field: sum((figures[field] for figures in margins.values()), ZERO) for field in TOTAL_FIELDS}
+    totals['margin_percent'] = _cents(totals['margin'] / totals['revenue'] * 100) if totals['revenue'] else None
+    return list(margins.values()), totals
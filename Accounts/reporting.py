@@ -0,0 +1,190 @@
+"""
+Report figures for a date range in a fixed, small number of queries.
+
+Sales, purchase, expense and damage totals are summed from the daily rollup
+tables (rollups.py), at most one row per day, never from the raw line items.
+All totals and counts come from one UNION of grouped queries (one row per
+figure), the top products and customers from one annotated query each and the
+recent sales and purchases from one query each, whatever the size of the
+history.
+
+The queries of a page are independent of each other: report_queries() and
+dashboard_queries() hand them out by name, so the async views (views.py)
+can run them at the same time and the sync views one after the other.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, CharField, Count, DecimalField, Q, Sum, Value, When
+from django.db.models.functions import Concat
+
+from .models import Customer, DailySummary, Product, PurchaseInvoice, SalesInvoice, SalesPayment
+from .stock import IN_STOCK, LOW_STOCK, OUT_OF_STOCK
+
+
+def filter_report_dates(queryset, start_date, end_date, field='date'):
+    """Apply the reports start/end date filters (either may be None)."""
+    if start_date:
+        queryset = queryset.filter(**{f'{field}__gte': start_date})
+    if end_date:
+        queryset = queryset.filter(**{f'{field}__lte': end_date})
+    return queryset
+
+
+def _grouped(queryset, kind, amount):
+    """(kind, amount, count) rows of `queryset`, grouped by the `kind` expression."""
+    return queryset.order_by().annotate(kind=kind).values('kind').annotate(
+        amount=Sum(amount, output_field=DecimalField(max_digits=14, decimal_places=2)),
+        count=Count('pk'),
+    ).values_list('kind', 'amount', 'count')
+
+
+def summary_figures(start_date=None, end_date=None):
+    """
+    Sales, purchase, expense and damage totals, stock status counts and the
+    sales payment mode distribution, in a single query.
+    """
+    text = CharField()
+    days = filter_report_dates(DailySummary.objects.all(), start_date, end_date)
+    rows = _grouped(days, Value('sales', output_field=text), 'sales_total').union(
+        _grouped(days, Value('purchases', output_field=text), 'purchases_total'),
+        _grouped(days, Value('expenses', output_field=text), 'expenses_total'),
+        _grouped(days, Value('damages', output_field=text), 'damages_total'),
+        _grouped(filter_report_dates(SalesPayment.objects.all(), start_date, end_date),
+                 Concat(Value('payment:'), 'payment_mode', output_field=text), 'amount'),
+        # Stock status is a snapshot, not limited to the date range
+        _grouped(Product.objects.all(), Case(
+            When(OUT_OF_STOCK, then=Value('stock:out_of_stock')),
+            When(LOW_STOCK, then=Value('stock:low_stock')),
+            default=Value('stock:in_stock'),
+            output_field=text,
+        ), 'current_stock'),
+        all=True,
+    )
+
+    figures = {kind: (amount or Decimal('0'), count) for kind, amount, count in rows}
+    no_rows = (Decimal('0'), 0)
+    return {
+        'total_sales': figures.get('sales', no_rows)[0],
+        'total_purchases': figures.get('purchases', no_rows)[0],
+        'total_expenses': figures.get('expenses', no_rows)[0],
+        'total_damages': figures.get('damages', no_rows)[0],
+        'inventory_data': {
+            status: figures.get(f'stock:{status}', no_rows)[1]
+            for status in ('in_stock', 'low_stock', 'out_of_stock')
+        },
+        'payment_data': [
+            {
+                'method': label,
+                'count': figures.get(f'payment:{mode}', no_rows)[1],
+                'amount': figures.get(f'payment:{mode}', no_rows)[0],
+            }
+            for mode, label in SalesPayment.PAYMENT_METHOD_CHOICES
+        ],
+    }
+
+
+def period_totals(start_date=None, end_date=None):
+    """Sales, purchase, expense and damage totals of a date range from the daily rollups (one query)."""
+    zero = Decimal('0')
+    return filter_report_dates(DailySummary.objects.all(), start_date, end_date).aggregate(
+        total_sales=Sum('sales_total', default=zero),
+        total_purchases=Sum('purchases_total', default=zero),
+        total_expenses=Sum('expenses_total', default=zero),
+        total_damages=Sum('damages_total', default=zero),
+    )
+
+
+def _rollup_dates(start_date, end_date):
+    """Q on the `daily_sales` rollup rows of a Product / Customer in the date range."""
+    days = Q()
+    if start_date:
+        days &= Q(daily_sales__date__gte=start_date)
+    if end_date:
+        days &= Q(daily_sales__date__lte=end_date)
+    return days
+
+
+def top_products(start_date=None, end_date=None, limit=5):
+    """Best selling products by net weight sold in the date range (one query)."""
+    days = _rollup_dates(start_date, end_date)
+    return Product.objects.annotate(
+        total_quantity=Sum('daily_sales__net_weight', filter=days),
+        total_revenue=Sum('daily_sales__total', filter=days),
+    ).filter(total_quantity__gt=0).order_by('-total_quantity')[:limit]
+
+
+def top_customers(start_date=None, end_date=None, limit=5):
+    """Customers with the highest sales in the date range (one query)."""
+    days = _rollup_dates(start_date, end_date)
+    return Customer.objects.annotate(
+        total_sales=Sum('daily_sales__net_total', filter=days),
+        invoice_count=Sum('daily_sales__invoice_count', filter=days),
+    ).filter(total_sales__gt=0).order_by('-total_sales')[:limit]
+
+
+def report_queries(start_date=None, end_date=None):
+    """The independent queries behind reports_view, {name: callable}, one query each."""
+    return {
+        'summary': lambda: summary_figures(start_date, end_date),
+        'top_products': lambda: list(top_products(start_date, end_date)),
+        'top_customers': lambda: list(top_customers(start_date, end_date)),
+        'recent_sales': lambda: list(
+            filter_report_dates(SalesInvoice.objects.select_related('vendor'), start_date, end_date)
+            .order_by('-date')[:10]
+        ),
+        'recent_purchases': lambda: list(
+            filter_report_dates(PurchaseInvoice.objects.select_related('vendor'), start_date, end_date)
+            .order_by('-date')[:10]
+        ),
+    }
+
+
+def report_from_results(results):
+    """The reports_view figures from the results of report_queries()."""
+    report = dict(results['summary'])
+    report['total_profit'] = report['total_sales'] - (
+        report['total_purchases'] + report['total_expenses'] + report['total_damages']
+    )
+    report['payment_methods'] = [payment['method'] for payment in report['payment_data']]
+    for name in ('top_products', 'top_customers', 'recent_sales', 'recent_purchases'):
+        report[name] = results[name]
+    return report
+
+
+def build_report(start_date=None, end_date=None):
+    """Everything reports_view shows, in five queries."""
+    return report_from_results({name: query() for name, query in report_queries(start_date, end_date).items()})
+
+
+def dashboard_queries():
+    """The independent queries behind dashboard_view, {name: callable}, one query each."""
+    return {
+        # Sales, purchase, expense and damage totals from the daily rollups
+        'totals': period_totals,
+        'recent_sales': lambda: list(SalesInvoice.objects.select_related('vendor').order_by('-date')[:5]),
+        'recent_purchases': lambda: list(PurchaseInvoice.objects.select_related('vendor').order_by('-date')[:5]),
+        'in_stock': lambda: Product.objects.filter(IN_STOCK).count(),
+        'low_stock': lambda: Product.objects.filter(LOW_STOCK).count(),
+        'out_of_stock': lambda: Product.objects.filter(OUT_OF_STOCK).count(),
+        # Top selling products from the daily product rollups
+        'top_products': lambda: list(top_products()),
+    }
+
+
+def dashboard_from_results(results):
+    """The dashboard_view figures from the results of dashboard_queries()."""
+    figures = dict(results['totals'])
+    figures.update({
+        'recent_sales': results['recent_sales'],
+        # Totals are stored on the invoice, so no per-sale query is needed
+        'sales_with_totals': [{'sale': sale, 'total': sale.net_total} for sale in results['recent_sales']],
+        'recent_purchases': results['recent_purchases'],
+        'inventory_data': {status: results[status] for status in ('in_stock', 'low_stock', 'out_of_stock')},
+        'top_products': results['top_products'],
+    })
+    return figures
+
+
+def build_dashboard():
+    """Everything dashboard_view shows, one query after the other."""
+    return dashboard_from_results({name: query() for name, query in dashboard_queries().items()})
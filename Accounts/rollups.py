@@ -0,0 +1,176 @@
+"""
+Daily rollup tables behind the dashboard, home page and reports.
+
+DailySummary (per day), DailyProductSales (per day and product) and
+DailyCustomerSales (per day and customer) hold the sums of the sales line
+items, sales invoices, purchase invoices, expenses and damages. The signal
+handlers in signals.py post every save and delete to them as deltas, an
+`UPDATE ... SET x = x + delta` that creates the row on the first posting, so a
+date range total is a sum over at most one row per day instead of a scan of
+the whole history.
+
+Bulk writes (queryset.update(), bulk_create(), fixture loads) skip the
+signals: post them with the functions below or run `manage.py rebuild_rollups`.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from . import dashboard_cache
+from .models import (
+    DailyCustomerSales, DailyProductSales, DailySummary, Damages, Expense, PurchaseInvoice, SalesInvoice,
+    SalesProduct,
+)
+from .reporting import filter_report_dates
+
+ZERO = Decimal('0.00')
+
+
+def _post(model, key, **deltas):
+    """Add the non-zero `deltas` to the rollup row `key`."""
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**key).update(**changes):
+        return
+    if all(value < 0 for value in deltas.values()):
+        # Taking something off a day that has no row (e.g. rows removed by a
+        # cascaded delete): there is nothing to subtract from.
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        # Another writer created the row in the meantime
+        model.objects.filter(**key).update(**changes)
+
+
+def post_sales_line(invoice_id, product_id, gross_weight=ZERO, net_weight=ZERO, total=ZERO):
+    """Post the (signed) change of one sales line item to the rollups."""
+    post_sales_lines(invoice_id, [(product_id, gross_weight, net_weight, total)])
+
+
+def post_sales_lines(invoice_id, changes):
+    """
+    Post (product_id, gross_weight, net_weight, total) deltas of line items of
+    one invoice, summed per product: a few queries however many lines changed.
+    """
+    per_product = defaultdict(lambda: [ZERO, ZERO, ZERO])
+    for product_id, gross_weight, net_weight, total in changes:
+        sums = per_product[product_id]
+        sums[0] += gross_weight
+        sums[1] += net_weight
+        sums[2] += total
+    if not any(any(sums) for sums in per_product.values()):
+        return
+
+    key = SalesInvoice.objects.filter(pk=invoice_id).values_list('date', 'vendor_id').first()
+    if key is None:
+        return
+    day, customer_id = key
+    total = sum((sums[2] for sums in per_product.values()), ZERO)
+    gross_weight = sum((sums[0] for sums in per_product.values()), ZERO)
+    _post(DailySummary, {'date': day}, sales_total=total, sales_gross_weight=gross_weight)
+    _post(DailyCustomerSales, {'date': day, 'customer_id': customer_id}, net_total=total)
+    for product_id, (gross_weight, net_weight, total) in per_product.items():
+        _post(DailyProductSales, {'date': day, 'product_id': product_id},
+              gross_weight=gross_weight, net_weight=net_weight, total=total)
+
+
+def post_sales_invoice(day, customer_id, count):
+    """Post `count` (+1 / -1) sales invoices of a customer on a day."""
+    _post(DailySummary, {'date': day}, sales_count=count)
+    _post(DailyCustomerSales, {'date': day, 'customer_id': customer_id}, invoice_count=count)
+
+
+def move_sales_invoice(invoice_id, old_date, old_customer_id, new_date, new_customer_id):
+    """Move a sales invoice and its line items to another date and/or customer."""
+    lines = list(
+        SalesProduct.objects.filter(invoice_id=invoice_id).order_by().values('product_id').annotate(
+            line_gross_weight=Sum('gross_weight', default=ZERO),
+            line_net_weight=Sum('net_weight', default=ZERO),
+            line_total=Sum('total', default=ZERO),
+        )
+    )
+    total = sum((line['line_total'] for line in lines), ZERO)
+    gross_weight = sum((line['line_gross_weight'] for line in lines), ZERO)
+
+    for day, customer_id, sign in ((old_date, old_customer_id, -1), (new_date, new_customer_id, 1)):
+        post_sales_invoice(day, customer_id, sign)
+        _post(DailySummary, {'date': day}, sales_total=sign * total, sales_gross_weight=sign * gross_weight)
+        _post(DailyCustomerSales, {'date': day, 'customer_id': customer_id}, net_total=sign * total)
+        for line in lines:
+            _post(DailyProductSales, {'date': day, 'product_id': line['product_id']},
+                  gross_weight=sign * line['line_gross_weight'],
+                  net_weight=sign * line['line_net_weight'],
+                  total=sign * line['line_total'])
+
+
+def post_purchase(day, total=ZERO, count=0):
+    _post(DailySummary, {'date': day}, purchases_total=total, purchases_count=count)
+
+
+def post_expense(day, amount):
+    _post(DailySummary, {'date': day}, expenses_total=amount)
+
+
+def post_damage(day, amount):
+    _post(DailySummary, {'date': day}, damages_total=amount)
+
+
+def rebuild_rollups(start_date=None, end_date=None):
+    """
+    Recompute the rollup rows of the date range (all dates by default) from
+    the raw tables. Returns the number of (summary, product, customer) rows.
+    """
+    def dated(queryset, field='date'):
+        return filter_report_dates(queryset, start_date, end_date, field).order_by()
+
+    summaries = defaultdict(dict)
+    sources = [
+        (SalesProduct, 'invoice__date', {'sales_total': Sum('total', default=ZERO),
+                                         'sales_gross_weight': Sum('gross_weight', default=ZERO)}),
+        (SalesInvoice, 'date', {'sales_count': Count('pk')}),
+        (PurchaseInvoice, 'date', {'purchases_total': Sum('net_total', default=ZERO),
+                                   'purchases_count': Count('pk')}),
+        (Expense, 'date', {'expenses_total': Sum('amount', default=ZERO)}),
+        (Damages, 'date', {'damages_total': Sum('amount_loss', default=ZERO)}),
+    ]
+    for model, day, sums in sources:
+        for row in dated(model.objects.all(), day).values(day).annotate(**sums):
+            summaries[row.pop(day)].update(row)
+
+    products = [
+        DailyProductSales(date=row['invoice__date'], product_id=row['product'], gross_weight=row['line_gross_weight'],
+                          net_weight=row['line_net_weight'], total=row['line_total'])
+        for row in dated(SalesProduct.objects.all(), 'invoice__date').values('invoice__date', 'product').annotate(
+            line_gross_weight=Sum('gross_weight', default=ZERO),
+            line_net_weight=Sum('net_weight', default=ZERO),
+            line_total=Sum('total', default=ZERO),
+        )
+    ]
+
+    customers = defaultdict(dict)
+    for row in dated(SalesInvoice.objects.all()).values('date', 'vendor').annotate(invoice_count=Count('pk')):
+        customers[row['date'], row['vendor']]['invoice_count'] = row['invoice_count']
+    for row in dated(SalesProduct.objects.all(), 'invoice__date').values('invoice__date', 'invoice__vendor').annotate(
+        line_total=Sum('total', default=ZERO),
+    ):
+        customers[row['invoice__date'], row['invoice__vendor']]['net_total'] = row['line_total']
+
+    with transaction.atomic():
+        for model in (DailySummary, DailyProductSales, DailyCustomerSales):
+            dated(model.objects.all()).delete()
+        DailySummary.objects.bulk_create(
+            DailySummary(date=day, **fields) for day, fields in summaries.items()
+        )
+        DailyProductSales.objects.bulk_create(products)
+        DailyCustomerSales.objects.bulk_create(
+            DailyCustomerSales(date=day, customer_id=customer_id, **fields)
+            for (day, customer_id), fields in customers.items()
+        )
+        dashboard_cache.invalidate()
+    return len(summaries), len(products), len(customers)
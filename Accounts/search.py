@@ -0,0 +1,183 @@
+"""
+Global search over sales and purchase invoices, customers, vendors and
+products, backed by an SQLite FTS5 table.
+
+Every searchable object is one row of Accounts_searchindex: a title (invoice
+or lot number, name) and a body (vehicle number, reference, contact, area).
+The rowid encodes the object, `pk * 8 + kind`, so an object's row is replaced
+or removed by rowid without scanning the index. The signal handlers in
+signals.py index each save and delete; bulk writes (bulk_create(), update(),
+generate_data) skip them, so run rebuild_index() or
+`manage.py rebuild_search_index` after those.
+
+search() matches every word of the query as a prefix ("ka01 rav" finds
+KA 01 AB 1234 for Ravi; single characters match whole words only). Objects
+matching the words as whole words come first, so "ravi" shows Ravi before
+Ravindra however many newer Ravindras there are; then bm25 ranks, a title
+match counting ten times a body match. All matches are ranked, in FTS5's
+rank order with the page as LIMIT/OFFSET, so SQLite keeps only the top rows
+while sorting. Pages are fetched one row past the page size instead of
+counting the matches.
+
+The index needs SQLite with FTS5 (any current Python build). On other
+databases nothing is indexed and search() falls back to icontains filters.
+"""
+import re
+from collections import namedtuple
+
+from django.db import connection
+from django.db.models import Q
+from django.urls import reverse
+
+from .models import Customer, Product, PurchaseInvoice, PurchaseVendor, SalesInvoice
+
+TABLE = 'Accounts_searchindex'
+CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+    "title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+# FTS5 rank function, column weights title, body
+RANK = "bm25(10.0, 1.0)"
+PAGE_SIZE = 20
+
+Kind = namedtuple('Kind', 'code name model title_fields body_fields')
+
+# Codes are part of the stored rowids: append new kinds, never renumber
+KINDS = [
+    Kind(0, 'sales_invoice', SalesInvoice, ('invoice_number',), ('vehicle_number', 'reference')),
+    Kind(1, 'purchase_invoice', PurchaseInvoice, ('lot_number', 'invoice_number'), ()),
+    Kind(2, 'customer', Customer, ('name',), ('contact_number', 'address')),
+    Kind(3, 'vendor', PurchaseVendor, ('name',), ('contact_number', 'area')),
+    Kind(4, 'product', Product, ('name',), ()),
+]
+KINDS_BY_MODEL = {kind.model: kind for kind in KINDS}
+KINDS_BY_NAME = {kind.name: kind for kind in KINDS}
+
+
+def enabled():
+    return connection.vendor == 'sqlite'
+
+
+def _text(values):
+    return ' '.join(str(value) for value in values if value)
+
+
+def _document(kind, values):
+    """(title, body) of one object from its field values, by field name."""
+    title = _text(values[field] for field in kind.title_fields)
+    body = [values[field] for field in kind.body_fields]
+    if kind.name == 'sales_invoice' and values['vehicle_number']:
+        # "KA 01 AB 1234" is also found as ka01ab1234
+        compact = re.sub(r'[\s-]', '', values['vehicle_number'])
+        if compact != values['vehicle_number']:
+            body.append(compact)
+    return title, _text(body)
+
+
+def _fields(kind):
+    return ('pk',) + kind.title_fields + kind.body_fields
+
+
+def index_object(instance):
+    """Add or replace the search row of a saved object."""
+    kind = KINDS_BY_MODEL[type(instance)]
+    if not enabled() or instance.pk is None:
+        return
+    title, body = _document(kind, {field: getattr(instance, field) for field in _fields(kind)})
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT OR REPLACE INTO {TABLE} (rowid, title, body) VALUES (%s, %s, %s)",
+                       [instance.pk * 8 + kind.code, title, body])
+
+
+def remove_object(instance):
+    kind = KINDS_BY_MODEL[type(instance)]
+    if enabled() and instance.pk is not None:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [instance.pk * 8 + kind.code])
+
+
+def rebuild_index(batch_size=5000):
+    """Index every searchable object from scratch. Returns the number of rows."""
+    if not enabled():
+        return 0
+    count = 0
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        cursor.execute(f"DELETE FROM {TABLE}")
+        for kind in KINDS:
+            fields = _fields(kind)
+            rows = kind.model.objects.order_by().values_list(*fields).iterator(chunk_size=batch_size)
+            batch = []
+            for row in rows:
+                values = dict(zip(fields, row))
+                batch.append((values['pk'] * 8 + kind.code,) + _document(kind, values))
+                if len(batch) == batch_size:
+                    cursor.executemany(f"INSERT INTO {TABLE} (rowid, title, body) VALUES (%s, %s, %s)", batch)
+                    count, batch = count + len(batch), []
+            if batch:
+                cursor.executemany(f"INSERT INTO {TABLE} (rowid, title, body) VALUES (%s, %s, %s)", batch)
+                count += len(batch)
+        # Merge the b-tree segments written by the bulk insert
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return count
+
+
+def _match_expression(query, prefix=True):
+    """Every word of the query as a quoted prefix term: ka 01 -> "ka"* "01"* (whole words without `prefix`)"""
+    # A one character prefix would match a large part of the index
+    return ' '.join(f'"{word}"*' if prefix and len(word) > 1 else f'"{word}"' for word in re.findall(r'\w+', query))
+
+
+def object_url(kind, pk):
+    if kind.name == 'sales_invoice':
+        return reverse('view_sale', args=[pk])
+    if kind.name == 'product':
+        return reverse('edit_inventory_item', args=[pk])
+    return reverse(f'admin:Accounts_{kind.model._meta.model_name}_change', args=[pk])
+
+
+def _result(kind, pk, title, body):
+    return {'kind': kind.name, 'id': pk, 'title': title, 'detail': body, 'url': object_url(kind, pk)}
+
+
+def search(query, page=1, kind=None, page_size=PAGE_SIZE):
+    """
+    One page of the objects matching `query`, best first, optionally of one
+    kind (a KINDS name). Returns (results, has_next); each result is a dict
+    with kind, id, title, detail and url.
+    """
+    match = _match_expression(query)
+    if not match:
+        return [], False
+    if not enabled():
+        return _search_fields(query, page, kind, page_size)
+    offset = (page - 1) * page_size
+    sql = f"SELECT rowid, title, body FROM {TABLE} WHERE {TABLE} MATCH %s AND rank MATCH %s"
+    params = [match, RANK]
+    if kind is not None:
+        sql += " AND rowid %% 8 = %s"
+        params.append(KINDS_BY_NAME[kind].code)
+    # Whole word matches first, then by rank; newest first on ties
+    sql += (f" ORDER BY rowid IN (SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s) DESC, rank, rowid DESC"
+            " LIMIT %s OFFSET %s")
+    params += [_match_expression(query, prefix=False), page_size + 1, offset]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    results = [_result(KINDS[rowid % 8], rowid // 8, title, body) for rowid, title, body in rows[:page_size]]
+    return results, len(rows) > page_size
+
+
+def _search_fields(query, page, kind, page_size):
+    """Unranked icontains fallback for databases without FTS5."""
+    words = re.findall(r'\w+', query)
+    results = []
+    for searched in [KINDS_BY_NAME[kind]] if kind else KINDS:
+        fields = searched.title_fields + searched.body_fields
+        matches = Q()
+        for word in words:
+            matches &= Q(*[Q(**{f'{field}__icontains': word}) for field in fields], _connector=Q.OR)
+        for values in searched.model.objects.filter(matches).order_by('-pk').values(*_fields(searched)):
+            results.append(_result(searched, values['pk'], *_document(searched, values)))
+    offset = (page - 1) * page_size
+    return results[offset:offset + page_size], len(results) > offset + page_size
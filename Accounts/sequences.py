@@ -0,0 +1,96 @@
+"""
+Gap-free number allocation for invoices and lots.
+
+Each number series is one row of the Sequence table. A number is taken with a
+single `UPDATE ... SET value = value + 1`, which locks the row (a write lock on
+SQLite) until the surrounding transaction commits. Concurrent workers therefore
+queue up instead of reading the same "last" invoice, and a rolled back insert
+also rolls back its number, so the series has no gaps. Bulk inserts take a
+block of numbers with one UPDATE (purchase_invoice_numbers() and friends).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Sequence
+
+PURCHASE_INVOICE_SEQUENCE = 'purchase_invoice:{year}'
+SALES_INVOICE_SEQUENCE = 'sales_invoice:{year}'
+LOT_SEQUENCE = 'lot'
+
+
+def next_value(name):
+    """Return the next number of the series `name`, starting at 1."""
+    return reserve_values(name, 1)
+
+
+def reserve_values(name, count):
+    """Take `count` consecutive numbers of the series `name` at once; return the first."""
+    with transaction.atomic():
+        if not Sequence.objects.filter(name=name).update(value=F('value') + count):
+            try:
+                # First numbers of a new series (e.g. a new year)
+                with transaction.atomic():
+                    Sequence.objects.create(name=name, value=count)
+            except IntegrityError:
+                # Another worker created the row in the meantime
+                Sequence.objects.filter(name=name).update(value=F('value') + count)
+        return Sequence.objects.filter(name=name).values_list('value', flat=True).get() - count + 1
+
+
+def _purchase_invoice_number(year, value):
+    return f"MS{year}R{value:02d}"
+
+
+def _sales_invoice_number(year, value):
+    return f"SA{year}S{value:02d}"
+
+
+def _lot_number(value):
+    return f"LOT-{value:02d}"
+
+
+def next_purchase_invoice_number(invoice_date):
+    """MS<year>R01, MS<year>R02, ... numbered per year; widens past 99."""
+    year = invoice_date.year
+    return _purchase_invoice_number(year, next_value(PURCHASE_INVOICE_SEQUENCE.format(year=year)))
+
+
+def next_sales_invoice_number(invoice_date):
+    """SA<year>S01, SA<year>S02, ... numbered per year; widens past 99."""
+    year = invoice_date.year
+    return _sales_invoice_number(year, next_value(SALES_INVOICE_SEQUENCE.format(year=year)))
+
+
+def next_lot_number():
+    """LOT-01, LOT-02, ... numbered across years since lot numbers are unique."""
+    return _lot_number(next_value(LOT_SEQUENCE))
+
+
+# Bulk allocation: one UPDATE per series instead of one per number
+def _numbers_by_year(sequence, number, dates):
+    dates = list(dates)
+    per_year = {}
+    for day in dates:
+        per_year[day.year] = per_year.get(day.year, 0) + 1
+    next_values = {year: reserve_values(sequence.format(year=year), count) for year, count in per_year.items()}
+    numbers = []
+    for day in dates:
+        numbers.append(number(day.year, next_values[day.year]))
+        next_values[day.year] += 1
+    return numbers
+
+
+def purchase_invoice_numbers(dates):
+    """Numbers for new purchase invoices of the given dates, in the same order."""
+    return _numbers_by_year(PURCHASE_INVOICE_SEQUENCE, _purchase_invoice_number, dates)
+
+
+def sales_invoice_numbers(dates):
+    """Numbers for new sales invoices of the given dates, in the same order."""
+    return _numbers_by_year(SALES_INVOICE_SEQUENCE, _sales_invoice_number, dates)
+
+
+def lot_numbers(count):
+    """`count` new lot numbers."""
+    first = reserve_values(LOT_SEQUENCE, count)
+    return [_lot_number(value) for value in range(first, first + count)]
@@ -0,0 +1,336 @@
+from decimal import Decimal
+
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import dashboard_cache, payments, rollups, search, stock
+from .models import (
+    Customer, Damages, Expense, Payment, Product, PurchaseInvoice, PurchaseProduct, PurchaseVendor, SalesInvoice,
+    SalesLot, SalesPayment, SalesProduct,
+)
+
+NO_LINE = {'invoice_id': None, 'total': None, 'gross_weight': None, 'product_id': None, 'net_weight': None}
+
+
+def _amount(value):
+    return value if value is not None else Decimal('0.00')
+
+
+# -------------------------------------------
+# SalesInvoice stored totals
+# -------------------------------------------
+@receiver(post_save, sender=SalesProduct)
+def sales_product_saved(sender, instance, created, raw=False, **kwargs):
+    """Post the change of a line item to the stored invoice totals and the daily rollups."""
+    if raw:
+        return
+    old = getattr(instance, '_loaded_totals', None)
+    if created or old is None:
+        old = NO_LINE
+
+    stock.post_movements(stock.sales_line_movements(
+        f'sales_invoice:{instance.invoice_id}',
+        old['product_id'], old['net_weight'], instance.product_id, _stored(instance, 'net_weight'),
+    ))
+
+    if old['invoice_id'] == instance.invoice_id and old['product_id'] == instance.product_id:
+        rollups.post_sales_line(
+            instance.invoice_id,
+            instance.product_id,
+            gross_weight=_amount(instance.gross_weight) - _amount(old['gross_weight']),
+            net_weight=_amount(instance.net_weight) - _amount(old['net_weight']),
+            total=_amount(instance.total) - _amount(old['total']),
+        )
+    else:
+        if old['invoice_id']:
+            rollups.post_sales_line(
+                old['invoice_id'],
+                old['product_id'],
+                gross_weight=-_amount(old['gross_weight']),
+                net_weight=-_amount(old['net_weight']),
+                total=-_amount(old['total']),
+            )
+        rollups.post_sales_line(
+            instance.invoice_id,
+            instance.product_id,
+            gross_weight=_amount(instance.gross_weight),
+            net_weight=_amount(instance.net_weight),
+            total=_amount(instance.total),
+        )
+
+    if old['invoice_id'] and old['invoice_id'] != instance.invoice_id:
+        # Line item moved to another invoice: take it off the old one first.
+        SalesInvoice.apply_totals_delta(
+            old['invoice_id'],
+            net_total=-_amount(old['total']),
+            gross_weight=-_amount(old['gross_weight']),
+        )
+        old = NO_LINE
+
+    SalesInvoice.apply_totals_delta(
+        instance.invoice_id,
+        net_total=_amount(instance.total) - _amount(old['total']),
+        gross_weight=_amount(instance.gross_weight) - _amount(old['gross_weight']),
+    )
+    instance._loaded_totals = {
+        'invoice_id': instance.invoice_id,
+        'total': instance.total,
+        'gross_weight': instance.gross_weight,
+        'product_id': instance.product_id,
+        'net_weight': instance.net_weight,
+    }
+
+
+def _product_deleted(instance, origin):
+    """
+    Whether a line item is deleted with its product. The product's stock
+    movements are deleted with it, so none are posted for the line.
+    """
+    if isinstance(origin, Product):
+        return origin.pk == instance.product_id
+    return getattr(origin, 'model', None) is Product
+
+
+@receiver(post_delete, sender=SalesProduct)
+def sales_product_deleted(sender, instance, origin=None, **kwargs):
+    if not _product_deleted(instance, origin):
+        stock.post_movements(stock.sales_line_movements(
+            f'sales_invoice:{instance.invoice_id}', instance.product_id, _stored(instance, 'net_weight'),
+            None, None,
+        ))
+    rollups.post_sales_line(
+        instance.invoice_id,
+        instance.product_id,
+        gross_weight=-_amount(instance.gross_weight),
+        net_weight=-_amount(instance.net_weight),
+        total=-_amount(instance.total),
+    )
+    SalesInvoice.apply_totals_delta(
+        instance.invoice_id,
+        net_total=-_amount(instance.total),
+        gross_weight=-_amount(instance.gross_weight),
+    )
+
+
+# Saved payments are posted by their save() (payments.py); deleted ones here.
+@receiver(post_delete, sender=SalesPayment)
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, **kwargs):
+    invoice_model = sender._meta.get_field('invoice').related_model
+    payments.post_payment(invoice_model, instance.invoice_id, -_amount(instance.amount))
+
+
+# -------------------------------------------
+# Daily rollups (rollups.py)
+# -------------------------------------------
+def _saved(update_fields, *names):
+    """Whether a save with `update_fields` wrote any of the given fields."""
+    return update_fields is None or any(name in update_fields for name in names)
+
+
+def _stored(instance, name):
+    """Value of a field as the database holds it (views may assign raw form strings)."""
+    field = instance._meta.get_field(name)
+    return field.to_python(getattr(instance, field.attname))
+
+
+@receiver(post_save, sender=SalesInvoice)
+def sales_invoice_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_loaded_rollup', None)
+    if created or old is None or None in old.values():
+        if created:
+            rollups.post_sales_invoice(_stored(instance, 'date'), _stored(instance, 'vendor'), 1)
+        instance._loaded_rollup = {'date': _stored(instance, 'date'), 'vendor_id': _stored(instance, 'vendor')}
+        return
+    new_date = _stored(instance, 'date') if _saved(update_fields, 'date') else old['date']
+    new_vendor_id = _stored(instance, 'vendor') if _saved(update_fields, 'vendor', 'vendor_id') else old['vendor_id']
+    if (new_date, new_vendor_id) != (old['date'], old['vendor_id']):
+        rollups.move_sales_invoice(instance.pk, old['date'], old['vendor_id'], new_date, new_vendor_id)
+    instance._loaded_rollup = {'date': new_date, 'vendor_id': new_vendor_id}
+
+
+@receiver(post_delete, sender=SalesInvoice)
+def sales_invoice_deleted(sender, instance, **kwargs):
+    # The line items are deleted (and posted) before the invoice itself
+    rollups.post_sales_invoice(_stored(instance, 'date'), instance.vendor_id, -1)
+
+
+@receiver(post_save, sender=PurchaseInvoice)
+def purchase_invoice_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_loaded_rollup', None)
+    if created or old is None or None in old.values():
+        if created:
+            rollups.post_purchase(_stored(instance, 'date'), _stored(instance, 'net_total'), count=1)
+        instance._loaded_rollup = {'date': _stored(instance, 'date'), 'net_total': _stored(instance, 'net_total')}
+        return
+    new_date = _stored(instance, 'date') if _saved(update_fields, 'date') else old['date']
+    new_total = _stored(instance, 'net_total') if _saved(update_fields, 'net_total') else old['net_total']
+    if new_date != old['date']:
+        rollups.post_purchase(old['date'], -old['net_total'], count=-1)
+        rollups.post_purchase(new_date, new_total, count=1)
+    else:
+        rollups.post_purchase(new_date, new_total - old['net_total'])
+    instance._loaded_rollup = {'date': new_date, 'net_total': new_total}
+
+
+@receiver(post_delete, sender=PurchaseInvoice)
+def purchase_invoice_deleted(sender, instance, **kwargs):
+    rollups.post_purchase(_stored(instance, 'date'), -_stored(instance, 'net_total'), count=-1)
+
+
+def _dated_amount_saved(post, field):
+    """post_save handler posting the (date, `field`) change of an Expense / Damages row."""
+    def handler(sender, instance, created, raw=False, update_fields=None, **kwargs):
+        if raw:
+            return
+        old = getattr(instance, '_loaded_rollup', None)
+        if created or old is None or None in old.values():
+            if created:
+                post(_stored(instance, 'date'), _stored(instance, field))
+            instance._loaded_rollup = {'date': _stored(instance, 'date'), field: _stored(instance, field)}
+            return
+        new_date = _stored(instance, 'date') if _saved(update_fields, 'date') else old['date']
+        new_amount = _stored(instance, field) if _saved(update_fields, field) else old[field]
+        if new_date != old['date']:
+            post(old['date'], -old[field])
+            post(new_date, new_amount)
+        else:
+            post(new_date, new_amount - old[field])
+        instance._loaded_rollup = {'date': new_date, field: new_amount}
+    return handler
+
+
+expense_saved = receiver(post_save, sender=Expense)(_dated_amount_saved(rollups.post_expense, 'amount'))
+damage_saved = receiver(post_save, sender=Damages)(_dated_amount_saved(rollups.post_damage, 'amount_loss'))
+
+
+@receiver(post_delete, sender=Expense)
+def expense_deleted(sender, instance, **kwargs):
+    rollups.post_expense(_stored(instance, 'date'), -_stored(instance, 'amount'))
+
+
+@receiver(post_delete, sender=Damages)
+def damage_deleted(sender, instance, **kwargs):
+    rollups.post_damage(_stored(instance, 'date'), -_stored(instance, 'amount_loss'))
+
+
+# -------------------------------------------
+# Stock movements (stock.py)
+# -------------------------------------------
+def _purchase_line(instance):
+    return (
+        instance.product_id, _stored(instance, 'quantity'), _stored(instance, 'damage'), _stored(instance, 'rotten'),
+    )
+
+
+@receiver(post_save, sender=PurchaseProduct)
+def purchase_product_saved(sender, instance, created, raw=False, **kwargs):
+    """Post the received and damaged stock of a purchase line item (the change, on edits)."""
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_stock', None)
+    old = None if created or loaded is None else tuple(loaded.values())
+    new = _purchase_line(instance)
+    stock.post_movements(stock.purchase_line_movements(f'purchase_invoice:{instance.invoice_id}', old, new))
+    instance._loaded_stock = dict(zip(('product_id', 'quantity', 'damage', 'rotten'), new))
+
+
+@receiver(post_delete, sender=PurchaseProduct)
+def purchase_product_deleted(sender, instance, origin=None, **kwargs):
+    if not _product_deleted(instance, origin):
+        stock.post_movements(stock.purchase_line_movements(
+            f'purchase_invoice:{instance.invoice_id}', _purchase_line(instance), None,
+        ))
+
+
+# -------------------------------------------
+# Invoice versions (cached PDF keys)
+# -------------------------------------------
+@receiver(post_save, sender=SalesLot)
+@receiver(post_delete, sender=SalesLot)
+def sales_lot_changed(sender, instance, **kwargs):
+    SalesInvoice.bump_version(instance.sales_invoice_id)
+
+
+@receiver(post_save, sender=PurchaseProduct)
+@receiver(post_delete, sender=PurchaseProduct)
+def purchase_invoice_item_changed(sender, instance, **kwargs):
+    PurchaseInvoice.bump_version(instance.invoice_id)
+
+
+def _printed_fields_changed(instance, created, update_fields):
+    """
+    Whether a save changed a vendor / customer / product field printed on the
+    invoice PDFs. An instance not loaded from the database counts as changed.
+    """
+    loaded = getattr(instance, '_loaded_printed', None)
+    current = {name: _stored(instance, name) for name in instance.PRINTED_FIELDS}
+    instance._loaded_printed = current
+    if created:
+        return False
+    if loaded is None:
+        return True
+    return any(_saved(update_fields, name) and current[name] != loaded[name] for name in current)
+
+
+def _bump_versions(invoices):
+    invoices.update(version=F('version') + 1)
+
+
+@receiver(post_save, sender=PurchaseVendor)
+def purchase_vendor_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if not raw and _printed_fields_changed(instance, created, update_fields):
+        _bump_versions(PurchaseInvoice.objects.filter(vendor=instance))
+
+
+@receiver(post_save, sender=Customer)
+def customer_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if not raw and _printed_fields_changed(instance, created, update_fields):
+        _bump_versions(SalesInvoice.objects.filter(vendor=instance))
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if not raw and _printed_fields_changed(instance, created, update_fields):
+        _bump_versions(PurchaseInvoice.objects.filter(purchase_products__product=instance))
+        _bump_versions(SalesInvoice.objects.filter(sales_products__product=instance))
+
+
+# -------------------------------------------
+# Global search index (search.py)
+# -------------------------------------------
+def search_object_saved(sender, instance, update_fields=None, **kwargs):
+    kind = search.KINDS_BY_MODEL[sender]
+    if _saved(update_fields, *kind.title_fields, *kind.body_fields):
+        search.index_object(instance)
+
+
+def search_object_deleted(sender, instance, **kwargs):
+    search.remove_object(instance)
+
+
+for kind in search.KINDS:
+    post_save.connect(search_object_saved, sender=kind.model, dispatch_uid=f'search:save:{kind.name}')
+    post_delete.connect(search_object_deleted, sender=kind.model, dispatch_uid=f'search:delete:{kind.name}')
+
+
+# -------------------------------------------
+# Dashboard cache (dashboard_cache.py)
+# -------------------------------------------
+DASHBOARD_MODELS = (
+    SalesInvoice, SalesProduct, SalesPayment, PurchaseInvoice, PurchaseProduct, Payment, Expense, Damages, Product,
+)
+
+
+def dashboard_data_changed(sender, **kwargs):
+    dashboard_cache.invalidate()
+
+
+for model in DASHBOARD_MODELS:
+    post_save.connect(dashboard_data_changed, sender=model, dispatch_uid=f'dashboard_cache:save:{model.__name__}')
+    post_delete.connect(dashboard_data_changed, sender=model, dispatch_uid=f'dashboard_cache:delete:{model.__name__}')
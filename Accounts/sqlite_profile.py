@@ -0,0 +1,52 @@
+"""
+SQLite tuning for several server processes sharing db.sqlite3.
+
+configure_connection() runs on every new database connection (wired in
+apps.ready) and applies settings.SQLITE_PRAGMAS. The production profile:
+
+    journal_mode=WAL      readers no longer wait for a writer and a writer no
+                          longer waits for readers; only writers queue
+    synchronous=NORMAL    no fsync per commit in WAL mode (a power cut may lose
+                          the last commits, never corrupts the file)
+    busy_timeout          wait this many ms for the write lock instead of
+                          failing with "database is locked"
+    cache_size, mmap_size keep the hot pages in memory per connection
+    temp_store=MEMORY     sorts and GROUP BY temp tables in memory
+
+Together with CONN_MAX_AGE the pragmas run once per connection, not per
+request. `manage.py benchmark_sqlite` compares the profile with SQLite's
+defaults under concurrent readers and writers.
+"""
+import re
+
+from django.conf import settings
+
+_PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+_PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+def pragma_statements(pragmas):
+    """`PRAGMA name = value` statements for a {name: value} dict."""
+    statements = []
+    for name, value in pragmas.items():
+        if not _PRAGMA_NAME.match(name) or not _PRAGMA_VALUE.match(str(value)):
+            raise ValueError(f"Invalid SQLite pragma {name}={value!r}")
+        statements.append(f"PRAGMA {name} = {value}")
+    return statements
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created handler applying settings.SQLITE_PRAGMAS."""
+    if connection.vendor != 'sqlite':
+        return
+    statements = pragma_statements(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if not statements:
+        return
+    # On the raw connection: not recorded as queries of the request that
+    # happened to open the connection.
+    cursor = connection.connection.cursor()
+    try:
+        for statement in statements:
+            cursor.execute(statement)
+    finally:
+        cursor.close()
@@ -0,0 +1,168 @@
+"""
+Append-only stock ledger.
+
+Every change of Product.current_stock is a StockMovement row (opening stock,
+purchase, sale, damage or adjustment) and is applied to the product with an
+atomic `UPDATE ... SET current_stock = current_stock + n`, so two clerks
+working at once never overwrite each other's changes. Quantities are whole
+units, like current_stock; kg are rounded half up per line item.
+
+StockSnapshot rows hold the stock of every product at the end of a day
+(`manage.py snapshot_stock`, run daily), so stock_as_of() only sums the
+movements after the latest snapshot. `manage.py reconcile_stock` rebuilds
+current_stock from the ledger.
+
+OUT_OF_STOCK, LOW_STOCK and IN_STOCK are the stock statuses every report and
+filter uses. Sales may take a product below zero before its purchase is
+entered; such oversold products count as out of stock.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from . import dashboard_cache
+from .models import Product, StockMovement, StockSnapshot
+
+
+OUT_OF_STOCK = Q(current_stock__lte=0)
+LOW_STOCK = Q(current_stock__lte=F('threshold')) & ~OUT_OF_STOCK
+IN_STOCK = ~Q(current_stock__lte=F('threshold')) & ~OUT_OF_STOCK
+
+
+def units(value):
+    """Stock units for a kg amount (None counts as 0)."""
+    return int(Decimal(value or 0).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def post_movements(movements):
+    """
+    Record unsaved StockMovement rows (zero quantities are skipped) and apply
+    them to the products: one INSERT and one UPDATE, however many products.
+    """
+    movements = [movement for movement in movements if movement.quantity]
+    if not movements:
+        return
+    per_product = defaultdict(int)
+    for movement in movements:
+        per_product[movement.product_id] += movement.quantity
+    per_product = {product_id: quantity for product_id, quantity in per_product.items() if quantity}
+    with transaction.atomic(savepoint=False):
+        StockMovement.objects.bulk_create(movements)
+        if per_product:
+            Product.objects.filter(pk__in=per_product).update(current_stock=F('current_stock') + Case(
+                *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in per_product.items()],
+                output_field=IntegerField(),
+            ))
+
+
+def post_movement(product_id, quantity, kind, reference='', day=None):
+    post_movements([
+        StockMovement(product_id=product_id, quantity=quantity, kind=kind, reference=reference,
+                      date=day or date.today())
+    ])
+
+
+def _summed_movements(**filters):
+    movements = (
+        StockMovement.objects.filter(product=OuterRef('pk'), **filters)
+        .order_by()
+        .values('product')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    return Coalesce(Subquery(movements), Value(0), output_field=IntegerField())
+
+
+def stock_as_of(day, products=None):
+    """
+    {product_id: stock at the end of `day`}: the latest snapshot on or before
+    that day plus the movements after it, in one query.
+    """
+    snapshots = StockSnapshot.objects.filter(product=OuterRef('pk'), date__lte=day).order_by('-date')
+    products = (products if products is not None else Product.objects.all()).annotate(
+        snapshot_date=Subquery(snapshots.values('date')[:1]),
+        snapshot_quantity=Coalesce(Subquery(snapshots.values('quantity')[:1]), Value(0)),
+    ).annotate(
+        moved=_summed_movements(date__lte=day, date__gt=Coalesce(OuterRef('snapshot_date'), Value(date.min))),
+    )
+    return {
+        product_id: snapshot + moved
+        for product_id, snapshot, moved in products.values_list('pk', 'snapshot_quantity', 'moved')
+    }
+
+
+def take_snapshot(day=None):
+    """Snapshot every product's stock at the end of `day` (default yesterday); returns the row count."""
+    day = day or date.today() - timedelta(days=1)
+    if day >= date.today():
+        # Later movements of the same day would fall between snapshot and ledger
+        raise ValueError("Only days that are over can be snapshotted.")
+    snapshots = [
+        StockSnapshot(product_id=product_id, date=day, quantity=quantity)
+        for product_id, quantity in stock_as_of(day).items()
+    ]
+    with transaction.atomic():
+        StockSnapshot.objects.filter(date=day).delete()
+        StockSnapshot.objects.bulk_create(snapshots)
+    return len(snapshots)
+
+
+def stock_mismatches():
+    """[(product, current_stock, ledger stock)] for products whose stock differs from the ledger."""
+    products = Product.objects.annotate(ledger_stock=_summed_movements()).exclude(current_stock=F('ledger_stock'))
+    return [(product, product.current_stock, product.ledger_stock) for product in products.order_by('name')]
+
+
+def reconcile_stock():
+    """Set current_stock of every product to the sum of its movements, in one UPDATE."""
+    updated = Product.objects.update(current_stock=_summed_movements())
+    dashboard_cache.invalidate()
+    return updated
+
+
+# -------------------------------------------
+# Line item movements
+# -------------------------------------------
+def sales_line_movements(reference, old_product_id, old_net_weight, new_product_id, new_net_weight):
+    """
+    Movements for a sales line item going from (old product, kg) to (new
+    product, kg). Sales take off their net weight, as the stock always did.
+    """
+    if old_product_id == new_product_id:
+        return [StockMovement(product_id=new_product_id, kind='sale', reference=reference,
+                              quantity=units(old_net_weight) - units(new_net_weight))]
+    movements = []
+    if old_product_id:
+        movements.append(StockMovement(product_id=old_product_id, kind='sale', reference=reference,
+                                       quantity=units(old_net_weight)))
+    if new_product_id:
+        movements.append(StockMovement(product_id=new_product_id, kind='sale', reference=reference,
+                                       quantity=-units(new_net_weight)))
+    return movements
+
+
+def purchase_line_stock(quantity, damage, rotten):
+    """(received, damaged) units of a purchase line item: damage is a percentage, rotten in kg."""
+    quantity = Decimal(quantity or 0)
+    return units(quantity), units(quantity * Decimal(damage or 0) / 100 + Decimal(rotten or 0))
+
+
+def purchase_line_movements(reference, old, new):
+    """
+    Movements for a purchase line item going from `old` to `new`, each a
+    (product_id, quantity, damage, rotten) tuple or None.
+    """
+    movements = []
+    for line, sign in ((old, -1), (new, 1)):
+        if line is None or not line[0]:
+            continue
+        received, damaged = purchase_line_stock(*line[1:])
+        movements.append(StockMovement(product_id=line[0], kind='purchase', reference=reference,
+                                       quantity=sign * received))
+        movements.append(StockMovement(product_id=line[0], kind='damage', reference=reference,
+                                       quantity=-sign * damaged))
+    return movements
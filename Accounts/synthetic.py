@@ -0,0 +1,310 @@
+"""
+Synthetic season data for benchmarks and load tests.
+
+generate() fills the database with a mango season of a realistic shape at any
+scale: a few varieties, vendors delivering lots (PurchaseInvoice with 1-3
+PurchaseProduct rows), customers buying from the oldest open lots first
+(SalesInvoice with SalesLot and SalesProduct rows), payments on both sides,
+expenses and damages. Trading follows the season: slow in March, peaking in
+May, tailing off in July.
+
+Everything is written with bulk_create, a chunk of invoices per transaction,
+so the signal handlers do not run. The derived data is filled in instead:
+line item amounts and invoice totals are computed as the rows are made,
+numbers are taken in blocks from the sequences, stock movements are recorded
+with the lines, and the daily rollups, Product.current_stock and the search
+index are rebuilt set-based at the end.
+"""
+import math
+import random
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import dashboard_cache, search, stock
+from .models import (
+    Customer, Damages, Expense, Payment, Product, PurchaseInvoice, PurchaseProduct, PurchaseVendor, SalesInvoice,
+    SalesLot, SalesPayment, SalesProduct, StockMovement,
+)
+from .rollups import rebuild_rollups
+from .sequences import lot_numbers, purchase_invoice_numbers, sales_invoice_numbers
+
+# Sales line items of the named scales
+SCALES = {'small': 2_000, 'medium': 100_000, 'large': 1_000_000}
+# (variety, purchase price per kg)
+VARIETIES = [
+    ('Banganapalli', 38), ('Alphonso', 85), ('Totapuri', 22), ('Mallika', 45),
+    ('Imam Pasand', 70), ('Neelam', 30), ('Raspuri', 35), ('Kesar', 60),
+]
+AREAS = ['Chittoor', 'Krishnagiri', 'Kolar', 'Ratnagiri', 'Srinivaspur', 'Nuzvid']
+PAYMENT_MODES = ['cash', 'upi', 'account_pay']
+LINES_PER_LOT = 25
+INVOICES_PER_CHUNK = 2000
+CENT = Decimal('0.01')
+
+
+def _money(value):
+    return Decimal(value).quantize(CENT)
+
+
+def _percent(rng, high):
+    return _money(rng.uniform(0, high))
+
+
+class _Season:
+    """The trading days and their relative volume."""
+
+    def __init__(self, rng, start, days):
+        self.rng = rng
+        self.days = [start + timedelta(days=day) for day in range(days)]
+        self.weights = [0.15 + math.sin(math.pi * (day + 0.5) / days) ** 2 for day in range(days)]
+
+    def sample(self, count):
+        return sorted(self.rng.choices(self.days, self.weights, k=count))
+
+
+def _payments(rng, total, day, make):
+    """Payments of a share of `total`: most invoices are paid in full, some in part or not yet."""
+    share = rng.choices([Decimal('1'), Decimal(rng.uniform(0.3, 0.9)), Decimal('0')], [60, 25, 15])[0]
+    paid = _money(total * share)
+    if paid <= 0:
+        return []
+    first = _money(paid * Decimal(rng.uniform(0.4, 1))) if rng.random() < 0.3 else paid
+    amounts = [first, paid - first] if first < paid else [paid]
+    return [make(amount, day + timedelta(days=rng.randrange(15)), rng.choice(PAYMENT_MODES)) for amount in amounts]
+
+
+def generate(lines, seed=0, start=date(2025, 3, 1), days=120, progress=None):
+    """
+    Add about `lines` sales line items (and everything around them) to the
+    database; returns {model name: rows added}. `progress(stage, done, total)`
+    is called as the chunks are written.
+    """
+    rng = random.Random(seed)
+    season = _Season(rng, start, days)
+    added = Counter()
+    report = progress or (lambda stage, done, total: None)
+
+    user = User.objects.filter(is_superuser=True).order_by('pk').first()
+    if user is None:
+        user = User.objects.create_user('synthetic', is_staff=True, is_superuser=True)
+    products = {}
+    for name, price in VARIETIES:
+        product = Product.objects.filter(name=name).first() or Product.objects.create(name=name, threshold=500)
+        products[product.pk] = Decimal(price)
+
+    customers = Customer.objects.bulk_create(
+        Customer(name=f"Customer {index}", contact_number=f"9{rng.randrange(10**9):09d}",
+                 address=f"{rng.choice(AREAS)} market")
+        for index in range(max(20, lines // 500))
+    )
+    vendors = PurchaseVendor.objects.bulk_create(
+        PurchaseVendor(name=f"Farm {index}", contact_number=f"8{rng.randrange(10**9):09d}", area=rng.choice(AREAS))
+        for index in range(max(10, lines // 2000))
+    )
+    added.update({'Customer': len(customers), 'PurchaseVendor': len(vendors)})
+
+    pool = _generate_lots(rng, season, lines, products, vendors, added, report)
+    _generate_sales(rng, season, lines, products, customers, pool, added, report)
+    _generate_costs(rng, season, lines, user, added)
+
+    rebuild_rollups()
+    stock.reconcile_stock()
+    search.rebuild_index()
+    dashboard_cache.invalidate()
+    return dict(added)
+
+
+def _generate_lots(rng, season, lines, products, vendors, added, report):
+    """Purchase invoices with their line items, payments and stock movements; returns the open lot pool."""
+    count = max(4, lines // LINES_PER_LOT)
+    # Enough kg for every sale, with some stock left at the end of the season
+    lot_kg = LINES_PER_LOT * 700 * 1.1
+    dates = season.sample(count)
+    # Lots arrive a few days before they sell
+    dates = [max(season.days[0], day - timedelta(days=rng.randrange(7))) for day in dates]
+    dates.sort()
+    pool = []
+    for chunk_start in range(0, count, INVOICES_PER_CHUNK):
+        chunk_dates = dates[chunk_start:chunk_start + INVOICES_PER_CHUNK]
+        with transaction.atomic():
+            invoices = [
+                PurchaseInvoice(invoice_number=number, lot_number=lot, date=day, vendor=rng.choice(vendors),
+                                payment_issuer_name=rng.choice(['Abdul Rafi', 'Sadiq', None]))
+                for number, lot, day in zip(purchase_invoice_numbers(chunk_dates), lot_numbers(len(chunk_dates)),
+                                            chunk_dates)
+            ]
+            lines_by_invoice = []
+            for invoice in invoices:
+                varieties = rng.sample(list(products), rng.randint(1, 3))
+                items = []
+                for serial, product_id in enumerate(varieties, start=1):
+                    item = PurchaseProduct(
+                        product_id=product_id, serial_number=serial,
+                        quantity=_money(lot_kg / len(varieties) * rng.uniform(0.8, 1.2)),
+                        price=_money(products[product_id] * Decimal(rng.uniform(0.85, 1.15))),
+                        damage=_percent(rng, 3), discount=_percent(rng, 2), rotten=_money(rng.randrange(50)),
+                    )
+                    item.calculate_amounts()
+                    item.total, item.loading_unloading = _money(item.total), _money(item.loading_unloading)
+                    items.append(item)
+                invoice.net_total = sum(item.total for item in items)
+                lines_by_invoice.append(items)
+            payments_by_invoice = []
+            for invoice in invoices:
+                invoice_payments = _payments(
+                    rng, invoice.net_total_after_cash_cutting, invoice.date,
+                    lambda amount, day, mode: Payment(amount=amount, date=day, payment_mode=mode),
+                )
+                invoice.paid_amount = sum(payment.amount for payment in invoice_payments)
+                payments_by_invoice.append(invoice_payments)
+            PurchaseInvoice.objects.bulk_create(invoices)
+
+            items, payments, movements = [], [], []
+            for invoice, invoice_items, invoice_payments in zip(invoices, lines_by_invoice, payments_by_invoice):
+                for item in invoice_items:
+                    item.invoice = invoice
+                    items.append(item)
+                    received, damaged = stock.purchase_line_stock(item.quantity, item.damage, item.rotten)
+                    # Whole kg that can be sold without taking the stock below zero
+                    pool.append([invoice.date, invoice.pk, item.product_id, received - damaged - 1])
+                    for movement in stock.purchase_line_movements(
+                        f'purchase_invoice:{invoice.pk}', None,
+                        (item.product_id, item.quantity, item.damage, item.rotten),
+                    ):
+                        movement.date = invoice.date
+                        movements.append(movement)
+                for payment in invoice_payments:
+                    payment.invoice = invoice
+                    payments.append(payment)
+            PurchaseProduct.objects.bulk_create(items)
+            Payment.objects.bulk_create(payments)
+            StockMovement.objects.bulk_create(movements)
+        added.update({'PurchaseInvoice': len(invoices), 'PurchaseProduct': len(items), 'Payment': len(payments),
+                      'StockMovement': len(movements)})
+        report('lots', min(chunk_start + INVOICES_PER_CHUNK, count), count)
+    return pool
+
+
+def _generate_sales(rng, season, lines, products, customers, pool, added, report):
+    """Sales invoices drawing on the oldest open lots, with lots, line items, payments and movements."""
+    invoice_count = max(1, lines // 4)
+    dates = season.sample(invoice_count)
+    pool.sort()
+    opened, open_lines, made = 0, [], 0
+    for chunk_start in range(0, invoice_count, INVOICES_PER_CHUNK):
+        chunk_dates = dates[chunk_start:chunk_start + INVOICES_PER_CHUNK]
+        invoices, lots_by_invoice = [], []
+        for day in chunk_dates:
+            if made >= lines:
+                break
+            # Lots delivered by now are open; the oldest sell first
+            while opened < len(pool) and pool[opened][0] <= day:
+                open_lines.append(pool[opened])
+                opened += 1
+            if not open_lines:
+                continue
+            picked = rng.randint(1, 3) + rng.randrange(3)
+            candidates = open_lines[:picked]
+            invoice_lines = []
+            for _ in range(rng.randint(2, 6)):
+                lot_line = rng.choice(candidates)
+                if lot_line[3] < 50:
+                    # Sold out: the next open one
+                    lot_line = next((other for other in open_lines if other[3] >= 50), None)
+                    if lot_line is None:
+                        break
+                gross = min(lot_line[3], rng.randint(150, 1200))
+                lot_line[3] -= gross
+                invoice_lines.append((lot_line[1], SalesProduct(
+                    product_id=lot_line[2], gross_weight=Decimal(gross), discount=_percent(rng, 5),
+                    rotten=Decimal(rng.randrange(20)),
+                    price=_money(products[lot_line[2]] * Decimal(rng.uniform(1.15, 1.5))),
+                )))
+            # Sold out lines are among the oldest
+            open_lines[:picked] = [lot_line for lot_line in candidates if lot_line[3] >= 50]
+            if not invoice_lines:
+                continue
+            crates = rng.randint(20, 200)
+            invoice = SalesInvoice(
+                vendor=rng.choice(customers), date=day, vehicle_number=f"KA{rng.randint(1, 70):02d}"
+                f"{rng.choice('ABCDEFGHJK')}{rng.randint(1000, 9999)}",
+                gross_vehicle_weight=_money(sum(item.gross_weight for _, item in invoice_lines) * Decimal('1.1')),
+                no_of_crates=crates, cost_per_crate=Decimal(rng.choice([18, 20, 25])),
+            )
+            for serial, (_, item) in enumerate(invoice_lines, start=1):
+                item.serial_number = serial
+                item.calculate_amounts()
+            invoice.net_total = sum(item.total for _, item in invoice_lines)
+            invoice.total_gross_weight = sum(item.gross_weight for _, item in invoice_lines)
+            invoices.append(invoice)
+            lots_by_invoice.append(invoice_lines)
+            made += len(invoice_lines)
+        if not invoices:
+            continue
+
+        with transaction.atomic():
+            for invoice, number in zip(invoices, sales_invoice_numbers(invoice.date for invoice in invoices)):
+                invoice.invoice_number = number
+            payments = []
+            for invoice in invoices:
+                invoice_payments = _payments(
+                    rng, invoice.net_total_after_packaging, invoice.date,
+                    lambda amount, day, mode: SalesPayment(amount=amount, date=day, payment_mode=mode),
+                )
+                invoice.paid_amount = sum(payment.amount for payment in invoice_payments)
+                payments.append(invoice_payments)
+            SalesInvoice.objects.bulk_create(invoices)
+
+            sales_lots = {}
+            for invoice, invoice_lines in zip(invoices, lots_by_invoice):
+                for lot_id, item in invoice_lines:
+                    sales_lot = sales_lots.get((invoice.pk, lot_id))
+                    if sales_lot is None:
+                        sales_lot = sales_lots[invoice.pk, lot_id] = SalesLot(
+                            sales_invoice=invoice, purchase_invoice_id=lot_id, quantity=Decimal(0),
+                        )
+                    sales_lot.quantity += item.gross_weight
+            SalesLot.objects.bulk_create(sales_lots.values())
+
+            items, movements, payment_rows = [], [], []
+            for invoice, invoice_lines, invoice_payments in zip(invoices, lots_by_invoice, payments):
+                for lot_id, item in invoice_lines:
+                    item.invoice, item.lot = invoice, sales_lots[invoice.pk, lot_id]
+                    items.append(item)
+                    for movement in stock.sales_line_movements(
+                        f'sales_invoice:{invoice.pk}', None, None, item.product_id, item.net_weight,
+                    ):
+                        movement.date = invoice.date
+                        movements.append(movement)
+                for payment in invoice_payments:
+                    payment.invoice = invoice
+                    payment_rows.append(payment)
+            SalesProduct.objects.bulk_create(items)
+            SalesPayment.objects.bulk_create(payment_rows)
+            StockMovement.objects.bulk_create(movements)
+        added.update({'SalesInvoice': len(invoices), 'SalesLot': len(sales_lots), 'SalesProduct': len(items),
+                      'SalesPayment': len(payment_rows), 'StockMovement': len(movements)})
+        report('sales', min(made, lines), lines)
+
+
+def _generate_costs(rng, season, lines, user, added):
+    """Running expenses and damages over the season."""
+    expenses = [
+        Expense(date=day, paid_by=rng.choice(['Office', 'Abdul Rafi', 'Sadiq']),
+                paid_to=rng.choice(['Transport', 'Labour', 'Diesel', 'Crates', 'Electricity']),
+                description="Synthetic expense", amount=_money(rng.uniform(200, 15000)), user=user)
+        for day in season.sample(max(len(season.days), lines // 50))
+    ]
+    damages = [
+        Damages(date=day, name=rng.choice(VARIETIES)[0], due_to=rng.choice(['Rain', 'Transit', 'Overripe']),
+                description="Synthetic damage", amount_loss=_money(rng.uniform(500, 20000)), user=user)
+        for day in season.sample(max(len(season.days) // 2, lines // 400))
+    ]
+    with transaction.atomic():
+        Expense.objects.bulk_create(expenses, batch_size=5000)
+        Damages.objects.bulk_create(damages, batch_size=5000)
+    added.update({'Expense': len(expenses), 'Damages': len(damages)})
@@ -1,3 +1,1530 @@
-from django.test import TestCase
+import csv
+import importlib
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.http import StreamingHttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image as PILImage
+from pypdf import PdfReader
+from reportlab.pdfbase import pdfmetrics
+
+from Accounts.models import (
+    Customer, DailyCustomerSales, DailyProductSales, DailySummary, Damages, Expense, InvoiceBatchJob, Payment,
+    Product, PurchaseInvoice, PurchaseProduct, PurchaseVendor, SalesInvoice, SalesLot, SalesPayment, SalesProduct,
+    Sequence, StockMovement,
+)
+from Accounts.attachments import thumbnail_name
+from Accounts.availability import annotate_availability, get_lot_availability, get_lot_product_availability
+from Accounts.dashboard_cache import data_version
+from Accounts.exports import XLSX_CONTENT_TYPE
+from Accounts.line_items import add_purchase_products, sync_sales_products
+from Accounts.middleware import UNRESOLVED, get_slow_requests, get_view_stats, reset_stats
+from Accounts.pdf_cache import get_cached_pdf, pdf_cache_root
+from Accounts.pdf_batch import expire_stale_jobs, job_log_path, run_batch_job, start_batch_job
+from Accounts.profitability import _cache_key, allocate, lot_margins, numpy, season_report
+from Accounts.reporting import build_dashboard, build_report, filter_report_dates
+from Accounts.search import rebuild_index, search
+from Accounts.sequences import purchase_invoice_numbers, sales_invoice_numbers
+from Accounts.rollups import rebuild_rollups
+from Accounts.sqlite_profile import configure_connection, pragma_statements
+from Accounts.stock import reconcile_stock, stock_as_of, stock_mismatches, take_snapshot
+from Accounts.synthetic import generate
+from Accounts.vouchers import render_voucher, voucher_rows
+
+
+class ReportsQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='secret')
+        cls.vendor = PurchaseVendor.objects.create(name="Vendor", contact_number="1", area="Area")
+        cls.customer = Customer.objects.create(name="Customer")
+        cls.products = [
+            Product.objects.create(name="Banganapalli", current_stock=100, threshold=5),
+            Product.objects.create(name="Alphonso", current_stock=3, threshold=5),
+            Product.objects.create(name="Totapuri", current_stock=0, threshold=5),
+        ]
+
+    def add_history(self, days):
+        for day in range(1, days + 1):
+            lot = PurchaseInvoice.objects.create(vendor=self.vendor, date=date(2025, 5, day))
+            PurchaseProduct.objects.create(invoice=lot, product=self.products[0], quantity=Decimal('500'), price=Decimal('20'))
+            lot.save()
+            sale = SalesInvoice.objects.create(vendor=self.customer, date=date(2025, 5, day))
+            for product in self.products[:2]:
+                SalesProduct.objects.create(invoice=sale, product=product, gross_weight=Decimal('100'), price=Decimal('30'))
+            SalesPayment.objects.create(invoice=sale, amount=Decimal('1000'), payment_mode='upi', date=date(2025, 5, day))
+            Expense.objects.create(date=date(2025, 5, day), paid_by="A", paid_to="B", description="Diesel",
+                                   amount=Decimal('50'), user=self.user)
+            Damages.objects.create(date=date(2025, 5, day), name="Crate", due_to="Rain", description="Wet",
+                                   amount_loss=Decimal('10'), user=self.user)
+
+    def test_build_report_figures(self):
+        self.add_history(3)
+        report = build_report('2025-05-02', '2025-05-03')
+        self.assertEqual(report['total_sales'], Decimal('12000'))
+        self.assertEqual(report['total_purchases'], Decimal('19600'))
+        self.assertEqual(report['total_expenses'], Decimal('100'))
+        self.assertEqual(report['total_damages'], Decimal('20'))
+        # The sales take Alphonso below zero (the stock ledger posts every line item)
+        self.assertEqual(report['inventory_data'], {'in_stock': 1, 'low_stock': 0, 'out_of_stock': 2})
+        upi = next(p for p in report['payment_data'] if p['method'] == 'UPI GPay / PhonePay')
+        self.assertEqual((upi['count'], upi['amount']), (2, Decimal('2000')))
+        self.assertEqual([p.name for p in report['top_products']], ["Banganapalli", "Alphonso"])
+        self.assertEqual([(c.name, c.invoice_count) for c in report['top_customers']], [("Customer", 2)])
+
+    def test_oversold_products_are_out_of_stock_everywhere(self):
+        Product.objects.filter(pk=self.products[1].pk).update(current_stock=-5)
+        expected = {'in_stock': 1, 'low_stock': 0, 'out_of_stock': 2}
+        self.assertEqual(build_report()['inventory_data'], expected)
+        self.assertEqual(build_dashboard()['inventory_data'], expected)
+
+    def test_build_report_query_count(self):
+        self.add_history(2)
+        with self.assertNumQueries(5):
+            build_report('2025-05-01', '2025-05-31')
+
+    def test_reports_view_query_count_does_not_grow(self):
+        self.client.force_login(self.user)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/accounts/reports/', {'start_date': '2025-05-01'})
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        self.add_history(2)
+        small = count_queries()
+        self.add_history(12)
+        self.assertEqual(count_queries(), small)
+
+    def test_sales_view_query_count_does_not_grow(self):
+        self.client.force_login(self.user)
+
+        def render_sales_page():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/accounts/sales/')
+            self.assertEqual(response.status_code, 200)
+            return response, len(queries)
+
+        self.add_history(2)
+        response, small = render_sales_page()
+        self.add_history(30)
+        response, large = render_sales_page()
+        self.assertEqual(large, small)
+        self.assertEqual(len(response.context['sales']), 25)
+        self.assertEqual(response.context['page_obj'].paginator.count, 32)
+
+
+class LotAvailabilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', password='secret')
+        vendor = PurchaseVendor.objects.create(name="Vendor", contact_number="1", area="Area")
+        cls.customer = Customer.objects.create(name="Customer")
+        cls.alphonso, cls.totapuri = Product.objects.create(name="Alphonso"), Product.objects.create(name="Totapuri")
+        cls.first = PurchaseInvoice.objects.create(vendor=vendor, date=date(2025, 5, 1))
+        cls.second = PurchaseInvoice.objects.create(vendor=vendor, date=date(2025, 5, 1))
+        # Damage and rotten kg are priced into the lot; the kg allocated to sales come off the quantity
+        add_purchase_products(cls.first, [
+            {'product': cls.alphonso.pk, 'quantity': '600', 'price': '40', 'damage': '2', 'rotten': '5'},
+            {'product': cls.totapuri.pk, 'quantity': '400', 'price': '30'},
+        ])
+        add_purchase_products(cls.second, [{'product': cls.alphonso.pk, 'quantity': '500', 'price': '40'}])
+        cls.sale = cls.sell({cls.first: {cls.alphonso: 200, cls.totapuri: 100}, cls.second: {cls.alphonso: 100}})
+
+    @classmethod
+    def sell(cls, kg_per_lot):
+        sale = SalesInvoice.objects.create(vendor=cls.customer, date=date(2025, 5, 2))
+        for lot, products in kg_per_lot.items():
+            sales_lot = SalesLot.objects.create(sales_invoice=sale, purchase_invoice=lot,
+                                                quantity=sum(products.values()))
+            for product, kg in products.items():
+                SalesProduct.objects.create(invoice=sale, product=product, lot=sales_lot, gross_weight=kg, price=50)
+        return sale
+
+    def test_remaining_kg_after_sales(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_lot_availability([self.first, self.second.pk]),
+                             {self.first.pk: 700, self.second.pk: 400})
+        with self.assertNumQueries(1):
+            self.assertEqual(get_lot_product_availability([self.first, self.second]), {
+                (self.first.pk, self.alphonso.pk): 400, (self.first.pk, self.totapuri.pk): 300,
+                (self.second.pk, self.alphonso.pk): 400,
+            })
+        self.assertEqual(self.first.get_product_quantities(), {"Alphonso": 400, "Totapuri": 300})
+
+        self.sell({self.first: {self.alphonso: 400}})
+        lots = annotate_availability(PurchaseInvoice.objects.order_by('pk'))
+        self.assertEqual([(lot.purchased_kg, lot.used_kg, lot.remaining_kg) for lot in lots],
+                         [(1000, 700, 300), (500, 100, 400)])
+        with self.assertNumQueries(0):
+            self.assertEqual(lots[0].available_quantity, 300)
+
+        # Sales beyond the lot are refused; an edited row does not count against itself
+        sales_lot = SalesLot.objects.get(sales_invoice=self.sale, purchase_invoice=self.first)
+        sales_lot.quantity = 600
+        sales_lot.full_clean()
+        sales_lot.quantity = Decimal('600.01')
+        with self.assertRaisesMessage(ValidationError, f"Only 600.00kg available in {self.first.lot_number}"):
+            sales_lot.full_clean()
+        SalesLot.objects.filter(sales_invoice=self.sale).delete()
+        self.assertEqual(get_lot_availability([self.first])[self.first.pk], 600)
+
+    def test_lot_choices_take_a_fixed_number_of_queries(self):
+        self.client.force_login(self.user)
+
+        def add_form():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/admin/Accounts/salesinvoice/add/')
+            self.assertEqual(response.status_code, 200)
+            return response, len(queries)
+
+        response, small = add_form()
+        self.assertContains(response, f"{self.first} - 700 kg left")
+        for _ in range(10):
+            lot = PurchaseInvoice.objects.create(vendor=self.first.vendor, date=date(2025, 5, 3))
+            add_purchase_products(lot, [{'product': self.totapuri.pk, 'quantity': '50', 'price': '30'}])
+        self.sell({self.second: {self.alphonso: 400}})
+        response, large = add_form()
+        self.assertEqual(large, small)
+        # Lots with nothing left are not offered
+        self.assertNotContains(response, f"{self.second} - ")
+
+
+class NumberSequenceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = PurchaseVendor.objects.create(name="Vendor", contact_number="1", area="Area")
+        cls.customer = Customer.objects.create(name="Customer")
+
+    def lot(self, day):
+        lot = PurchaseInvoice.objects.create(vendor=self.vendor, date=day)
+        return lot.invoice_number, lot.lot_number
+
+    def test_numbers_run_per_year(self):
+        self.assertEqual(self.lot(date(2024, 12, 31)), ("MS2024R01", "LOT-01"))
+        self.assertEqual(self.lot(date(2025, 1, 1)), ("MS2025R01", "LOT-02"))
+        self.assertEqual(self.lot(date(2025, 1, 2)), ("MS2025R02", "LOT-03"))
+        self.assertEqual(self.lot(date(2024, 6, 1)), ("MS2024R02", "LOT-04"))
+        self.assertEqual(
+            [SalesInvoice.objects.create(vendor=self.customer, date=day).invoice_number
+             for day in (date(2025, 3, 1), date(2026, 1, 1), date(2025, 3, 2))],
+            ["SA2025S01", "SA2026S01", "SA2025S02"],
+        )
+        # Blocks for bulk inserts continue the same series, in the order of the dates
+        self.assertEqual(purchase_invoice_numbers([date(2025, 5, 1), date(2026, 5, 1), date(2025, 5, 2)]),
+                         ["MS2025R03", "MS2026R01", "MS2025R04"])
+
+    def test_numbers_are_gap_free_and_widen(self):
+        try:
+            with transaction.atomic():
+                self.lot(date(2025, 5, 1))
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(self.lot(date(2025, 5, 1)), ("MS2025R01", "LOT-01"))
+        Sequence.objects.create(name='sales_invoice:2025', value=98)
+        self.assertEqual(sales_invoice_numbers([date(2025, 5, 1)] * 3), ["SA2025S99", "SA2025S100", "SA2025S101"])
+
+    def test_migration_seeds_the_series_after_existing_numbers(self):
+        for day in (date(2024, 5, 1), date(2025, 5, 1), date(2025, 5, 2)):
+            self.lot(day)
+            SalesInvoice.objects.create(vendor=self.customer, date=day)
+        # Numbers issued before the counter table, the old way, and some typed by hand
+        PurchaseInvoice.objects.filter(invoice_number="MS2025R02").update(invoice_number="MS2025R117",
+                                                                          lot_number="LOT-250")
+        PurchaseInvoice.objects.filter(invoice_number="MS2024R01").update(lot_number="OLD-999")
+        SalesInvoice.objects.filter(invoice_number="SA2025S01").update(invoice_number="SA2025S42")
+        SalesInvoice.objects.filter(invoice_number="SA2025S02").update(invoice_number="SA2025-X")
+        Sequence.objects.all().delete()
+
+        importlib.import_module('Accounts.migrations.0010_sequence').seed_sequences(apps, None)
+        self.assertEqual(dict(Sequence.objects.values_list('name', 'value')), {
+            'purchase_invoice:2024': 1, 'purchase_invoice:2025': 117, 'lot': 250, 'sales_invoice:2024': 1,
+            'sales_invoice:2025': 42,
+        })
+        self.assertEqual(self.lot(date(2025, 6, 1)), ("MS2025R118", "LOT-251"))
+        self.assertEqual(SalesInvoice.objects.create(vendor=self.customer, date=date(2025, 6, 1)).invoice_number,
+                         "SA2025S43")
+
+
+class SalesTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name="Customer")
+        cls.product = Product.objects.create(name="Banganapalli")
+        cls.sales = [SalesInvoice.objects.create(vendor=customer, date=date(2025, 5, 1), no_of_crates=10,
+                                                 cost_per_crate=100) for _ in range(2)]
+
+    def assertTotalsStored(self):
+        for sale in SalesInvoice.objects.filter(pk__in=[sale.pk for sale in self.sales]):
+            self.assertEqual({field: getattr(sale, field) for field in SalesInvoice.TOTAL_FIELDS},
+                             sale.calculate_totals())
+
+    def test_stored_totals_follow_line_items_and_payments(self):
+        first, second = self.sales
+        line = SalesProduct.objects.create(invoice=first, product=self.product, gross_weight=Decimal('100'),
+                                           price=Decimal('30'))
+        SalesProduct.objects.create(invoice=first, product=self.product, gross_weight=Decimal('50.5'),
+                                    discount=Decimal('10'), price=Decimal('40'))
+        self.assertTotalsStored()
+
+        line = SalesProduct.objects.get(pk=line.pk)
+        line.gross_weight = Decimal('120')
+        line.save()
+        self.assertTotalsStored()
+        line.invoice = second
+        line.save()
+        self.assertTotalsStored()
+        line.delete()
+        self.assertTotalsStored()
+
+        payment = SalesPayment.objects.create(invoice=first, amount=500)
+        self.assertTotalsStored()
+        payment.amount = 700
+        payment.invoice = second
+        payment.save()
+        self.assertTotalsStored()
+        payment.delete()
+        self.assertTotalsStored()
+
+    def test_rebuild_command_verifies_and_repairs(self):
+        first, _ = self.sales
+        SalesProduct.objects.create(invoice=first, product=self.product, gross_weight=Decimal('100'),
+                                    price=Decimal('30'))
+        out = StringIO()
+        call_command('rebuild_sales_totals', '--verify', stdout=out)
+        self.assertIn("All 2 sales invoices have correct totals.", out.getvalue())
+
+        SalesInvoice.objects.filter(pk=first.pk).update(net_total=0)
+        with self.assertRaisesMessage(CommandError, "1 of 2 sales invoices have stale totals."):
+            call_command('rebuild_sales_totals', '--verify', stdout=out)
+        self.assertIn(f"{first.invoice_number}: net_total is 0.00, expected 3000", out.getvalue())
+
+        version = SalesInvoice.objects.get(pk=first.pk).version
+        call_command('rebuild_sales_totals', stdout=out)
+        self.assertIn("Rebuilt totals for 1 of 2 sales invoices.", out.getvalue())
+        self.assertTotalsStored()
+        self.assertEqual(SalesInvoice.objects.get(pk=first.pk).version, version + 1)
+
+
+class ReportExportTests(TestCase):
+    SALES_HEADER = [
+        "Invoice No", "Date", "Customer", "Vehicle No", "S/No", "Product", "Lot No",
+        "Gross Weight (Kg)", "Discount %", "Rotten (Kg)", "Net Weight (Kg)", "Price/Kg", "Total",
+        "Invoice Net Total", "Invoice Final Total", "Invoice Paid", "Invoice Due",
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='secret')
+        cls.customer = Customer.objects.create(name="Customer")
+        cls.products = [Product.objects.create(name="Banganapalli"), Product.objects.create(name="Alphonso")]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def add_sales(self, count, lines=3):
+        for day in range(1, count + 1):
+            sale = SalesInvoice.objects.create(vendor=self.customer, date=date(2025, 5, day))
+            sync_sales_products(sale, [{'product': self.products[index % 2].pk, 'gross_weight': '100',
+                                        'price': '30'} for index in range(lines)])
+
+    def csv_rows(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        with CaptureQueriesContext(connection) as queries:
+            content = b''.join(response.streaming_content).decode('utf-8')
+        return response, list(csv.reader(StringIO(content))), len(queries)
+
+    def test_sales_csv_streams_in_a_fixed_number_of_queries(self):
+        self.add_sales(2)
+        response, rows, small = self.csv_rows('export_sales_report')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="sales_report.csv"')
+        self.assertEqual(rows[0], self.SALES_HEADER)
+        self.assertEqual(len(rows), 1 + 6)
+        self.assertEqual(rows[1][:3], [SalesInvoice.objects.earliest('pk').invoice_number, '2025-05-01', "Customer"])
+
+        self.add_sales(20)
+        _, rows, large = self.csv_rows('export_sales_report')
+        self.assertEqual(len(rows), 1 + 66)
+        self.assertEqual(large, small)
+
+        _, rows, _ = self.csv_rows('export_sales_report', start_date='2025-05-02', end_date='2025-05-03')
+        self.assertEqual(len(rows), 1 + 9)
+
+    def test_xlsx_export(self):
+        self.add_sales(3)
+        response = self.client.get(reverse('export_sales_report'), {'format': 'xlsx'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="sales_report.xlsx"')
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertEqual(sheet.count('<row>'), 1 + 9)
+        self.assertIn('<t xml:space="preserve">Invoice No</t>', sheet)
+
+    def test_inventory_and_financial_csv(self):
+        self.add_sales(2)
+        Expense.objects.create(date=date(2025, 5, 1), paid_by="A", paid_to="B", description="Diesel",
+                               amount=Decimal('50'), user=self.user)
+        _, rows, _ = self.csv_rows('export_inventory_report')
+        self.assertEqual(rows[0][:3], ["Product", "Category", "Current Stock"])
+        self.assertEqual([row[0] for row in rows[1:]], ["Alphonso", "Banganapalli"])
+
+        response, rows, _ = self.csv_rows('export_financial_report')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="financial_report.csv"')
+        self.assertEqual(rows[0], ["Date", "Type", "Number", "Party", "Description", "Amount"])
+        self.assertEqual([row[1] for row in rows[1:4]], ["Sale", "Expense", "Sale"])
+        self.assertEqual(rows[-1], ["", "Profit/Loss", "", "", "", "17950"])
+
+
+class DailyRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='secret')
+        cls.vendor = PurchaseVendor.objects.create(name="Vendor", contact_number="1", area="Area")
+        cls.customers = [Customer.objects.create(name="First"), Customer.objects.create(name="Second")]
+        cls.products = [Product.objects.create(name="Banganapalli"), Product.objects.create(name="Alphonso")]
+
+    def rollup_rows(self):
+        return (
+            sorted(DailySummary.objects.exclude(
+                sales_total=0, sales_gross_weight=0, sales_count=0, purchases_total=0, purchases_count=0,
+                expenses_total=0, damages_total=0,
+            ).values_list('date', 'sales_total', 'sales_gross_weight', 'sales_count', 'purchases_total',
+                          'purchases_count', 'expenses_total', 'damages_total')),
+            sorted(DailyProductSales.objects.exclude(gross_weight=0, net_weight=0, total=0).values_list(
+                'date', 'product_id', 'gross_weight', 'net_weight', 'total')),
+            sorted(DailyCustomerSales.objects.exclude(invoice_count=0, net_total=0).values_list(
+                'date', 'customer_id', 'invoice_count', 'net_total')),
+        )
+
+    def test_incremental_rollups_match_rebuild(self):
+        sale = SalesInvoice.objects.create(vendor=self.customers[0], date=date(2025, 5, 1))
+        line = SalesProduct.objects.create(invoice=sale, product=self.products[0], gross_weight=Decimal('100'),
+                                           price=Decimal('30'))
+        SalesProduct.objects.create(invoice=sale, product=self.products[1], gross_weight=Decimal('50'),
+                                    discount=Decimal('10'), price=Decimal('40'))
+        other = SalesInvoice.objects.create(vendor=self.customers[1], date=date(2025, 5, 2))
+        SalesProduct.objects.create(invoice=other, product=self.products[0], gross_weight=Decimal('20'),
+                                    price=Decimal('25'))
+
+        # Edit a line item, change its product, move the invoice to another day and customer
+        line = SalesProduct.objects.get(pk=line.pk)
+        line.gross_weight = Decimal('120')
+        line.product = self.products[1]
+        line.save()
+        sale = SalesInvoice.objects.get(pk=sale.pk)
+        sale.date = '2025-05-03'
+        sale.vendor_id = str(self.customers[1].pk)
+        sale.save()
+        other.delete()
+
+        lot = PurchaseInvoice.objects.create(vendor=self.vendor, date=date(2025, 5, 1))
+        PurchaseProduct.objects.create(invoice=lot, product=self.products[0], quantity=Decimal('500'),
+                                       price=Decimal('20'))
+        lot.save()
+        lot = PurchaseInvoice.objects.get(pk=lot.pk)
+        lot.date = date(2025, 5, 4)
+        lot.save()
+        expense = Expense.objects.create(date=date(2025, 5, 1), paid_by="A", paid_to="B", description="Diesel",
+                                         amount=Decimal('50'), user=self.user)
+        expense = Expense.objects.get(pk=expense.pk)
+        expense.amount = Decimal('75')
+        expense.save()
+        Damages.objects.create(date=date(2025, 5, 2), name="Crate", due_to="Rain", description="Wet",
+                               amount_loss=Decimal('10'), user=self.user).delete()
+
+        incremental = self.rollup_rows()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.rollup_rows())
+        self.assertEqual(
+            list(DailySummary.objects.filter(date=date(2025, 5, 3)).values_list('sales_total', 'sales_count')),
+            [(Decimal('5400.00'), 1)],
+        )
+
+
+class SalesLineItemSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Customer")
+        cls.products = [Product.objects.create(name=f"Variety {i}") for i in range(3)]
+
+    def row(self, item, **changes):
+        row = {'id': item.pk, 'product': item.product_id, 'gross_weight': item.gross_weight,
+               'discount': item.discount, 'rotten': item.rotten, 'price': item.price}
+        row.update(changes)
+        return row
+
+    def test_sync_writes_only_changes_in_a_few_queries(self):
+        sale = SalesInvoice.objects.create(vendor=self.customer, date=date(2025, 5, 1))
+        sync_sales_products(sale, [
+            {'product': self.products[i % 3].pk, 'gross_weight': '100', 'price': '30', 'discount': '0', 'rotten': '0'}
+            for i in range(60)
+        ])
+        items = list(sale.sales_products.order_by('serial_number'))
+        self.assertEqual([item.serial_number for item in items], list(range(1, 61)))
+
+        rows = [self.row(item) for item in items]
+        rows[0] = self.row(items[0], gross_weight='120')
+        rows[1] = self.row(items[1], product=self.products[2].pk, discount='10')
+        del rows[2]
+        rows.append({'product': self.products[0].pk, 'gross_weight': '50', 'price': '40', 'discount': '0',
+                     'rotten': '2'})
+
+        with CaptureQueriesContext(connection) as queries:
+            result = sync_sales_products(sale, rows)
+        # Including one INSERT and one UPDATE for the stock movements
+        self.assertLessEqual(len(queries), 14)
+        # Rows after the removed one move up a serial number and the new row
+        # takes over the removed row's record
+        self.assertEqual(result, {'created': 0, 'updated': 60, 'deleted': 0})
+
+        sale = SalesInvoice.objects.get(pk=sale.pk)
+        self.assertEqual(sale.calculate_totals()['net_total'], sale.net_total)
+        self.assertEqual(sale.calculate_totals()['total_gross_weight'], sale.total_gross_weight)
+        self.assertEqual(sale.sales_products.get(serial_number=60).total, Decimal('1920.00'))
+
+        summary = DailySummary.objects.get(date=date(2025, 5, 1))
+        products = sorted(DailyProductSales.objects.values_list('product_id', 'net_weight', 'total'))
+        rebuild_rollups()
+        self.assertEqual(DailySummary.objects.get(date=date(2025, 5, 1)).sales_total, summary.sales_total)
+        self.assertEqual(sorted(DailyProductSales.objects.values_list('product_id', 'net_weight', 'total')), products)
+
+    def test_unchanged_rows_are_not_written(self):
+        sale = SalesInvoice.objects.create(vendor=self.customer, date=date(2025, 5, 1))
+        sync_sales_products(sale, [
+            {'product': self.products[0].pk, 'gross_weight': '100', 'price': '30', 'discount': '0', 'rotten': '0'}
+            for _ in range(5)
+        ])
+        rows = [self.row(item) for item in sale.sales_products.order_by('serial_number')]
+        with CaptureQueriesContext(connection) as queries:
+            result = sync_sales_products(sale, rows)
+        self.assertEqual(result, {'created': 0, 'updated': 0, 'deleted': 0})
+        self.assertLessEqual(len(queries), 4)
+
+
+class StockLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = PurchaseVendor.objects.create(name="Vendor", contact_number="1", area="Area")
+        cls.customer = Customer.objects.create(name="Customer")
+
+    def stock(self, product):
+        return Product.objects.get(pk=product.pk).current_stock
+
+    def test_movements_keep_stock_and_ledger_in_step(self):
+        product = Product.objects.create(name="Banganapalli", current_stock=10)
+        other = Product.objects.create(name="Alphonso")
+
+        lot = PurchaseInvoice.objects.create(vendor=self.vendor, date=date(2025, 5, 1))
+        line = PurchaseProduct.objects.create(invoice=lot, product=product, quantity=Decimal('500'),
+                                              damage=Decimal('2'), rotten=Decimal('5'), price=Decimal('20'))
+        self.assertEqual(self.stock(product), 10 + 500 - 15)
+        line = PurchaseProduct.objects.get(pk=line.pk)
+        line.quantity = Decimal('400')
+        line.save()
+        self.assertEqual(self.stock(product), 10 + 400 - 13)
+
+        sale = SalesInvoice.objects.create(vendor=self.customer, date=date(2025, 5, 2))
+        # Sales take off their net weight: 100.5 kg less 10.5 kg rotten
+        item = SalesProduct.objects.create(invoice=sale, product=product, gross_weight=Decimal('100.5'),
+                                           rotten=Decimal('10.5'), price=Decimal('30'))
+        self.assertEqual(self.stock(product), 397 - 90)
+        item = SalesProduct.objects.get(pk=item.pk)
+        item.product = other
+        item.save()
+        self.assertEqual((self.stock(product), self.stock(other)), (397, -90))
+        sync_sales_products(sale, [{'product': product.pk, 'gross_weight': '50', 'discount': '10', 'price': '30'}])
+        self.assertEqual((self.stock(product), self.stock(other)), (352, 0))
+        sale.delete()
+        self.assertEqual(self.stock(product), 397)
+
+        # Editing the stock by hand posts an adjustment
+        product = Product.objects.get(pk=product.pk)
+        product.current_stock = '390'
+        product.save()
+        self.assertEqual(self.stock(product), 390)
+        self.assertEqual(StockMovement.objects.filter(product=product, kind='adjustment').get().quantity, -7)
+        self.assertEqual(stock_mismatches(), [])
+
+        Product.objects.filter(pk=product.pk).update(current_stock=0)
+        self.assertEqual(len(stock_mismatches()), 1)
+        reconcile_stock()
+        self.assertEqual(self.stock(product), 390)
+
+    def test_deleting_a_product_takes_its_lines_and_ledger(self):
+        product = Product.objects.create(name="Banganapalli")
+        other = Product.objects.create(name="Alphonso")
+        lot = PurchaseInvoice.objects.create(vendor=self.vendor, date=date(2025, 5, 1))
+        add_purchase_products(lot, [{'product': product.pk, 'quantity': '500', 'price': '20'},
+                                    {'product': other.pk, 'quantity': '100', 'price': '30'}])
+        sale = SalesInvoice.objects.create(vendor=self.customer, date=date(2025, 5, 2))
+        sync_sales_products(sale, [{'product': product.pk, 'gross_weight': '50', 'price': '30'},
+                                   {'product': other.pk, 'gross_weight': '10', 'price': '40'}])
+
+        self.client.force_login(User.objects.create_user('clerk', password='secret'))
+        response = self.client.get(reverse('delete_inventory_item', args=[product.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(StockMovement.objects.filter(product_id=product.pk).exists())
+        # The sale loses the line, the other product keeps its stock
+        sale.refresh_from_db()
+        self.assertEqual(sale.net_total, Decimal('400.00'))
+        self.assertEqual(self.stock(other), 90)
+
+        Product.objects.filter(pk=other.pk).delete()
+        self.assertFalse(StockMovement.objects.exists())
+        self.assertEqual(stock_mismatches(), [])
+
+    def test_stock_as_of_uses_snapshots(self):
+        today = date.today()
+        product = Product.objects.create(name="Banganapalli", current_stock=100)
+        StockMovement.objects.filter(product=product).update(date=today - timedelta(days=3))
+        StockMovement.objects.create(product=product, kind='sale', quantity=-30, date=today - timedelta(days=2))
+        StockMovement.objects.create(product=product, kind='sale', quantity=-20, date=today - timedelta(days=1))
+
+        take_snapshot(today - timedelta(days=2))
+        # A movement back-dated before the snapshot is not counted again after it
+        StockMovement.objects.create(product=product, kind='purchase', quantity=5, date=today - timedelta(days=3))
+        self.assertEqual(stock_as_of(today - timedelta(days=3))[product.pk], 105)
+        self.assertEqual(stock_as_of(today - timedelta(days=2))[product.pk], 70)
+        self.assertEqual(stock_as_of(today - timedelta(days=1))[product.pk], 50)
+        with self.assertRaises(ValueError):
+            take_snapshot(today)
+        with self.assertRaises(ValidationError):
+            StockMovement.objects.get(kind='opening').delete()
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Reads SQLite's EXPLAIN QUERY PLAN output")
+class HotQueryIndexTests(TestCase):
+    """The date / vendor / invoice lookups of the lists and reports must be served by an index."""
+
+    # "SCAN <table>" without "USING ... INDEX" reads every row of the table
+    FULL_SCAN = re.compile(r'\bSCAN (\w+)(?! USING)\s*$')
+
+    def assertNoFullScan(self, queryset):
+        plan = queryset.explain()
+        scans = [line for line in plan.splitlines() if self.FULL_SCAN.search(line)]
+        self.assertEqual(scans, [], f"Full table scan in:\n{queryset.query}\n{plan}")
+
+    def test_hot_queries_use_indexes(self):
+        start, end = '2025-05-01', '2025-05-31'
+        querysets = [
+            filter_report_dates(SalesInvoice.objects.select_related('vendor'), start, end).order_by('-date')[:10],
+            SalesInvoice.objects.order_by('-date', '-id')[:25],
+            SalesInvoice.objects.filter(vendor_id=1, date__gte=date(2025, 1, 1)).order_by('-date'),
+            filter_report_dates(PurchaseInvoice.objects.select_related('vendor'), start, end).order_by('-date')[:10],
+            PurchaseInvoice.objects.filter(vendor_id=1, date__year=2025),
+            filter_report_dates(Expense.objects.all(), start, end).values('date').annotate(total=Sum('amount')),
+            filter_report_dates(Damages.objects.all(), start, end).values('date').annotate(total=Sum('amount_loss')),
+            filter_report_dates(SalesPayment.objects.all(), start, end).values('payment_mode').annotate(
+                total=Sum('amount')),
+            SalesProduct.objects.filter(invoice_id=1).order_by('serial_number'),
+            SalesProduct.objects.filter(product_id=1, invoice__date__gte=date(2025, 1, 1)).values(
+                'invoice__date').annotate(total=Sum('total')),
+            SalesLot.objects.filter(purchase_invoice_id=1).values('purchase_invoice').annotate(used=Sum('quantity')),
+        ]
+        for queryset in querysets:
+            with self.subTest(sql=str(queryset.query)):
+                self.assertNoFullScan(queryset)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "SQLite pragmas")
+class RequestStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='secret')
+
+    def setUp(self):
+        reset_stats()
+        self.addCleanup(reset_stats)
+        self.client.force_login(self.user)
+
+    def test_queries_and_timings_are_recorded_per_view(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/accounts/reports/')
+        with CaptureQueriesContext(connection) as more:
+            self.client.get('/accounts/reports/')
+        [row] = get_view_stats()
+        self.assertEqual((row['view'], row['requests']), ('reports', 2))
+        self.assertEqual((row['queries'], row['max_queries']), (len(queries) + len(more), len(queries)))
+        self.assertEqual(row['avg_queries'], (len(queries) + len(more)) / 2)
+        self.assertGreater(row['template_ms'], 0)
+        self.assertGreaterEqual(row['max_ms'], row['avg_ms'])
+
+    def test_server_timing_is_sent_to_staff_or_in_debug(self):
+        self.assertNotIn('Server-Timing', self.client.get('/accounts/reports/'))
+        with override_settings(DEBUG=True):
+            self.assertIn('total;dur=', self.client.get('/accounts/reports/')['Server-Timing'])
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.assertIn('total;dur=', self.client.get('/accounts/reports/')['Server-Timing'])
+
+    @override_settings(REQUEST_STATS_SLOW_QUERIES=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('Accounts.request_stats', 'WARNING') as logs:
+            self.client.get('/accounts/reports/')
+        self.assertIn('Slow request GET /accounts/reports/ (reports)', logs.output[0])
+        self.assertEqual([request['view'] for request in get_slow_requests()], ['reports'])
+
+    def test_unmatched_paths_share_one_row(self):
+        for index in range(5):
+            self.assertEqual(self.client.get(f'/no-such-page-{index}/').status_code, 404)
+        self.assertEqual([(row['view'], row['requests']) for row in get_view_stats()], [(UNRESOLVED, 5)])
+        reset_stats()
+        self.assertEqual((get_view_stats(), get_slow_requests()), ([], []))
+
+
+class SQLiteProfileTests(TestCase):
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234, 'cache_size': -2000})
+    def test_pragmas_are_applied_to_new_connections(self):
+        configure_connection(sender=None, connection=connection)
+        with connection.cursor() as cursor:
+            self.assertEqual(cursor.execute("PRAGMA busy_timeout").fetchone()[0], 1234)
+            self.assertEqual(cursor.execute("PRAGMA cache_size").fetchone()[0], -2000)
+
+    def test_pragma_statements_are_validated(self):
+        self.assertEqual(pragma_statements({'journal_mode': 'WAL'}), ["PRAGMA journal_mode = WAL"])
+        with self.assertRaises(ValueError):
+            pragma_statements({'journal_mode': 'WAL; DROP TABLE Accounts_product'})
+
+
+class DashboardCacheTests(TransactionTestCase):
+    # Real commits: the cache version is bumped by on_commit callbacks
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('clerk', password='secret')
+        self.customer = Customer.objects.create(name="Customer")
+        self.product = Product.objects.create(name="Banganapalli", current_stock=100)
+        self.client.force_login(self.user)
+
+    def get_dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/accounts/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        return response.context, len(queries)
+
+    def test_dashboard_is_served_from_cache_until_data_changes(self):
+        context, cold = self.get_dashboard()
+        self.assertEqual(context['total_expenses'], 0)
+        context, warm = self.get_dashboard()
+        # Session, user and the data version
+        self.assertLessEqual(warm, 3)
+        self.assertLess(warm, cold)
+
+        version = data_version()
+        with transaction.atomic():
+            Expense.objects.create(date=date.today(), paid_by="A", paid_to="B", description="Diesel",
+                                   amount=Decimal('50'), user=self.user)
+            sale = SalesInvoice.objects.create(vendor=self.customer, date=date.today())
+            sync_sales_products(sale, [{'product': self.product.pk, 'gross_weight': '10', 'price': '30'}])
+            self.assertEqual(data_version(), version)
+        # One bump for the whole transaction, after it commits
+        self.assertEqual(data_version(), version + 1)
+
+        context, _ = self.get_dashboard()
+        self.assertEqual(context['total_expenses'], Decimal('50'))
+        self.assertEqual(context['total_sales'], Decimal('300'))
+        self.assertEqual([product.name for product in context['top_products']], ["Banganapalli"])
+
+    def test_version_is_bumped_once_per_committed_transaction(self):
+        version = data_version()
+        Expense.objects.create(date=date.today(), paid_by="A", paid_to="B", description="Diesel",
+                               amount=Decimal('50'), user=self.user)
+        # Outside a transaction the bump runs at once
+        self.assertEqual(data_version(), version + 1)
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Expense.objects.create(date=date.today(), paid_by="A", paid_to="B", description="Diesel",
+                                       amount=Decimal('50'), user=self.user)
+                raise RuntimeError
+        self.assertEqual(data_version(), version + 1)
+
+        with transaction.atomic():
+            for _ in range(3):
+                Expense.objects.create(date=date.today(), paid_by="A", paid_to="B", description="Diesel",
+                                       amount=Decimal('50'), user=self.user)
+        self.assertEqual(data_version(), version + 2)
+
+
+class AsyncViewTests(TransactionTestCase):
+    # The async views query on worker threads with their own connections,
+    # which only see committed data
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('clerk', password='secret')
+        customer = Customer.objects.create(name="Customer")
+        product = Product.objects.create(name="Banganapalli", current_stock=100)
+        for day in (1, 2):
+            sale = SalesInvoice.objects.create(vendor=customer, date=date(2025, 5, day))
+            SalesProduct.objects.create(invoice=sale, product=product, gross_weight=Decimal('10'), price=Decimal('30'))
+        Expense.objects.create(date=date(2025, 5, 1), paid_by="A", paid_to="B", description="Diesel",
+                               amount=Decimal('50'), user=self.user)
+
+    def figures(self, context, names):
+        return {name: context[name] for name in names}
+
+    async def test_async_views_match_sync_views(self):
+        await self.async_client.aforce_login(self.user)
+        await sync_to_async(self.client.force_login)(self.user)
+        pages = [
+            ('/accounts/dashboard/', '/accounts/async/dashboard/',
+             ['total_sales', 'total_expenses', 'inventory_data', 'recent_sales', 'top_products']),
+            ('/accounts/reports/?start_date=2025-05-02', '/accounts/async/reports/?start_date=2025-05-02',
+             ['total_sales', 'total_profit', 'payment_data', 'top_customers', 'recent_sales']),
+        ]
+        for sync_url, async_url, names in pages:
+            sync_response = await sync_to_async(self.client.get)(sync_url)
+            await sync_to_async(cache.clear)()
+            async_response = await self.async_client.get(async_url)
+            self.assertEqual(async_response.status_code, 200)
+            self.assertEqual(self.figures(async_response.context, names), self.figures(sync_response.context, names))
+        self.assertEqual(async_response.context['total_sales'], Decimal('300'))
+
+    async def test_async_views_require_login(self):
+        response = await self.async_client.get('/accounts/async/dashboard/')
+        self.assertEqual(response.status_code, 302)
+
+
+class LazyPdfTests(TestCase):
+    def test_views_do_not_import_the_pdf_stack(self):
+        # A fresh interpreter: this one may have rendered PDFs already
+        code = (
+            "import sys, django\n"
+            "django.setup()\n"
+            "from django.urls import get_resolver\n"
+            "get_resolver().url_patterns\n"
+            "print(sorted(m for m in ('reportlab', 'xhtml2pdf', 'Accounts.pdf') if m in sys.modules))\n"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='Mango_project.settings')
+        result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_fonts_and_styles_are_loaded_once(self):
+        from Accounts import pdf
+
+        pdf.ensure_fonts()
+        pdf.ensure_fonts()
+        self.assertIs(pdf.get_styles(), pdf.get_styles())
+        self.assertIn('InvoiceTitle', pdf.get_styles())
+        self.assertEqual(pdfmetrics.getFont('DejaVuSans').fontName, 'DejaVuSans')
+
+
+class InvoicePdfTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='secret')
+        vendor = PurchaseVendor.objects.create(name="Vendor", contact_number="1", area="Area")
+        cls.product = Product.objects.create(name="Variety")
+        cls.lot = PurchaseInvoice.objects.create(vendor=vendor, date=date(2025, 5, 1))
+        add_purchase_products(cls.lot, [{'product': cls.product.pk, 'quantity': '25', 'price': '40'}])
+        cls.sale = SalesInvoice.objects.create(vendor=Customer.objects.create(name="Customer"),
+                                               date=date(2025, 5, 1))
+        SalesProduct.objects.create(invoice=cls.sale, product=cls.product, gross_weight=10, price=30)
+
+    def setUp(self):
+        cache_root = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_root.cleanup)
+        self.enterContext(override_settings(PDF_CACHE_ROOT=cache_root.name))
+
+    def test_pdf_views_require_login(self):
+        for url in (reverse('generate_invoice_pdf', args=[self.lot.pk]),
+                    reverse('generate_sales_invoice_pdf', args=[self.sale.pk])):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response['Location'].startswith(settings.LOGIN_URL))
+
+    def cached_pdf(self):
+        """(path, rendered) of the sales invoice's PDF as stored now."""
+        rendered = []
+
+        def render():
+            rendered.append(True)
+            return b'%PDF-1.4 stub'
+
+        invoice = SalesInvoice.objects.only('id', 'invoice_number', 'version').get(pk=self.sale.pk)
+        return get_cached_pdf('sales_invoice', invoice, render), bool(rendered)
+
+    def test_pdfs_are_rendered_once_per_invoice_version(self):
+        path, rendered = self.cached_pdf()
+        self.assertTrue(rendered)
+        self.assertEqual(self.cached_pdf(), (path, False))
+
+        line = SalesProduct.objects.get(invoice=self.sale)
+        line.price = 35
+        line.save()
+        SalesLot.objects.create(sales_invoice=self.sale, purchase_invoice=self.lot, quantity=10)
+        SalesPayment.objects.create(invoice=self.sale, amount=100)
+
+        def change_payment_mode():
+            # Same amount, so no change to the totals, but the mode is printed
+            payment = SalesPayment.objects.get(invoice=self.sale)
+            payment.payment_mode = 'upi'
+            payment.save()
+
+        for edit in (lambda: SalesProduct.objects.filter(invoice=self.sale).get().save(),
+                     lambda: SalesLot.objects.get(sales_invoice=self.sale).save(),
+                     change_payment_mode,
+                     lambda: SalesPayment.objects.get(invoice=self.sale).delete()):
+            edit()
+            new_path, rendered = self.cached_pdf()
+            self.assertTrue(rendered)
+            # The previous version's copy is deleted when the new one is stored
+            self.assertFalse(path.exists())
+            self.assertEqual(list(new_path.parent.iterdir()), [new_path])
+            path = new_path
+
+    def test_renaming_the_customer_or_a_product_gives_a_new_pdf(self):
+        path, rendered = self.cached_pdf()
+        customer = Customer.objects.get(sales_invoices=self.sale)
+        customer.save()
+        self.assertEqual(self.cached_pdf(), (path, False))
+
+        customer.name = "Renamed customer"
+        customer.save()
+        path, rendered = self.cached_pdf()
+        self.assertTrue(rendered)
+
+        lot_version = PurchaseInvoice.objects.get(pk=self.lot.pk).version
+        product = Product.objects.get(pk=self.product.pk)
+        product.name = "Renamed variety"
+        product.save()
+        self.assertTrue(self.cached_pdf()[1])
+        self.assertEqual(PurchaseInvoice.objects.get(pk=self.lot.pk).version, lot_version + 1)
+
+        vendor = PurchaseVendor.objects.get(invoices=self.lot)
+        vendor.contact_number = "2"
+        vendor.save()
+        self.assertEqual(PurchaseInvoice.objects.get(pk=self.lot.pk).version, lot_version + 2)
+
+    def test_variants_are_cached_apart(self):
+        self.client.force_login(self.user)
+        url = reverse('generate_sales_invoice_pdf', args=[self.sale.pk])
+        for params in ({}, {'hide_payments': '1'}, {}):
+            response = self.client.get(url, params)
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+            self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        cached = sorted(path.name.split('-')[0] for path in (pdf_cache_root() / 'sales_invoice').glob('*/*.pdf'))
+        self.assertEqual(cached, ['default', 'hide_payments'])
+
+
+class InvoiceBatchJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', password='secret')
+        product = Product.objects.create(name="Variety")
+        customer = Customer.objects.create(name="Customer")
+        cls.sales = []
+        for day in (1, 2):
+            sale = SalesInvoice.objects.create(vendor=customer, date=date(2025, 5, day))
+            SalesProduct.objects.create(invoice=sale, product=product, gross_weight=10, price=30)
+            cls.sales.append(sale)
+
+    def setUp(self):
+        for name in ('MEDIA_ROOT', 'PDF_CACHE_ROOT'):
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            self.enterContext(override_settings(**{name: directory.name}))
+
+    def job(self, **fields):
+        return InvoiceBatchJob.objects.create(invoice_ids=[sale.pk for sale in self.sales], created_by=self.user,
+                                              **fields)
+
+    def test_job_records_progress_and_output(self):
+        job = self.job()
+        run_batch_job(job, workers=1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.done, job.total, job.error), ('done', 2, 2, ''))
+        self.assertEqual(len(PdfReader(job.output.path).pages), 2)
+        self.assertGreater(job.updated_at, job.created_at)
+
+    def test_failures_are_recorded_on_the_job(self):
+        job = self.job()
+        with mock.patch('Accounts.pdf_batch.render_invoice_batch', side_effect=RuntimeError("disk full")):
+            with self.assertRaises(RuntimeError):
+                run_batch_job(job, workers=1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', "disk full"))
+
+    def test_a_job_whose_process_died_times_out_with_its_log(self):
+        job = self.job()
+        # The process crashes at startup: its database has no tables
+        with tempfile.NamedTemporaryFile(suffix='.sqlite3') as database:
+            with mock.patch.dict(os.environ, {'DB_NAME': database.name}):
+                self.assertNotEqual(start_batch_job(job).wait(timeout=120), 0)
+        with open(job_log_path(job.pk)) as log:
+            self.assertIn("no such table", log.read())
+
+        self.client.force_login(self.user)
+        self.assertEqual(expire_stale_jobs(), 0)
+        self.assertContains(self.client.get('/admin/Accounts/invoicebatchjob/'), 'Pending')
+        InvoiceBatchJob.objects.filter(pk=job.pk).update(updated_at=job.updated_at - timedelta(minutes=10))
+        self.assertContains(self.client.get('/admin/Accounts/invoicebatchjob/'), 'Failed')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn("The print process stopped without finishing the job.", job.error)
+        self.assertIn("no such table", job.error)
+
+
+class VoucherTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='secret')
+        for day in (1, 2, 20):
+            Expense.objects.create(date=date(2025, 3, day), paid_by="Office", paid_to="Transport",
+                                   description="Diesel <and> toll", amount=Decimal('100.00'), user=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_voucher_rows_match_the_template_fields(self):
+        expense = Expense.objects.first()
+        self.assertEqual([label for label, _ in voucher_rows('expense', expense)],
+                         ['Date', 'Paid By', 'Paid To', 'Amount', 'Description'])
+        self.assertTrue(render_voucher('expense', expense).startswith(b'%PDF'))
+
+    def test_bulk_vouchers_print_a_page_per_voucher_in_range(self):
+        response = self.client.get('/accounts/vouchers/expense/pdf/',
+                                   {'start_date': '2025-03-01', 'end_date': '2025-03-10'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(PdfReader(BytesIO(response.content)).pages), 2)
+        self.assertEqual(self.client.get('/accounts/vouchers/salary/pdf/').status_code, 404)
+
+
+class AttachmentStorageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='secret')
+        cls.invoice = SalesInvoice.objects.create(vendor=Customer.objects.create(name="Customer"),
+                                                  date=date(2025, 5, 1), no_of_crates=10, cost_per_crate=10)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.client.force_login(self.user)
+
+    def screenshot(self, name='upi.png'):
+        buffer = BytesIO()
+        PILImage.new('RGB', (1080, 2340), 'white').save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_identical_uploads_are_stored_once_with_a_thumbnail(self):
+        first = SalesPayment.objects.create(invoice=self.invoice, amount=10, attachment=self.screenshot('a.png'))
+        second = SalesPayment.objects.create(invoice=self.invoice, amount=10, attachment=self.screenshot('b.PNG'))
+        self.assertEqual(first.attachment.name, second.attachment.name)
+        self.assertRegex(first.attachment.name, r'^attachments/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        storage = first.attachment.storage
+        with PILImage.open(storage.path(thumbnail_name(first.attachment.name))) as thumbnail:
+            self.assertLessEqual(max(thumbnail.size), 320)
+
+        response = self.client.get(f'/accounts/payments/sales/{first.pk}/attachment/thumbnail/')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(int(response['Content-Length']), first.attachment.size)
+
+    def test_downloads_support_ranges_and_etags(self):
+        payment = SalesPayment.objects.create(invoice=self.invoice, amount=10, attachment=self.screenshot())
+        content = payment.attachment.read()
+        url = f'/accounts/payments/sales/{payment.pk}/attachment/'
+
+        response = self.client.get(url, headers={'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), content[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(content)}')
+        self.assertEqual(self.client.get(url, headers={'Range': f'bytes={len(content)}-'}).status_code, 416)
+
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+
+class SyntheticDataTests(TestCase):
+    def test_generated_season_is_consistent(self):
+        added = generate(300, seed=1, start=date(2025, 4, 1), days=20)
+        self.assertEqual(added['SalesProduct'], SalesProduct.objects.count())
+        self.assertGreaterEqual(added['SalesProduct'], 290)
+
+        # What the signal handlers would have kept up to date
+        self.assertEqual(stock_mismatches(), [])
+        summary = sorted(DailySummary.objects.values_list('date', 'sales_total', 'purchases_total', 'expenses_total'))
+        rebuild_rollups()
+        self.assertEqual(
+            sorted(DailySummary.objects.values_list('date', 'sales_total', 'purchases_total', 'expenses_total')),
+            summary,
+        )
+        for invoice in SalesInvoice.objects.annotate(
+            lines_total=Sum('sales_products__total'), lines_gross=Sum('sales_products__gross_weight'),
+        ):
+            self.assertEqual((invoice.net_total, invoice.total_gross_weight), (invoice.lines_total, invoice.lines_gross))
+            self.assertEqual(invoice.paid_amount, sum(payment.amount for payment in invoice.payments.all()))
+            self.assertGreaterEqual(invoice.due_amount, 0)
+        for lot in annotate_availability(PurchaseInvoice.objects.annotate(lines_total=Sum('purchase_products__total'))):
+            self.assertEqual(lot.net_total, lot.lines_total)
+            self.assertEqual(lot.paid_amount, sum(payment.amount for payment in lot.payments.all()))
+            self.assertGreaterEqual(lot.remaining_kg, 0)
+
+        # The sequences continue after the bulk numbers
+        lot = PurchaseInvoice.objects.create(vendor=PurchaseVendor.objects.first(), date=date(2025, 4, 30))
+        self.assertEqual(lot.invoice_number, f"MS2025R{added['PurchaseInvoice'] + 1:02d}")
+        sale = SalesInvoice.objects.create(vendor=Customer.objects.first(), date=date(2025, 4, 30))
+        self.assertEqual(sale.invoice_number, f"SA2025S{added['SalesInvoice'] + 1:02d}")
+
+
+class AdminQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', password='secret')
+        generate(400, start=date(2025, 4, 1), days=20)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_changelists_take_a_fixed_number_of_queries(self):
+        # A full page of 100 rows, whatever the foreign keys and totals shown
+        for model in ('salesinvoice', 'purchaseinvoice', 'payment', 'salespayment', 'expense', 'damages',
+                      'product', 'customer', 'stockmovement'):
+            with self.subTest(model=model):
+                self.assertLessEqual(self.get(f'/admin/Accounts/{model}/')[1], 9)
+
+        response, _ = self.get('/admin/Accounts/purchaseinvoice/')
+        lot = PurchaseInvoice.objects.order_by('-pk').first()
+        self.assertContains(response, lot.lot_number)
+        self.assertContains(response, f'<td class="field-due">{lot.due_amount}</td>', html=True)
+
+    def test_sales_invoice_form_queries_the_lots_once(self):
+        invoice = SalesInvoice.objects.annotate(lot_count=Count('sales_lots')).order_by('-lot_count', 'pk').first()
+        self.assertGreater(invoice.lot_count, 1)
+        response, queries = self.get(f'/admin/Accounts/salesinvoice/{invoice.pk}/change/')
+        self.assertLessEqual(queries, 13)
+        # Customers are picked with the autocomplete widget, not a full dropdown
+        self.assertContains(response, 'admin-autocomplete')
+
+
+class PurchaseLineItemTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', password='secret')
+        cls.vendor = PurchaseVendor.objects.create(name="Vendor", contact_number="1", area="Area")
+        cls.products = [Product.objects.create(name=f"Variety {index}") for index in range(4)]
+
+    def rows(self, count):
+        return [{'product': self.products[index % 4].pk, 'quantity': '250', 'price': '40', 'damage': '2',
+                 'rotten': '5'} for index in range(count)]
+
+    def assertConsistent(self, lot):
+        lot.refresh_from_db()
+        items = list(lot.purchase_products.order_by('serial_number'))
+        self.assertEqual([item.serial_number for item in items], list(range(1, len(items) + 1)))
+        self.assertEqual(lot.net_total, sum(item.total for item in items))
+        self.assertEqual(stock_mismatches(), [])
+        summary = DailySummary.objects.get(date=lot.date)
+        self.assertEqual((summary.purchases_total, summary.purchases_count), (lot.net_total, 1))
+
+    def test_bulk_entry_takes_a_fixed_number_of_queries(self):
+        lot = PurchaseInvoice.objects.create(vendor=self.vendor, date=date(2025, 5, 1))
+        with CaptureQueriesContext(connection) as queries:
+            add_purchase_products(lot, self.rows(40))
+        self.assertLessEqual(len(queries), 15)
+        self.assertConsistent(lot)
+
+        with CaptureQueriesContext(connection) as more:
+            add_purchase_products(lot, self.rows(2))
+        self.assertEqual(len(more), len(queries))
+        self.assertConsistent(lot)
+
+    def test_admin_saves_a_40_line_purchase_in_bulk(self):
+        self.client.force_login(self.user)
+        data = {
+            'vendor': self.vendor.pk, 'date': '2025-05-01', 'payment_issuer_name': '',
+            'purchase_products-TOTAL_FORMS': 40, 'purchase_products-INITIAL_FORMS': 0,
+            'payments-TOTAL_FORMS': 0, 'payments-INITIAL_FORMS': 0,
+        }
+        for index, row in enumerate(self.rows(40)):
+            data.update({f'purchase_products-{index}-{field}': value for field, value in row.items()})
+            data[f'purchase_products-{index}-discount'] = '1'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/admin/Accounts/purchaseinvoice/add/', data)
+        self.assertEqual(response.status_code, 302)
+        # A fixed number, including the lot's search index row
+        self.assertLessEqual(len(queries), 45)
+        lot = PurchaseInvoice.objects.get()
+        self.assertEqual(lot.purchase_products.count(), 40)
+        self.assertConsistent(lot)
+
+        # Edit one row and remove another
+        items = list(lot.purchase_products.order_by('serial_number'))
+        data.update({'purchase_products-TOTAL_FORMS': 2, 'purchase_products-INITIAL_FORMS': 2})
+        for index, item in enumerate(items[:2]):
+            data[f'purchase_products-{index}-id'] = item.pk
+            data[f'purchase_products-{index}-invoice'] = lot.pk
+        data['purchase_products-0-quantity'] = '300'
+        data['purchase_products-1-DELETE'] = 'on'
+        response = self.client.post(f'/admin/Accounts/purchaseinvoice/{lot.pk}/change/',
+                                    {**data, 'purchase_products-0-product': 999})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Select a valid choice', str(response.context['inline_admin_formsets'][0].formset.errors))
+        response = self.client.post(f'/admin/Accounts/purchaseinvoice/{lot.pk}/change/', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(lot.purchase_products.count(), 39)
+        lot.refresh_from_db()
+        self.assertEqual(lot.net_total, lot.line_items_total())
+        self.assertEqual(stock_mismatches(), [])
+
+
+class PaymentLimitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', password='secret')
+        vendor = PurchaseVendor.objects.create(name="Vendor", contact_number="1", area="Area")
+        cls.lot = PurchaseInvoice.objects.create(vendor=vendor, date=date(2025, 5, 1))
+        add_purchase_products(cls.lot, [{'product': Product.objects.create(name="Variety").pk,
+                                         'quantity': '25', 'price': '40'}])
+        cls.lot.refresh_from_db()
+        cls.sale = SalesInvoice.objects.create(vendor=Customer.objects.create(name="Customer"),
+                                               date=date(2025, 5, 1), no_of_crates=10, cost_per_crate=100)
+
+    def test_payments_stop_at_the_invoice_total(self):
+        limit = self.lot.net_total_after_cash_cutting
+        Payment.objects.create(invoice=self.lot, amount=limit - 10)
+        with self.assertRaises(ValidationError):
+            Payment.objects.create(invoice=self.lot, amount=Decimal('10.01'))
+        last = Payment.objects.create(invoice=self.lot, amount=10)
+        self.lot.refresh_from_db()
+        self.assertEqual((self.lot.paid_amount, self.lot.due_amount), (limit, 0))
+
+        # Lowering a payment makes room again; deleting one takes it off
+        last.amount = 4
+        last.save()
+        Payment.objects.create(invoice=self.lot, amount=6)
+        last.delete()
+        self.lot.refresh_from_db()
+        self.assertEqual(self.lot.paid_amount, limit - 4)
+
+        SalesPayment.objects.create(invoice=self.sale, amount=1000)
+        with self.assertRaises(ValidationError):
+            SalesPayment.objects.create(invoice=self.sale, amount=Decimal('0.01'))
+        self.assertEqual(self.sale.payments.count(), 1)
+
+    def test_checks_do_not_sum_the_existing_payments(self):
+        for _ in range(5):
+            SalesPayment.objects.create(invoice=self.sale, amount=100)
+        payment = SalesPayment(invoice=SalesInvoice.objects.get(pk=self.sale.pk), amount=600)
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertRaises(ValidationError):
+                payment.full_clean()
+        self.assertFalse([query for query in queries if 'SUM(' in query['sql'].upper()])
+        with CaptureQueriesContext(connection) as queries:
+            SalesPayment.objects.create(invoice=self.sale, amount=500)
+        # Savepoint, conditional UPDATE, INSERT, release
+        self.assertLessEqual(len(queries), 4)
+        self.sale.refresh_from_db()
+        self.assertEqual((self.sale.paid_amount, self.sale.due_amount), (1000, 0))
+
+    def admin_post(self, url, data, **payments):
+        self.client.force_login(self.user)
+        data = dict(data, **{'payments-TOTAL_FORMS': len(payments), 'payments-INITIAL_FORMS': 0})
+        for index, amount in enumerate(payments.values()):
+            data.update({f'payments-{index}-amount': amount, f'payments-{index}-date': '2025-05-01',
+                         f'payments-{index}-payment_mode': 'cash'})
+        return self.client.post(url, data)
+
+    def test_admin_takes_payments_once_the_invoice_exists(self):
+        self.client.force_login(self.user)
+        self.assertNotContains(self.client.get('/admin/Accounts/salesinvoice/add/'), 'payments-TOTAL_FORMS')
+        data = {'vendor': self.sale.vendor_id, 'date': '2025-05-01', 'no_of_crates': 10, 'cost_per_crate': 10,
+                'payment_status': 'unpaid', 'sales_lots-TOTAL_FORMS': 0, 'sales_lots-INITIAL_FORMS': 0}
+        response = self.client.post('/admin/Accounts/salesinvoice/add/', data)
+        self.assertEqual(response.status_code, 302)
+        sale = SalesInvoice.objects.latest('pk')
+
+        url = f'/admin/Accounts/salesinvoice/{sale.pk}/change/'
+        response = self.admin_post(url, data, first=60, second='40.01')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Total payment cannot exceed the invoice total: ₹100.00.")
+        response = self.admin_post(url, data, first=60, second=40)
+        self.assertEqual(response.status_code, 302)
+        sale.refresh_from_db()
+        self.assertEqual((sale.paid_amount, sale.due_amount), (100, 0))
+
+    def test_admin_shows_a_payment_refused_on_save(self):
+        # A new lot's limit depends on its line items, saved just before the
+        # payments, so the conditional UPDATE is the check
+        data = {'vendor': self.lot.vendor_id, 'date': '2025-05-01', 'payment_issuer_name': '',
+                'purchase_products-TOTAL_FORMS': 1, 'purchase_products-INITIAL_FORMS': 0,
+                'purchase_products-0-product': Product.objects.get().pk, 'purchase_products-0-quantity': '10',
+                'purchase_products-0-price': '10', 'purchase_products-0-damage': '0',
+                'purchase_products-0-discount': '0', 'purchase_products-0-rotten': '0'}
+        response = self.admin_post('/admin/Accounts/purchaseinvoice/add/', data, payment=95)
+        self.assertRedirects(response, '/admin/Accounts/purchaseinvoice/add/', fetch_redirect_response=False)
+        messages = [str(message) for message in response.wsgi_request._messages]
+        self.assertEqual(messages, ["Total payment cannot exceed the net total after 2% cash cutting: ₹94.08."])
+        # Nothing of the lot was kept
+        self.assertEqual(PurchaseInvoice.objects.count(), 1)
+        self.assertEqual(PurchaseProduct.objects.count(), 1)
+
+
+class ConcurrentPaymentTests(unittest.TestCase):
+    """Clerks paying the same invoices at once, from separate processes sharing a database file."""
+
+    WORKERS = 6
+    ATTEMPTS = 4
+
+    def manage(self, env, *arguments):
+        return subprocess.run([sys.executable, 'manage.py', *arguments], cwd=settings.BASE_DIR, env=env,
+                              capture_output=True, text=True, check=True).stdout
+
+    def test_concurrent_payments_never_overpay(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        env = dict(os.environ, DB_NAME=os.path.join(directory.name, 'db.sqlite3'),
+                   DJANGO_SETTINGS_MODULE='Mango_project.settings')
+        self.manage(env, 'migrate', '--noinput', '-v0')
+        setup = (
+            "from decimal import Decimal\n"
+            "from Accounts.line_items import add_purchase_products\n"
+            "from Accounts.models import Customer, Product, PurchaseInvoice, PurchaseVendor, SalesInvoice\n"
+            "vendor = PurchaseVendor.objects.create(name='Vendor', contact_number='1', area='Area')\n"
+            "lot = PurchaseInvoice.objects.create(vendor=vendor)\n"
+            "add_purchase_products(lot, [{'product': Product.objects.create(name='Variety').pk,"
+            " 'quantity': '25', 'price': '40'}])\n"
+            "sale = SalesInvoice.objects.create(vendor=Customer.objects.create(name='Customer'),"
+            " no_of_crates=10, cost_per_crate=Decimal('100'))\n"
+            "print(lot.pk, sale.pk)\n"
+        )
+        lot_id, sale_id = self.manage(env, 'shell', '-c', setup).split()
+        # Each worker tries to pay 100 on both invoices, ATTEMPTS times
+        worker = (
+            "import django\n"
+            "django.setup()\n"
+            "from django.core.exceptions import ValidationError\n"
+            "from Accounts.models import Payment, SalesPayment\n"
+            "accepted = [0, 0]\n"
+            f"for _ in range({self.ATTEMPTS}):\n"
+            f"    for index, (model, invoice_id) in enumerate([(Payment, {lot_id}), (SalesPayment, {sale_id})]):\n"
+            "        try:\n"
+            "            model.objects.create(invoice_id=invoice_id, amount=100)\n"
+            "            accepted[index] += 1\n"
+            "        except ValidationError:\n"
+            "            pass\n"
+            "print(*accepted)\n"
+        )
+        workers = [subprocess.Popen([sys.executable, '-c', worker], cwd=settings.BASE_DIR, env=env,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                   for _ in range(self.WORKERS)]
+        accepted = [0, 0]
+        for process in workers:
+            stdout, stderr = process.communicate(timeout=120)
+            self.assertEqual(process.returncode, 0, stderr)
+            for index, count in enumerate(stdout.split()):
+                accepted[index] += int(count)
+
+        # 1000 less 2% cash cutting takes 9 payments of 100; the sales invoice total of 1000 takes 10
+        self.assertEqual(accepted, [9, 10])
+        check = (
+            "from django.db.models import Sum\n"
+            "from Accounts.models import PurchaseInvoice, SalesInvoice\n"
+            "for invoice in (PurchaseInvoice.objects.get(), SalesInvoice.objects.get()):\n"
+            "    print(invoice.paid_amount, invoice.payments.aggregate(total=Sum('amount'))['total'])\n"
+        )
+        rows = [line.split() for line in self.manage(env, 'shell', '-c', check).splitlines()]
+        self.assertEqual([[Decimal(value) for value in row] for row in rows], [[900, 900], [1000, 1000]])
+
+
+class SearchIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='secret')
+        cls.customer = Customer.objects.create(name="Ravi Traders", address="Hebbal market")
+        cls.vendor = PurchaseVendor.objects.create(name="Ravi Farms", contact_number="1", area="Kolar")
+        cls.sale = SalesInvoice.objects.create(vendor=cls.customer, date=date(2025, 5, 1),
+                                               vehicle_number="KA 01 AB 1234", reference="Order 77")
+        cls.product = Product.objects.create(name="Alphonso")
+
+    def found(self, query, **kwargs):
+        return [(result['kind'], result['id']) for result in search(query, **kwargs)[0]]
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(sorted(self.found('rav')), [('customer', self.customer.pk), ('vendor', self.vendor.pk)])
+        self.assertEqual(self.found('rav', kind='vendor'), [('vendor', self.vendor.pk)])
+        self.assertEqual(self.found('ravi far'), [('vendor', self.vendor.pk)])
+        self.assertEqual(self.found('ka01ab'), [('sales_invoice', self.sale.pk)])
+        self.assertEqual(self.found('ka 01'), [('sales_invoice', self.sale.pk)])
+        self.assertEqual(self.found(self.sale.invoice_number[:6]), [('sales_invoice', self.sale.pk)])
+        self.assertEqual(self.found('alph'), [('product', self.product.pk)])
+        # Quotes and operators are just separators
+        self.assertEqual(self.found('"order" OR -(77'), [('sales_invoice', self.sale.pk)])
+        self.assertEqual(self.found('  '), [])
+
+    def test_title_matches_rank_first(self):
+        hebbal = Customer.objects.create(name="Hebbal Fruits")
+        self.assertEqual(self.found('hebbal'), [('customer', hebbal.pk), ('customer', self.customer.pk)])
+
+    def test_whole_word_matches_rank_before_newer_prefix_matches(self):
+        Customer.objects.bulk_create(Customer(name=f"Ravindra Stores {index}") for index in range(1000))
+        rebuild_index()
+        exact = {('customer', self.customer.pk), ('vendor', self.vendor.pk)}
+        self.assertEqual(set(self.found('ravi')[:2]), exact)
+        self.assertEqual(self.found('ravi', kind='customer')[0], ('customer', self.customer.pk))
+        # Every match is ranked: the last page holds the 1001st and 1002nd
+        results, has_next = search('ravi', page=51)
+        self.assertEqual((len(results), has_next), (2, False))
+
+    def test_saves_and_deletes_update_the_index(self):
+        self.customer.name = "Srinivas Traders"
+        self.customer.save()
+        self.assertEqual(self.found('ravi'), [('vendor', self.vendor.pk)])
+        self.assertEqual(self.found('srini'), [('customer', self.customer.pk)])
+        self.sale.delete()
+        self.assertEqual(self.found('ka01'), [])
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rowid, title, body FROM Accounts_searchindex ORDER BY rowid")
+            indexed = cursor.fetchall()
+            self.assertEqual(rebuild_index(), len(indexed))
+            cursor.execute("SELECT rowid, title, body FROM Accounts_searchindex ORDER BY rowid")
+            self.assertEqual(cursor.fetchall(), indexed)
+
+    def test_endpoint_pages_ranked_results(self):
+        Customer.objects.bulk_create(Customer(name=f"Mango Buyer {index}") for index in range(25))
+        rebuild_index()
+        self.client.force_login(self.user)
+        first = self.client.get(reverse('search'), {'q': 'mango buy'}).json()
+        self.assertEqual((len(first['results']), first['has_next']), (20, True))
+        second = self.client.get(reverse('search'), {'q': 'mango buy', 'page': 2}).json()
+        self.assertEqual((len(second['results']), second['has_next']), (5, False))
+        self.assertFalse({result['id'] for result in first['results']} & {result['id'] for result in second['results']})
+
+        result = self.client.get(reverse('search'), {'q': 'ka01'}).json()['results'][0]
+        self.assertEqual(result['url'], reverse('view_sale', args=[self.sale.pk]))
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'x', 'kind': 'truck'}).status_code, 400)
+
+
+class LotProfitabilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='secret')
+        vendor = PurchaseVendor.objects.create(name="Vendor", contact_number="1", area="Area")
+        product = Product.objects.create(name="Alphonso")
+        cls.first = PurchaseInvoice.objects.create(vendor=vendor, date=date(2025, 5, 1))
+        cls.second = PurchaseInvoice.objects.create(vendor=vendor, date=date(2025, 5, 2))
+        # 970 kg left after 2% damage and 10 kg rotten: 38,800 less 400 loading/unloading
+        add_purchase_products(cls.first, [{'product': product.pk, 'quantity': '1000', 'price': '40',
+                                           'damage': '2', 'rotten': '10'}])
+        add_purchase_products(cls.second, [{'product': product.pk, 'quantity': '500', 'price': '50'}])
+        customer = Customer.objects.create(name="Customer")
+
+        def sale(price, **kg_per_lot):
+            invoice = SalesInvoice.objects.create(vendor=customer, date=date(2025, 5, 3))
+            for lot, kg in kg_per_lot.items():
+                sales_lot = SalesLot.objects.create(sales_invoice=invoice, purchase_invoice=getattr(cls, lot),
+                                                    quantity=Decimal(kg))
+                SalesProduct.objects.create(invoice=invoice, product=product, lot=sales_lot,
+                                            gross_weight=Decimal(kg), price=Decimal(price))
+            return invoice
+
+        # 24,000 shared 3:1, then 14,000 all from the first lot
+        cls.sale = sale(60, first=300, second=100)
+        sale(70, first=200)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_costs_revenue_and_losses_per_lot(self):
+        with CaptureQueriesContext(connection) as queries:
+            margins = lot_margins()
+        self.assertLessEqual(len(queries), 3)
+        first, second = margins[self.first.pk], margins[self.second.pk]
+        self.assertEqual(
+            {field: first[field] for field in ('purchased_kg', 'loss_kg', 'loss_value', 'cost', 'sold_kg', 'revenue',
+                                               'margin')},
+            {'purchased_kg': 1000, 'loss_kg': 30, 'loss_value': 1200, 'cost': 38800, 'sold_kg': 500,
+             'revenue': 18000 + 14000, 'margin': 32000 - 38800},
+        )
+        self.assertEqual((second['cost'], second['sold_kg'], second['revenue'], second['margin']),
+                         (25000, 100, 6000, -19000))
+        self.assertEqual(first['margin_percent'], Decimal('-21.25'))
+
+        lots, totals = season_report(end_date=date(2025, 5, 1))
+        self.assertEqual([figures['lot_number'] for figures in lots], [self.first.lot_number])
+        self.assertEqual((totals['revenue'], totals['margin']), (32000, -6800))
+
+    def test_figures_are_cached_until_a_sale_changes(self):
+        lot_margins()
+        with CaptureQueriesContext(connection) as queries:
+            lot_margins()
+        self.assertEqual(len(queries), 1)
+
+        line = self.sale.sales_products.get(lot__purchase_invoice=self.second)
+        line.price = Decimal('90')
+        line.save()
+        # The invoice total of 27,000 is still shared by kg, 3:1
+        self.assertEqual(lot_margins()[self.second.pk]['revenue'], 6750)
+        # Same invoice total, shared differently
+        SalesLot.objects.filter(sales_invoice=self.sale, purchase_invoice=self.first).update(quantity=100)
+        SalesInvoice.bump_version(self.sale.pk)
+        self.assertEqual(lot_margins()[self.second.pk]['revenue'], Decimal('13500.00'))
+
+    def test_vendor_names_are_not_cached(self):
+        lot_margins()
+        PurchaseVendor.objects.filter(invoices=self.first).update(name="Renamed")
+        self.assertEqual(lot_margins()[self.first.pk]['vendor'], "Renamed")
+
+    def test_cache_keys_tell_apart_sales_with_the_same_sums(self):
+        lot = {'pk': 1, 'version': 1}
+        self.assertNotEqual(_cache_key({**lot, 'sales_invoices': '1:2, 2:1'}),
+                            _cache_key({**lot, 'sales_invoices': '1:1, 2:2'}))
+        self.assertEqual(_cache_key({**lot, 'sales_invoices': '1:2, 2:1'}),
+                         _cache_key({**lot, 'sales_invoices': '2:1, 1:2'}))
+
+    def test_allocation_shares_invoice_totals_by_kg(self):
+        rows = [(1, Decimal('1'), Decimal('100.00'), Decimal('3')), (2, Decimal('2'), Decimal('100.00'), Decimal('3')),
+                (2, Decimal('5'), Decimal('0.00'), Decimal('0'))]
+        self.assertEqual(allocate([1, 2, 3], rows),
+                         {1: (1, Decimal('33.33')), 2: (7, Decimal('66.67')), 3: (0, 0)})
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy_allocation_matches_the_decimal_loop(self):
+        rows = list(SalesLot.objects.values_list('purchase_invoice_id', 'quantity', 'sales_invoice__net_total',
+                                                 'sales_invoice__total_gross_weight'))
+        lot_ids = [self.first.pk, self.second.pk]
+        with mock.patch('Accounts.profitability.numpy', None):
+            expected = allocate(lot_ids, rows)
+        self.assertEqual(allocate(lot_ids, rows), expected)
+
+    def test_export(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export_lot_profitability'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1 + 2 + 2)
+        self.assertTrue(lines[-1].startswith('Total,,,1500.00,600.00,30.00,1200.00'))
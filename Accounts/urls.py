@@ -8,6 +8,16 @@ urlpatterns = [
     path('dashboard/', views.dashboard_view, name='dashboard'),
     path('sales/', views.sales_view, name='sales'),
     path('reports/', views.reports_view, name='reports'),
+    # Async versions for the ASGI deployment
+    path('async/dashboard/', views.dashboard_async_view, name='dashboard_async'),
+    path('async/reports/', views.reports_async_view, name='reports_async'),
+    path('reports/export/sales/', views.export_sales_report, name='export_sales_report'),
+    path('reports/export/inventory/', views.export_inventory_report, name='export_inventory_report'),
+    path('reports/export/financial/', views.export_financial_report, name='export_financial_report'),
+    path('reports/export/lots/', views.export_lot_profitability, name='export_lot_profitability'),
+    path('stats/requests/', views.request_stats_view, name='request_stats'),
+    # Global search (JSON): ?q=&page=&kind=
+    path('search/', views.search_view, name='search'),
     
     # Authentication URLs
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
@@ -18,6 +28,18 @@ urlpatterns = [
     path('sales/<int:sale_id>/', views.view_sale, name='view_sale'),
     path('sales/<int:sale_id>/edit/', views.edit_sale, name='edit_sale'),
     path('sales/<int:sale_id>/delete/', views.delete_sale, name='delete_sale'),
+    path('sales/<int:invoice_id>/pdf/', views.generate_sales_invoice_pdf, name='generate_sales_invoice_pdf'),
+    
+    # Purchase URLs
+    path('purchases/<int:invoice_id>/pdf/', views.generate_invoice_pdf, name='generate_invoice_pdf'),
+
+    # Payment attachments: kind is 'purchase' or 'sales'
+    path('payments/<str:kind>/<int:pk>/attachment/', views.payment_attachment, name='payment_attachment'),
+    path('payments/<str:kind>/<int:pk>/attachment/thumbnail/', views.payment_attachment, {'thumbnail': True},
+         name='payment_attachment_thumbnail'),
+
+    # Expense and damage vouchers, ?start_date=&end_date=
+    path('vouchers/<str:kind>/pdf/', views.vouchers_pdf, name='vouchers_pdf'),
     
     # Inventory URLs
     path('inventory/', views.inventory_view, name='inventory'),
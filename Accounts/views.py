@@ -1,27 +1,13 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponse, JsonResponse
-from io import BytesIO
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, LongTable
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
+from django.http import Http404, HttpResponse, JsonResponse
 from django.conf import settings
-from .models import PurchaseInvoice, PurchaseVendor, SalesInvoice, Expense, Damages, Packaging_Invoice, Customer, PurchaseProduct, Product, Category
+from .models import PurchaseInvoice, PurchaseVendor, SalesInvoice, SalesProduct, Expense, Damages, Packaging_Invoice, Customer, PurchaseProduct, Product, Category, Payment, SalesPayment
 from decimal import Decimal
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
-import os
-from reportlab.lib.units import inch
-from reportlab.platypus import Frame
-from django.db.models import Sum, F, ExpressionWrapper, DecimalField
+from django.db.models import Sum, F, Q, Case, When, Value, CharField, ExpressionWrapper, DecimalField
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.utils import timezone
 from datetime import timedelta
-from django.template.loader import get_template
-from xhtml2pdf import pisa
-from django.contrib.staticfiles.finders import find
-import base64
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
@@ -31,27 +17,40 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.forms import UserCreationForm
-
-
-@staff_member_required
-def home(request):
+from django.db import transaction
+from django.contrib.auth.views import redirect_to_login
+from asgiref.sync import sync_to_async
+from .pdf_cache import get_cached_pdf, pdf_file_response
+from .attachments import attachment_response
+from .exports import EXPORT_CHUNK_SIZE, export_response
+from .reporting import (
+    build_dashboard, build_report, dashboard_from_results, dashboard_queries, filter_report_dates, period_totals,
+    report_from_results, report_queries,
+)
+from .fanout import gather_queries
+from .middleware import get_slow_requests, get_view_stats, reset_stats
+from .line_items import sync_sales_products
+from . import dashboard_cache, search
+from .profitability import FIELDS as LOT_FIELDS, season_report
+from .stock import IN_STOCK, LOW_STOCK, OUT_OF_STOCK
+
+
+def _home_figures():
     # Get statistics for home page
     total_inventory = Product.objects.count()
     total_sales = SalesInvoice.objects.count()
     total_customers = Customer.objects.count()
     
-    # Calculate total revenue from sales
-    total_revenue = SalesInvoice.objects.aggregate(
-        total=Sum('net_total_after_packaging')
-    )['total'] or 0
+    # Calculate total revenue from the daily sales rollups
+    total_revenue = period_totals()['total_sales']
     
     # Get recent sales (last 5)
-    recent_sales = SalesInvoice.objects.select_related('vendor').order_by('-date')[:5]
+    recent_sales = list(SalesInvoice.objects.select_related('vendor').order_by('-date')[:5])
     
     # Get low stock items
-    low_stock_items = Product.objects.filter(current_stock__lte=F('threshold'))
+    low_stock_items = list(Product.objects.filter(current_stock__lte=F('threshold')))
     
-    context = {
+    return {
         "total_inventory": total_inventory,
         "total_sales": total_sales,
         "total_customers": total_customers,
@@ -59,6 +58,12 @@ def home(request):
         "recent_sales": recent_sales,
         "low_stock_items": low_stock_items,
     }
+
+
+@staff_member_required
+def home(request):
+    # Cached until the next invoice, payment, expense or stock change
+    context = dashboard_cache.cached('home', _home_figures)
     return render(request, 'home.html', context)
 
 @login_required
@@ -79,26 +84,28 @@ def inventory_view(request):
     }
     return render(request, 'inventory.html', context)
 
+SALES_PER_PAGE = 25
+
+
 @login_required
 def sales_view(request):
-    # Get all sales with related vendor info
-    sales = SalesInvoice.objects.select_related('vendor').order_by('-date')
+    # One page of sales; totals, due amounts and lot numbers come with the rows
+    sales = SalesInvoice.objects.select_related('vendor').annotate(
+        total_amount=SalesInvoice.total_after_packaging_expression(),
+        balance_due=SalesInvoice.due_amount_expression(),
+        lot_numbers=SalesInvoice.lot_numbers_expression(),
+    ).order_by('-date', '-id')
+    page_obj = Paginator(sales, SALES_PER_PAGE).get_page(request.GET.get('page'))
     
     # Calculate today's sales
     today = timezone.now().date()
-    today_sales = SalesInvoice.objects.filter(date=today).annotate(
-        total=Sum('sales_products__total')
-    ).aggregate(total=Sum('total'))['total'] or 0
+    today_sales = period_totals(today, today)['total_sales']
     
-    # Get total sales for statistics using sales_products__total
-    total_sales = SalesInvoice.objects.annotate(
-        sale_total=Sum('sales_products__total')
-    ).aggregate(
-        total=Sum('sale_total')
-    )['total'] or 0
+    # Get total sales for statistics from the daily sales rollups
+    total_sales = period_totals()['total_sales']
     
     # Get recent sales for quick view
-    recent_sales = sales[:10]
+    recent_sales = SalesInvoice.objects.order_by('-date')[:10]
     
     # Get vendors for sale creation
     vendors = PurchaseVendor.objects.all()
@@ -107,7 +114,8 @@ def sales_view(request):
     products = Product.objects.filter(current_stock__gt=0)
 
     context = {
-        'sales': sales,
+        'sales': page_obj,
+        'page_obj': page_obj,
         'today_sales': today_sales,
         'total_sales': total_sales,
         'recent_sales': recent_sales,
@@ -119,262 +127,37 @@ def sales_view(request):
 @login_required
 def reports_view(request):
     # Get date range from request
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    
-    # Base queryset for sales and purchases
-    sales_query = SalesInvoice.objects.all()
-    purchases_query = PurchaseInvoice.objects.all()
-    
-    # Apply date filters if provided
-    if start_date:
-        sales_query = sales_query.filter(date__gte=start_date)
-        purchases_query = purchases_query.filter(date__gte=start_date)
-    if end_date:
-        sales_query = sales_query.filter(date__lte=end_date)
-        purchases_query = purchases_query.filter(date__lte=end_date)
-    
-    # Get total sales using sales_products__total
-    total_sales = sales_query.annotate(
-        sale_total=Sum('sales_products__total')
-    ).aggregate(
-        total=Sum('sale_total')
-    )['total'] or 0
-    
-    # Get total purchases
-    total_purchases = purchases_query.aggregate(
-        total=Sum('net_total')
-    )['total'] or 0
-    
-    # Get total expenses and damages
-    expenses_query = Expense.objects.all()
-    damages_query = Damages.objects.all()
-    
-    if start_date:
-        expenses_query = expenses_query.filter(date__gte=start_date)
-        damages_query = damages_query.filter(date__gte=start_date)
-    if end_date:
-        expenses_query = expenses_query.filter(date__lte=end_date)
-        damages_query = damages_query.filter(date__lte=end_date)
-    
-    total_expenses = expenses_query.aggregate(
-        total=Sum('amount')
-    )['total'] or 0
-    
-    total_damages = damages_query.aggregate(
-        total=Sum('amount_loss')
-    )['total'] or 0
-    
-    # Get recent sales and purchases
-    recent_sales = sales_query.select_related('vendor').order_by('-date')[:10]
-    recent_purchases = purchases_query.select_related('vendor').order_by('-date')[:10]
-    
-    # Get inventory status data
-    inventory_data = {
-        'in_stock': Product.objects.filter(current_stock__gt=F('threshold')).count(),
-        'low_stock': Product.objects.filter(current_stock__lte=F('threshold'), current_stock__gt=0).count(),
-        'out_of_stock': Product.objects.filter(current_stock=0).count()
-    }
+    start_date, end_date = get_report_dates(request)
     
-    # Get payment methods distribution
-    # Since payment_method doesn't exist in SalesInvoice, we'll need to adapt this
-    # For now, we'll use a placeholder with fixed values
-    payment_methods = ['Cash', 'Card', 'UPI', 'Bank Transfer']
-    payment_data = []
-    for method in payment_methods:
-        # Instead of filtering by payment_method, we'll just count all sales
-        # This is a placeholder - you'll need to adjust based on your actual data model
-        count = sales_query.count() // len(payment_methods)  # Distribute evenly for now
-        payment_data.append({
-            'method': method,
-            'count': count
-        })
-    
-    # Get top selling products
-    top_products = Product.objects.annotate(
-        total_quantity=Sum('salesproduct__net_weight'),
-        total_revenue=Sum('salesproduct__total')
-    ).filter(total_quantity__gt=0).order_by('-total_quantity')[:5]
-    
-    # Calculate profit/loss
-    total_profit = total_sales - (total_purchases + total_expenses + total_damages)
-    
-    context = {
-        'total_sales': total_sales,
-        'total_purchases': total_purchases,
-        'total_expenses': total_expenses,
-        'total_damages': total_damages,
-        'total_profit': total_profit,
-        'recent_sales': recent_sales,
-        'recent_purchases': recent_purchases,
-        'inventory_data': inventory_data,
-        'payment_methods': payment_methods,
-        'payment_data': payment_data,
-        'top_products': top_products,
+    # All figures for the range come from a handful of grouped queries
+    context = build_report(start_date, end_date)
+    context.update({
         'start_date': start_date,
         'end_date': end_date,
-    }
+    })
     return render(request, 'reports.html', context)
 
 
-# Font and Logo Setup
-FONT_PATH = os.path.join(os.path.dirname(__file__), 'Font', 'DejaVuSans.ttf')
-BOLD_FONT_PATH = os.path.join(os.path.dirname(__file__), 'Font', 'DejaVuSans-Bold.ttf')
-FONT_PATH = os.path.join(os.path.dirname(__file__), 'Font', 'NotoSans.ttf')
-BOLD_FONT_PATH = os.path.join(os.path.dirname(__file__), 'Font', 'NotoSans-Bold.ttf')
-pdfmetrics.registerFont(TTFont('DejaVuSans', FONT_PATH))
-pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', BOLD_FONT_PATH))
-pdfmetrics.registerFont(TTFont('NotoSans', FONT_PATH))
-pdfmetrics.registerFont(TTFont('NotoSans-Bold', BOLD_FONT_PATH))
-
-def get_base64_image(image_path):
-    with open(image_path, "rb") as image_file:
-        encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-    return f"data:image/png;base64,{encoded_string}"
-
 def create_invoice(request):
     return render(request, 'Accounts/create_invoice.html')
 
+@login_required
 def generate_invoice_pdf(request, invoice_id):
-    # Fetch invoice
-    invoice = get_object_or_404(PurchaseInvoice, id=invoice_id)
-
-    # Set up PDF response
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="invoice_{invoice.invoice_number}.pdf"'
-
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=30, leftMargin=30, topMargin=20, bottomMargin=30)
-
-    elements = []  # Correct indentation here
+    # PDF code is imported on first use, not with the views (see pdf.py)
+    from .pdf import render_purchase_invoice_pdf
 
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle('Title', parent=styles['Title'], fontSize=16, alignment=1, textColor=colors.black)
+    # Only the version is needed to find a cached copy
+    invoice = get_object_or_404(PurchaseInvoice.objects.only('id', 'invoice_number', 'version'), id=invoice_id)
 
-    # Add Title
-    elements.append(Paragraph("PURCHASE INVOICE", title_style))
+    def render():
+        full_invoice = PurchaseInvoice.objects.select_related('vendor').prefetch_related(
+            'purchase_products__product', 'payments'
+        ).get(pk=invoice.pk)
+        return render_purchase_invoice_pdf(full_invoice)
 
-    # Add logo
-    logo_path = os.path.join(settings.STATICFILES_DIRS[0], 'LOGO.png')  # Ensure the path is correct
-    if os.path.exists(logo_path):
-        logo = Image(logo_path, width=2*inch, height=1.5*inch)  # Adjust size as needed
-        logo.hAlign = 'CENTER'  # Align the logo to the center of its cell
-    else:
-        print(f"Logo file not found at {logo_path}")
-
-    # Add Vendor Info Table with yellow highlights
-    vendor_data = [
-        ["Name:", invoice.vendor.name, "DATE", invoice.date.strftime('%d-%m-%Y')],
-        ["Contact No:", invoice.vendor.contact_number, "INVOICE NO.", invoice.invoice_number],
-        ["Area:", invoice.vendor.area, "LOT NO.", invoice.lot_number],
-        
-    ]
-    vendor_table = Table(vendor_data, colWidths=[1*inch, 2*inch, 1*inch, 1.15*inch])
-    vendor_table.setStyle(TableStyle([
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),  # Grid lines for table
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),  # Align text to the left
-        ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),  # Font for the table
-        ('FONTSIZE', (0, 0), (-1, -1), 10),  # Font size
-        ('BACKGROUND', (0, 0), (0, 0), colors.yellow),  # Highlight "Name:" in yellow
-        ('BACKGROUND', (0, 1), (0, 1), colors.yellow),  # Highlight "Contact No:" in yellow
-        ('BACKGROUND', (0, 2), (0, 2), colors.yellow),  # Highlight "Area:" in yellow
-        ('BACKGROUND', (2, 0), (2, 0), colors.yellow),  # Highlight "DATE" in yellow
-        ('BACKGROUND', (2, 1), (2, 1), colors.yellow),  # Highlight "INVOICE NO." in yellow
-        ('BACKGROUND', (2, 2), (2, 2), colors.yellow),  # Highlight "LOT NO." in yellow
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),  # Black text for headers
-    ]))
-
-    # Create a new table to place the logo and vendor info side by side
-    side_by_side_table = Table([[logo, vendor_table]], colWidths=[2.5*inch, 5*inch])  # Adjust widths as needed
-
-    # Add the side-by-side table to the elements list
-    elements.append(side_by_side_table)
-    elements.append(Spacer(1, 20))  # Add space after the logo and table
+    path = get_cached_pdf('purchase_invoice', invoice, render)
+    return pdf_file_response(path, f"invoice_{invoice.invoice_number}.pdf")
 
-    
-
-    # Product Table with yellow header
-    product_data = [
-        ["S/No", "Product Name", "QTY in Kg's", "UNIT PRICE", "Damage", "Discount", "Rotten", "Unloading", "TOTAL"]
-    ]
-    for idx, product in enumerate(invoice.purchase_products.all(), start=1):
-        product_data.append([
-            idx, product.product.name, f"{product.quantity:.2f}", f"₹{product.price:.2f}",
-            f"{product.damage:.2f}%", f"{product.discount:.2f}%", f"{product.rotten:.2f}",
-            f"₹{product.loading_unloading:.2f}", f"₹{product.total:.2f}"
-        ])
-    product_table = LongTable(product_data, colWidths=[0.4*inch, 1.5*inch, 0.8*inch, 0.8*inch, 1*inch, 0.8*inch, 0.8*inch, 1*inch, 0.9*inch])
-    product_table.setStyle(TableStyle([
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.yellow),  # Yellow background for header
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'DejaVuSans'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),  # Black text for header
-    ]))
-    elements.append(product_table)
-    elements.append(Spacer(1, 20))
-
-    # Paid Amounts Section
-    paid_data = [["Paid Amount", "Date"]]
-    for payment in invoice.payments.all():  # Assuming 'payments' is a related name for payments in the PurchaseInvoice model
-        paid_data.append([f"₹{payment.amount:.2f}", payment.date.strftime('%Y-%m-%d')])
-
-    paid_data.append(["Total Paid:", f"₹{invoice.paid_amount:.2f}"])
-
-    paid_table = Table(paid_data, colWidths=[2*inch, 1.8*inch])
-    paid_table.setStyle(TableStyle([
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
-        ('BACKGROUND', (0, 0), (0, 0), colors.yellow),  # Yellow header for "Paid Amount" and "Date"
-        ('FONTNAME', (0, -1), (-1, -1), 'DejaVuSans-Bold'),  # Bold for Total Paid row
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),  # Black text for header
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('FONTSIZE', (0, -1), (-1, -1), 12),  # Larger font for Total Paid
-    ]))
-    
-    # Payment Summary with yellow highlighting
-    payment_data = [
-        ["NET TOTAL", f"₹{invoice.net_total:.2f}"],
-        ["2% CASH COMMISSION", f"₹{(invoice.net_total * Decimal('0.02')):.2f}"],
-        ["NET TOTAL AFTER CASH CUTTING", f"₹{invoice.net_total_after_cash_cutting:.2f}"],
-        ["TOTAL PAID", f"₹{invoice.paid_amount:.2f}"],
-        ["BALANCE DUE", f"₹{invoice.due_amount:.2f}"],
-    ]
-    
-
-    payment_table = Table(payment_data, colWidths=[2.5*inch, 1.4*inch])
-    payment_table.setStyle(TableStyle([
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
-        ('FONTNAME', (0, -1), (-1, -1), 'DejaVuSans-Bold'),  
-    
-
-        ('BACKGROUND', (0, 0), (-1, 0), colors.yellow),  # Yellow background for the header
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),  # Black text for header
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-    ]))
-    
-    #elements.append(payment_table)
-    paid_and_payment_table = Table(
-        [[paid_table, payment_table]],  # Add both tables as cells in a single row
-        colWidths=[4*inch, 4*inch]  # Adjust column widths as needed
-    )
-
-    
-
-    # Add the combined table to the elements list
-    elements.append(paid_and_payment_table)
-    elements.append(Spacer(1, 20))
-    
-    # Build PDF
-    doc.build(elements)
-    buffer.seek(0)
-    response.write(buffer.read())
-    return response
 
 def vendor_summary(request):
     vendors = PurchaseVendor.objects.all()
@@ -398,460 +181,91 @@ def vendor_summary(request):
     }
     return render(request, 'vendor_summary.html', context)
 
+@login_required
 def generate_sales_invoice_pdf(request, invoice_id):
-    invoice = get_object_or_404(SalesInvoice, id=invoice_id)
-    # Check if "hide_payments" parameter exists in the URL
-    hide_payments = request.GET.get('hide_payments', False)
-    # Set up PDF response
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="sales_invoice_{invoice.invoice_number}.pdf"'
-
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=letter,
-        rightMargin=20,
-        leftMargin=20,
-        topMargin=20,
-        bottomMargin=30
-    )
+    from .pdf import get_sales_invoice_pdf
 
-    elements = []
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle('Title', parent=styles['Title'], fontSize=16,
-                                 alignment=1, textColor=colors.black)
-
-    
-
-    # Add Title
-    elements.append(Paragraph("SALES INVOICE", title_style))
-    elements.append(Spacer(1, 12))
-
-    # Add logo
-    # Logo and Header Section
-    logo_header_table = []
-
-    # Add Logo (if available)
-    logo_path = os.path.join(settings.STATICFILES_DIRS[0], 'LOGO.png')  # Updated path
-    if os.path.exists(logo_path):
-        try:
-            logo = Image(logo_path, width=2*inch, height=1.5*inch)
-            logo.hAlign = 'CENTER'
-            # Create a logo cell with proper padding
-            logo_cell = [[logo]]
-            logo_table = Table(logo_cell, hAlign='LEFT')
-            logo_table.setStyle(TableStyle([
-                ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-                ('LEFTPADDING', (0,0), (-1,-1), 10),
-            ]))
-            logo_header_table.append(logo_table)
-        except Exception as e:
-            print(f"Error loading logo: {str(e)}")
-    else:
-        print(f"Logo file not found at {logo_path}")
-
-    # Create header table
-    header_data = [
-        ["",""],
-        [ "Invoice Number:", invoice.invoice_number, "Date:", invoice.date.strftime('%d-%m-%Y')],
-        ["Vendor Name:", invoice.vendor.name,],
-        ["Contact No:", invoice.vendor.contact_number or "N/A", "Vehicle No.", invoice.vehicle_number or "N/A" ],
-        [ "Reference", invoice.reference or "", "Gross Vehicle Weight:", f"{invoice.gross_vehicle_weight}"],
-        ["LOT NO:", ", ".join([sl.purchase_invoice.lot_number for sl in invoice.sales_lots.all()]) or "N/A", "", ""],
-    ]
-
-    header_table = Table(header_data, colWidths=[1.25*inch, 1.5*inch, 1.75*inch, 1.5*inch])
-    header_table.setStyle(TableStyle([
-      
-        
-        ('SPAN', (1, 5), (3, 5)),  # (col_start, row_start), (col_end, row_end)
-        ('SPAN', (1, 2), (3, 2)),  # (col_start, row_start), (col_end, row_end)
-    # Align LOT NO text to the left
-        ('ALIGN', (1, 5), (3, 5), 'LEFT'),
-        ('GRID', (0,1), (-1,-1), 0.5, colors.grey),
-        ('FONTNAME', (2,1), (3,-1), 'Helvetica-Bold'),
-        ('FONTNAME', (0,1), (3,-1), 'Helvetica-Bold'),
-        ('ALIGN', (2,1), (3,-1), 'RIGHT'),
-        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-        ('BACKGROUND', (0, 1), (0, 1), colors.yellow), 
-        ('BACKGROUND', (0, 2), (0, 2), colors.yellow), 
-        ('BACKGROUND', (0, 3), (0, 3), colors.yellow), 
-        ('BACKGROUND', (0, 4), (0, 4), colors.yellow),
-        ('BACKGROUND', (2, 1), (2, 1), colors.yellow), 
-        ('BACKGROUND', (2, 3), (2, 3), colors.yellow), 
-       
-        ('BACKGROUND', (2, 4), (2, 4), colors.yellow),
-        ('BACKGROUND', (0, 5), (0, 5), colors.yellow),
-    ]))
-
-    # Combine logo and header into a single row
-    if logo_header_table:
-        final_header = [[logo_header_table[0], header_table]]
-        col_widths = [2.5*inch, 6.5*inch]
-    else:
-        final_header = [[header_table]]
-        col_widths = [8.5*inch]
-
-    main_header = Table(final_header, colWidths=col_widths)
-    main_header.setStyle(TableStyle([
-        ('VALIGN', (0,0), (-1,-1), 'TOP'),
-        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-    ]))
-
-    elements.append(main_header)
-    elements.append(Spacer(1, 20))
-
-    # Sales Product Table - Improved layout
-    product_header = [
-        "S/No", "Product", "Gross Weight", "Net Weight", 
-        "Price/Kg", "Discount", "Rotten", "Total"
-    ]
-    product_data = [product_header]
-    
-    for idx, sp in enumerate(invoice.sales_products.all(), start=1):
-        product_data.append([
-            str(idx),
-            sp.product.name,
-            f"{sp.gross_weight:.2f} Kg",
-            f"{sp.net_weight:.2f} Kg",
-            f"₹ {sp.price:.2f}",
-            f"{sp.discount:.2f}%",
-            f"{sp.rotten:.2f} Kg",
-            f"₹{sp.total:.2f}"
-        ])
-    
-    product_table = Table(product_data, 
-                         colWidths=[0.4*inch, 1.8*inch, 1*inch, 1*inch, 
-                                   0.9*inch, 0.8*inch, 0.9*inch, 1.2*inch])
-    
-    product_table.setStyle(TableStyle([
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.yellow),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'DejaVuSans-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'DejaVuSans'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-    ]))
-    
-    elements.append(product_table)
-    elements.append(Spacer(1, 20))
-
-    # Enhanced Summary Section
-    summary_data = [
-        ["Total Gross Weight:", f"{invoice.total_gross_weight:.2f} Kg"],
-        ["Net Total:", f"₹{invoice.net_total:.2f}"],
-        ["Commission:", f"₹{invoice.net_total_after_commission - invoice.net_total:.2f}"],
-        ["Net Total After Commission:", f"₹{invoice.net_total_after_commission:.2f}"],
-        ["Number of Crates:", f"{invoice.no_of_crates or 0}"],
-        ["Cost Per Crate:", f"₹{invoice.cost_per_crate or 0:.2f}"],
-        ["Packaging & Loading Cost:", f"₹{invoice.packaging_total:.2f}"],
-        ["Final Total:", f"₹{invoice.net_total_after_packaging:.2f}"]
-        #["TOTAL PAID", f"₹{invoice.paid_amount:.2f}"],
-        #["BALANCE DUE", f"₹{invoice.due_amount:.2f}"],
-    ]
-    
-    summary_table = Table(summary_data, colWidths=[2.5*inch, 1.5*inch])
-    summary_table.setStyle(TableStyle([
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
-        ('FONTNAME', (0, 0), (0, -1), 'DejaVuSans-Bold'),
-        ('BACKGROUND', (0, 0), (0, 0), colors.yellow),
-        ('BACKGROUND', (0, 0), (0, 1), colors.yellow),
-        ('BACKGROUND', (0, 0), (0, 2), colors.yellow),
-        ('BACKGROUND', (0, 0), (0, 3), colors.yellow),
-        ('BACKGROUND', (0, 0), (0, 4), colors.yellow),
-        ('BACKGROUND', (0, 0), (0, 5), colors.yellow),
-        ('BACKGROUND', (0, 0), (0, 6), colors.yellow),
-        ('BACKGROUND', (0, 0), (0, 7), colors.yellow),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-         ('FONTSIZE', (0, 7), (0, 7), 14),
-         ('FONTSIZE', (1, 7), (1, 7), 14),
-         ('FONTNAME', (1, 7), (1, 7), 'DejaVuSans-Bold'),
-        ('TEXTCOLOR', (0, -1), (0, -1), colors.black),
-        ('BOTTOMPADDING', (0, -1), (-1, -1), 12),
-    ]))
-    
-    left_aligned_summary = Table([[summary_table]], colWidths=[4*inch])
-    left_aligned_summary.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 140),
-    ]))
-
-    elements.append(left_aligned_summary)
-    elements.append(Spacer(1, 25))
-    if not hide_payments:
-    # Payment Details Section
-    # Payment Details Section - Updated to match purchase invoice style
-        paid_data = [["Paid Amount", "Date"]]
-        for payment in invoice.payments.all():
-            paid_data.append([f"₹{payment.amount:.2f}", payment.date.strftime('%Y-%m-%d')])
-        paid_data.append(["Total Paid:", f"₹{invoice.paid_amount:.2f}"])
-
-        paid_table = Table(paid_data, colWidths=[2*inch, 1.8*inch])
-        paid_table.setStyle(TableStyle([
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
-            ('BACKGROUND', (0, 0), (0, 0), colors.yellow),
-            ('BACKGROUND', (1, 0), (1, 0), colors.yellow),
-            ('FONTNAME', (0, -1), (-1, -1), 'DejaVuSans-Bold'),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('FONTSIZE', (0, -1), (-1, -1), 12),
-        ]))
-
-        # Payment Summary Table with yellow highlights
-        payment_summary_data = [
-            ["NET TOTAL", f"₹{invoice.net_total_after_packaging:.2f}"],
-            ["TOTAL PAID", f"₹{invoice.paid_amount:.2f}"],
-            ["BALANCE DUE", f"₹{invoice.due_amount:.2f}"],
-        ]
-        
-        payment_summary_table = Table(payment_summary_data, colWidths=[2.5*inch, 1.4*inch])
-        payment_summary_table.setStyle(TableStyle([
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
-            ('FONTNAME', (0, -1), (-1, -1), 'DejaVuSans-Bold'),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.yellow),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ]))
-
-        # Combine payment tables side by side
-        combined_payments = Table([[paid_table, payment_summary_table]],
-                                colWidths=[4*inch, 4*inch])
-        
-        elements.append(combined_payments)
-        elements.append(Spacer(1, 20))
+    # Only the version is needed to find a cached copy
+    invoice = get_object_or_404(SalesInvoice.objects.only('id', 'invoice_number', 'version'), id=invoice_id)
+    # Check if "hide_payments" parameter exists in the URL
+    hide_payments = bool(request.GET.get('hide_payments', False))
+    path = get_sales_invoice_pdf(invoice, hide_payments=hide_payments)
+    return pdf_file_response(path, f"sales_invoice_{invoice.invoice_number}.pdf")
 
-    # Build PDF
-    doc.build(elements)
-    buffer.seek(0)
-    response.write(buffer.read())
-    return response
 
 def generate_expense_pdf(request, pk):
-    expense = Expense.objects.get(pk=pk)
-
-    # Get static files paths for fonts
-    font_normal = find('NotoSans.ttf')
-    font_bold = find('NotoSans-Bold.ttf')
-
-    # Get the logo path (ensure it exists!)
-    logo_file_path = find('LOGO.png')
-
-    if not logo_file_path:
-        raise FileNotFoundError("LOGO.png not found in static files!")
-
-    # Base64 encode the logo
-    logo_base64 = get_base64_image(logo_file_path)
+    from .vouchers import voucher_response
 
-    # Fix path for fonts
-    def fix_path(path):
-        return path.replace('\\', '/') if os.name == 'nt' else path
-
-    context = {
-        'expense': expense,
-        'logo_path': logo_base64,  # Base64 encoded image for embedding
-        'noto_sans_path': f"file://{fix_path(font_normal)}" if font_normal else '',
-        'noto_sans_bold_path': f"file://{fix_path(font_bold)}" if font_bold else ''
-    }
-
-    return render_to_pdf('expense_pdf.html', context)
+    expense = Expense.objects.get(pk=pk)
+    return voucher_response('expense', expense)
 
 
 def generate_damage_pdf(request, pk):
-    damage = Damages.objects.get(pk=pk)
+    from .vouchers import voucher_response
 
-    # Get static files paths for fonts
-    font_normal = find('NotoSans.ttf')
-    font_bold = find('NotoSans-Bold.ttf')
+    damage = Damages.objects.get(pk=pk)
+    return voucher_response('damage', damage)
 
-    # Get the logo path (ensure it exists!)
-    logo_file_path = find('LOGO.png')
 
-    if not logo_file_path:
-        raise FileNotFoundError("LOGO.png not found in static files!")
+@login_required
+def vouchers_pdf(request, kind):
+    """All expense or damage vouchers of the start/end date range in one PDF, a page each."""
+    from .vouchers import VOUCHERS, render_vouchers, vouchers_in_range
+
+    if kind not in VOUCHERS:
+        raise Http404(f"No {kind} vouchers")
+    start_date, end_date = get_report_dates(request)
+    response = HttpResponse(render_vouchers(kind, vouchers_in_range(kind, start_date, end_date)),
+                            content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="{kind}_vouchers.pdf"'
+    return response
 
-    # Base64 encode the logo
-    logo_base64 = get_base64_image(logo_file_path)
 
-    # Fix path for fonts
-    def fix_path(path):
-        return path.replace('\\', '/') if os.name == 'nt' else path
+def generate_packaging_invoice_pdf(request, invoice_id):
+    from .pdf import render_packaging_invoice_pdf
 
-    context = {
-        'damage': damage,
-        'logo_path': logo_base64,  # Base64 encoded image for embedding
-        'noto_sans_path': f"file://{fix_path(font_normal)}" if font_normal else '',
-        'noto_sans_bold_path': f"file://{fix_path(font_bold)}" if font_bold else ''
-    }
+    invoice = get_object_or_404(Packaging_Invoice, id=invoice_id)
+    
+    response = HttpResponse(render_packaging_invoice_pdf(invoice), content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="packaging_invoice_{invoice.id}.pdf"'
+    return response
 
-    return render_to_pdf('damage_pdf.html', context)
 
-# Generic PDF renderer (reuse existing if you have one)
-def render_to_pdf(template_path, context):
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'filename="document.pdf"'
-    
-    template = get_template(template_path)
-    html = template.render(context)
+PAYMENT_MODELS = {'purchase': Payment, 'sales': SalesPayment}
 
-    pisa_status = pisa.CreatePDF(
-        html, dest=response,
-        encoding='UTF-8'
-    )
 
-    if pisa_status.err:
-        return HttpResponse('Error generating PDF')
+@login_required
+def payment_attachment(request, kind, pk, thumbnail=False):
+    """A payment attachment (or its thumbnail), with HTTP range support."""
+    if kind not in PAYMENT_MODELS:
+        raise Http404(f"No {kind} payments")
+    payment = get_object_or_404(PAYMENT_MODELS[kind].objects.only('attachment'), pk=pk)
+    response = attachment_response(request, payment.attachment, thumbnail=thumbnail)
+    if response is None:
+        raise Http404("No attachment")
     return response
 
-def generate_packaging_invoice_pdf(request, invoice_id):
-    invoice = get_object_or_404(Packaging_Invoice, id=invoice_id)
-    
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="packaging_invoice_{invoice.id}.pdf"'
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter,
-                          rightMargin=20, leftMargin=20,
-                          topMargin=20, bottomMargin=30)
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Custom style with DejaVu font
-    title_style = ParagraphStyle(
-        'Title',
-        parent=styles['Title'],
-        fontSize=16,
-        alignment=1,
-        textColor=colors.black,
-        fontName='DejaVuSans-Bold'
-    )
-    
-    # Add Logo and Header
-    logo_header = []
-    logo_path = os.path.join(settings.STATICFILES_DIRS[0], 'LOGO.png')
-    
-    if os.path.exists(logo_path):
-        try:
-            logo = Image(logo_path, width=2*inch, height=1.5*inch)
-            logo.hAlign = 'LEFT'
-            logo_table = Table([[logo]], colWidths=[2*inch])
-            logo_table.setStyle(TableStyle([
-                ('VALIGN', (0,0), (-1,-1), 'LEFT'),
-                ('LEFTPADDING', (0,0), (-1,-1), -50),
-            ]))
-            logo_header.append(logo_table)
-        except Exception as e:
-            print(f"Error loading logo: {str(e)}")
-    
-    # Create header table
-    header_data = [
-        ["PACKAGING INVOICE", ""],
-        ["Invoice ID:", f"PKG-{invoice.id}"],  # Using invoice ID instead of date
-    ]
-    
-    header_table = Table(header_data, colWidths=[3*inch, 3*inch])
-    header_table.setStyle(TableStyle([
-        ('FONTNAME', (0,0), (-1,-1), 'DejaVuSans'),
-        ('FONTSIZE', (0,0), (-1,0), 14),
-        ('FONTNAME', (0,0), (-1,0), 'DejaVuSans-Bold'),
-        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-    ]))
-    
-    # Combine logo and header
-    if logo_header:
-        main_header = Table([[logo_header[0], header_table]], 
-                          colWidths=[2*inch, 4*inch])
-    else:
-        main_header = header_table
-        
-    elements.append(main_header)
-    elements.append(Spacer(1, 20))
-    
-    invoice_data = [
-        ["Number of Crates:", str(invoice.no_of_crates)],
-        ["Cost Per Crate:", f"₹{invoice.cost_per_crate:.2f}"],
-        ["Total Packaging Cost:", f"₹{invoice.packaging_total:.2f}"]
-    ]
-    
-    invoice_table = Table(invoice_data, colWidths=[2*inch, 4*inch])
-    invoice_table.setStyle(TableStyle([
-        ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-        ('FONTNAME', (0,0), (-1,0), 'DejaVuSans-Bold'),
-        ('FONTNAME', (0,1), (-1,-1), 'DejaVuSans'),
-        ('BACKGROUND', (0,0), (-1,0), colors.yellow),
-        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-    ]))
-    
-    elements.append(invoice_table)
-    elements.append(Spacer(1, 20))
-    
-    # Footer with custom font
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=10,
-        leading=12,
-        textColor=colors.darkgrey,
-        fontName='DejaVuSans'
-    )
-    # Footer
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=10,
-        leading=12,
-        textColor=colors.darkgrey
-    )
-    footer_text = '''<para>
-    Prepared By: _______________________ &nbsp;&nbsp;&nbsp;&nbsp; 
-    Approved By: _______________________<br/>
-    Signature: _______________________ &nbsp;&nbsp;&nbsp;&nbsp; 
-    Signature: _______________________
-    </para>'''
-    
-    elements.append(Paragraph(footer_text, footer_style))
-    
-    doc.build(elements)
-    buffer.seek(0)
-    response.write(buffer.read())
-    buffer.close()
-    return response
 
-@login_required
-def home(request):
+def _base_home_figures(today):
     # Get total products
     total_products = Product.objects.count()
     
-    # Get total sales (using sales_products total)
-    total_sales = SalesInvoice.objects.annotate(
-        total=Sum('sales_products__total')
-    ).aggregate(total=Sum('total'))['total'] or 0
+    # Get total sales (from the daily sales rollups)
+    total_sales = period_totals()['total_sales']
     
     # Get total vendors
     total_vendors = PurchaseVendor.objects.count()
     
-    # Get today's sales (fixed date lookup)
-    today = timezone.now().date()
-    today_sales = SalesInvoice.objects.filter(date=today).annotate(
-        total=Sum('sales_products__total')
-    ).aggregate(total=Sum('total'))['total'] or 0
+    # Get today's sales (a single rollup row)
+    today_sales = period_totals(today, today)['total_sales']
     
     # Get recent sales
-    recent_sales = SalesInvoice.objects.select_related('vendor').order_by('-date')[:5]
+    recent_sales = list(SalesInvoice.objects.select_related('vendor').order_by('-date')[:5])
     
     # Get low stock products (using threshold)
-    low_stock_products = Product.objects.filter(current_stock__lte=F('threshold'))[:5]
+    low_stock_products = list(Product.objects.filter(current_stock__lte=F('threshold'))[:5])
     
-    context = {
+    return {
         'total_products': total_products,
         'total_sales': total_sales,
         'total_vendors': total_vendors,
@@ -859,6 +273,13 @@ def home(request):
         'recent_sales': recent_sales,
         'low_stock_products': low_stock_products,
     }
+
+
+@login_required
+def home(request):
+    # Cached per day until the next invoice, payment, expense or stock change
+    today = timezone.now().date()
+    context = dashboard_cache.cached('base_home', lambda: _base_home_figures(today), today)
     return render(request, 'base.html', context)
 
 def inventory_view(request):
@@ -877,11 +298,11 @@ def inventory_view(request):
     if category_id:
         items = items.filter(category_id=category_id)
     if stock_status == 'low':
-        items = items.filter(current_stock__lte=F('min_stock'))
+        items = items.filter(LOW_STOCK)
     elif stock_status == 'out':
-        items = items.filter(current_stock=0)
+        items = items.filter(OUT_OF_STOCK)
     elif stock_status == 'in':
-        items = items.filter(current_stock__gt=F('min_stock'))
+        items = items.filter(IN_STOCK)
     
     # Pagination
     paginator = Paginator(items, 10)
@@ -974,10 +395,7 @@ def create_sale(request):
                     price=price,
                     total=item_total
                 )
-                
-                # Update product stock
-                product.current_stock -= int(quantity)
-                product.save()
+                # Stock is taken off by the line item's stock movement
             
             sale.net_total = total
             sale.save()
@@ -1008,20 +426,141 @@ def view_sale(request, sale_id):
     }
     return render(request, 'view_sale.html', context)
 
+@login_required
+def search_view(request):
+    """Ranked global search, as JSON: ?q=words&page=2&kind=customer"""
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('kind') or None
+    if kind is not None and kind not in search.KINDS_BY_NAME:
+        return JsonResponse({'error': f"Unknown kind {kind!r}"}, status=400)
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    results, has_next = search.search(query, page=page, kind=kind)
+    return JsonResponse({'query': query, 'page': page, 'has_next': has_next, 'results': results})
+
+def get_report_dates(request):
+    """The start/end date filters shared by reports_view and the exports."""
+    return request.GET.get('start_date') or None, request.GET.get('end_date') or None
+
+
+@login_required
 def export_sales_report(request):
-    """Export sales report"""
-    # Implementation for sales report export
-    pass
+    """Export sales report: one row per line item, with the invoice totals"""
+    start_date, end_date = get_report_dates(request)
+    items = filter_report_dates(SalesProduct.objects.all(), start_date, end_date, 'invoice__date').annotate(
+        invoice_final_total=SalesInvoice.total_after_packaging_expression('invoice__'),
+        invoice_due=SalesInvoice.due_amount_expression('invoice__'),
+    ).order_by('invoice__date', 'invoice_id', 'serial_number').values_list(
+        'invoice__invoice_number', 'invoice__date', 'invoice__vendor__name', 'invoice__vehicle_number',
+        'serial_number', 'product__name', 'lot__purchase_invoice__lot_number',
+        'gross_weight', 'discount', 'rotten', 'net_weight', 'price', 'total',
+        'invoice__net_total', 'invoice_final_total', 'invoice__paid_amount', 'invoice_due',
+    )
+
+    def rows():
+        yield [
+            "Invoice No", "Date", "Customer", "Vehicle No", "S/No", "Product", "Lot No",
+            "Gross Weight (Kg)", "Discount %", "Rotten (Kg)", "Net Weight (Kg)", "Price/Kg", "Total",
+            "Invoice Net Total", "Invoice Final Total", "Invoice Paid", "Invoice Due",
+        ]
+        yield from items.iterator(chunk_size=EXPORT_CHUNK_SIZE)
 
+    return export_response(request, rows(), 'sales_report')
+
+
+@login_required
 def export_inventory_report(request):
-    """Export inventory report"""
-    # Implementation for inventory report export
-    pass
+    """Export inventory report: stock status plus the kg sold in the date range"""
+    start_date, end_date = get_report_dates(request)
+    sold_filter = Q()
+    if start_date:
+        sold_filter &= Q(salesproduct__invoice__date__gte=start_date)
+    if end_date:
+        sold_filter &= Q(salesproduct__invoice__date__lte=end_date)
+
+    products = Product.objects.annotate(
+        stock_value=ExpressionWrapper(F('current_stock') * F('price'), output_field=DecimalField()),
+        status=Case(
+            When(OUT_OF_STOCK, then=Value('Out of stock')),
+            When(LOW_STOCK, then=Value('Low stock')),
+            default=Value('In stock'),
+        ),
+        sold_kg=Sum('salesproduct__net_weight', filter=sold_filter),
+        sold_revenue=Sum('salesproduct__total', filter=sold_filter),
+    ).order_by('name').values_list(
+        'name', 'category__name', 'current_stock', 'threshold', 'price', 'stock_value', 'status',
+        'sold_kg', 'sold_revenue',
+    )
 
+    def rows():
+        yield ["Product", "Category", "Current Stock", "Threshold", "Price", "Stock Value", "Status",
+               "Sold (Kg)", "Sales Revenue"]
+        yield from products.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    return export_response(request, rows(), 'inventory_report')
+
+
+@login_required
+def export_lot_profitability(request):
+    """Export lot profitability: one row per lot bought in the date range, then the totals"""
+    lots, totals = season_report(*get_report_dates(request))
+
+    def rows():
+        yield ["Lot No", "Date", "Vendor", "Purchased (Kg)", "Sold (Kg)", "Damage/Rotten (Kg)", "Loss Value",
+               "Purchase Total", "Loading/Unloading", "Cost", "Revenue", "Margin", "Margin %"]
+        for figures in lots:
+            yield [figures[column] for column in LOT_FIELDS]
+        yield []
+        yield ["Total", None, None] + [totals[column] for column in LOT_FIELDS[3:]]
+
+    return export_response(request, rows(), 'lot_profitability')
+
+
+@login_required
 def export_financial_report(request):
-    """Export financial report"""
-    # Implementation for financial report export
-    pass
+    """Export financial report: every sale, purchase, expense and damage by date, then the totals"""
+    start_date, end_date = get_report_dates(request)
+
+    def entries(queryset, kind, number, party, description, amount):
+        # All columns are annotations so every branch of the UNION lists them in the same order
+        text = CharField()
+        return filter_report_dates(queryset, start_date, end_date).order_by().annotate(
+            entry_date=F('date'),
+            entry_type=Value(kind, output_field=text),
+            entry_number=F(number) if number else Value('', output_field=text),
+            entry_party=F(party),
+            entry_description=F(description),
+            entry_amount=ExpressionWrapper(F(amount), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        ).values_list(
+            'entry_date', 'entry_type', 'entry_number', 'entry_party', 'entry_description', 'entry_amount',
+        )
+
+    ledger = entries(
+        SalesInvoice.objects.all(), 'Sale', 'invoice_number', 'vendor__name', 'vehicle_number', 'net_total',
+    ).union(
+        entries(PurchaseInvoice.objects.all(), 'Purchase', 'invoice_number', 'vendor__name', 'lot_number', 'net_total'),
+        entries(Expense.objects.all(), 'Expense', None, 'paid_to', 'description', 'amount'),
+        entries(Damages.objects.all(), 'Damage', None, 'name', 'due_to', 'amount_loss'),
+        all=True,
+    ).order_by('entry_date')
+
+    def rows():
+        totals = {'Sale': Decimal('0'), 'Purchase': Decimal('0'), 'Expense': Decimal('0'), 'Damage': Decimal('0')}
+        yield ["Date", "Type", "Number", "Party", "Description", "Amount"]
+        for entry in ledger.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            totals[entry[1]] += Decimal(entry[5] or 0)
+            yield entry
+        yield []
+        yield ["", "Total Sales", "", "", "", totals['Sale']]
+        yield ["", "Total Purchases", "", "", "", totals['Purchase']]
+        yield ["", "Total Expenses", "", "", "", totals['Expense']]
+        yield ["", "Total Damages", "", "", "", totals['Damage']]
+        profit = totals['Sale'] - (totals['Purchase'] + totals['Expense'] + totals['Damage'])
+        yield ["", "Profit/Loss", "", "", "", profit]
+
+    return export_response(request, rows(), 'financial_report')
 
 # Add the missing print_invoice view
 def print_invoice(request, sale_id):
@@ -1042,72 +581,61 @@ def print_invoice(request, sale_id):
 def is_admin(user):
     return user.is_staff
 
-@login_required
-def dashboard_view(request):
-    # Calculate total sales by summing up the sales_products totals
-    total_sales = SalesInvoice.objects.annotate(
-        sale_total=Sum('sales_products__total')
-    ).aggregate(
-        total=Sum('sale_total')
-    )['total'] or 0
-    
-    # Calculate total purchases
-    total_purchases = PurchaseInvoice.objects.aggregate(
-        total=Sum('net_total')
-    )['total'] or 0
-    
-    # Get total expenses and damages
-    total_expenses = Expense.objects.aggregate(
-        total=Sum('amount')
-    )['total'] or 0
-    
-    total_damages = Damages.objects.aggregate(
-        total=Sum('amount_loss')
-    )['total'] or 0
-    
-    # Get recent sales and purchases with related vendor info
-    recent_sales = SalesInvoice.objects.select_related('vendor').order_by('-date')[:5]
-    
-    # Calculate totals for each sale to avoid using template filter
-    sales_with_totals = []
-    for sale in recent_sales:
-        # Calculate the total for this sale
-        sale_total = sale.sales_products.aggregate(total=Sum('total'))['total'] or 0
-        sales_with_totals.append({
-            'sale': sale,
-            'total': sale_total
-        })
-    
-    # Get recent purchases
-    recent_purchases = PurchaseInvoice.objects.select_related('vendor').order_by('-date')[:5]
-    
-    # Get inventory status data
-    inventory_data = {
-        'in_stock': Product.objects.filter(current_stock__gt=F('threshold')).count(),
-        'low_stock': Product.objects.filter(current_stock__lte=F('threshold'), current_stock__gt=0).count(),
-        'out_of_stock': Product.objects.filter(current_stock=0).count()
-    }
-    
-    # Get top selling products - using correct field relationships
-    # We need to use the right field from the SalesProduct model
-    top_products = Product.objects.annotate(
-        total_quantity=Sum('salesproduct__net_weight'),
-        total_revenue=Sum('salesproduct__total')
-    ).filter(total_quantity__gt=0).order_by('-total_quantity')[:5]
-    
+@staff_member_required
+def request_stats_view(request):
+    """Per view query counts and timings recorded by RequestStatsMiddleware."""
+    if request.method == 'POST':
+        reset_stats()
+        messages.success(request, 'Request statistics have been reset.')
+        return redirect('request_stats')
+
     context = {
-        'total_sales': total_sales,
-        'total_purchases': total_purchases,
-        'total_expenses': total_expenses,
-        'total_damages': total_damages,
-        'recent_sales': recent_sales,
-        'sales_with_totals': sales_with_totals,
-        'recent_purchases': recent_purchases,
-        'inventory_data': inventory_data,
-        'top_products': top_products,
+        'view_stats': get_view_stats(),
+        'slow_requests': get_slow_requests(),
+        'slow_ms': getattr(settings, 'REQUEST_STATS_SLOW_MS', 500),
+        'slow_queries': getattr(settings, 'REQUEST_STATS_SLOW_QUERIES', 50),
     }
+    return render(request, 'request_stats.html', context)
+
+@login_required
+def dashboard_view(request):
+    # Cached until the next invoice, payment, expense or stock change
+    context = dashboard_cache.cached('dashboard', build_dashboard)
     return render(request, 'dashboard.html', context)
 
+
+# Async versions of the dashboard and reports for the ASGI deployment
+# (Mango_project/asgi.py): the independent queries run at the same time.
+async def _login_redirect(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    return None
+
+
+async def dashboard_async_view(request):
+    if response := await _login_redirect(request):
+        return response
+
+    async def build():
+        return dashboard_from_results(await gather_queries(dashboard_queries()))
+
+    context = await dashboard_cache.acached('dashboard', build)
+    # Rendering may touch the session and user, so it runs on a sync thread
+    return await sync_to_async(render)(request, 'dashboard.html', context)
+
+
+async def reports_async_view(request):
+    if response := await _login_redirect(request):
+        return response
+    start_date, end_date = get_report_dates(request)
+    context = report_from_results(await gather_queries(report_queries(start_date, end_date)))
+    context.update({
+        'start_date': start_date,
+        'end_date': end_date,
+    })
+    return await sync_to_async(render)(request, 'reports.html', context)
+
 @login_required
 def edit_sale(request, sale_id):
     sale = get_object_or_404(SalesInvoice.objects.select_related('vendor'), id=sale_id)
@@ -1126,46 +654,32 @@ def edit_sale(request, sale_id):
             sale.reference = reference
             sale.gross_vehicle_weight = gross_vehicle_weight
             
-            # Update products
+            # Update products: only the changed rows are written
             products = request.POST.getlist('products[]')
             gross_weights = request.POST.getlist('gross_weights[]')
-            net_weights = request.POST.getlist('net_weights[]')
             prices = request.POST.getlist('prices[]')
             discounts = request.POST.getlist('discounts[]')
             rottens = request.POST.getlist('rottens[]')
+            item_ids = request.POST.getlist('item_ids[]')
             
-            # Clear existing products
-            sale.sales_products.all().delete()
+            rows = [
+                {
+                    'id': item_ids[i] if i < len(item_ids) else None,
+                    'product': products[i],
+                    'gross_weight': gross_weights[i],
+                    'price': prices[i],
+                    'discount': discounts[i],
+                    'rotten': rottens[i],
+                }
+                for i in range(len(products))
+            ]
             
-            # Add new products
-            total = 0
-            for i in range(len(products)):
-                product = Product.objects.get(id=products[i])
-                gross_weight = Decimal(gross_weights[i])
-                net_weight = Decimal(net_weights[i])
-                price = Decimal(prices[i])
-                discount = Decimal(discounts[i])
-                rotten = Decimal(rottens[i])
+            with transaction.atomic():
+                # Net weights and totals are calculated from the submitted values
+                sync_sales_products(sale, rows)
                 
-                # Calculate total for this product
-                product_total = (net_weight * price) * (1 - discount/100)
-                total += product_total
-                
-                # Create new sales product
-                sale.sales_products.create(
-                    product=product,
-                    gross_weight=gross_weight,
-                    net_weight=net_weight,
-                    price=price,
-                    discount=discount,
-                    rotten=rotten,
-                    total=product_total
-                )
-            
-            # Update sale totals
-            sale.net_total = total
-            sale.net_total_after_commission = total * Decimal('1.10')  # 10% commission
-            sale.save()
+                # Totals are maintained from the line items, just save the details
+                sale.save()
             
             messages.success(request, 'Sale updated successfully!')
             return redirect('view_sale', sale_id=sale.id)
@@ -1192,16 +706,7 @@ def delete_sale(request, sale_id):
     sale = get_object_or_404(SalesInvoice, id=sale_id)
     
     try:
-        # Get all products from the sale
-        sale_products = sale.sales_products.all()
-        
-        # Restore product quantities back to inventory
-        for sale_product in sale_products:
-            product = sale_product.product
-            product.current_stock += sale_product.net_weight
-            product.save()
-        
-        # Delete the sale
+        # Deleting the line items posts movements that put their stock back
         sale.delete()
         messages.success(request, 'Sale deleted successfully!')
         
@@ -0,0 +1,135 @@
+"""
+Expense and damage vouchers.
+
+A voucher is one page: the logo, a title and a Field/Details table. It used to
+go through xhtml2pdf (expense_pdf.html / damage_pdf.html), which parses the
+HTML and CSS for every voucher. render_vouchers() lays out the same page with
+ReportLab directly, and prints any number of vouchers into one PDF, a page
+each, for the bulk printout of a date range. The fonts, styles and logo come
+from the per-process registry in pdf.py.
+
+Settings:
+
+    VOUCHER_RENDERER  'reportlab' (default) or 'html' for the xhtml2pdf
+                      templates
+
+`manage.py benchmark_vouchers` compares the two.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.formats import localize
+from django.utils.html import escape
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .models import Damages, Expense
+from .pdf import get_logo_image, get_styles, html_pdf_assets, render_to_pdf
+from .reporting import filter_report_dates
+
+# kind: model, title, HTML template and (label, field) rows
+VOUCHERS = {
+    'expense': {
+        'model': Expense,
+        'title': "Expense Report",
+        'template': 'expense_pdf.html',
+        'fields': [('Date', 'date'), ('Paid By', 'paid_by'), ('Paid To', 'paid_to'),
+                   ('Amount', 'amount'), ('Description', 'description')],
+    },
+    'damage': {
+        'model': Damages,
+        'title': "Damage Report",
+        'template': 'damage_pdf.html',
+        'fields': [('Date', 'date'), ('Name', 'name'), ('Due To', 'due_to'),
+                   ('Amount Loss', 'amount_loss'), ('Description', 'description')],
+    },
+}
+
+MARGIN = 20
+BORDER = colors.HexColor('#dddddd')
+TABLE_STYLE = TableStyle([
+    ('GRID', (0, 0), (-1, -1), 1, BORDER),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f5f5f5')),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('PADDING', (0, 0), (-1, -1), 12),
+])
+FOOTER = [
+    "Prepared By: _______________________     Approved By: _______________________",
+    "Signature: _______________________     Signature: _______________________",
+]
+
+
+def voucher_rows(kind, voucher):
+    """(label, text) rows of the voucher table, formatted like the templates do."""
+    return [(label, localize(getattr(voucher, field))) for label, field in VOUCHERS[kind]['fields']]
+
+
+def vouchers_in_range(kind, start_date=None, end_date=None):
+    return filter_report_dates(VOUCHERS[kind]['model'].objects.all(), start_date, end_date).order_by('date', 'id')
+
+
+def _draw_footer(canvas, doc):
+    width, _ = doc.pagesize
+    canvas.saveState()
+    canvas.setStrokeColor(BORDER)
+    canvas.line(MARGIN, 50, width - MARGIN, 50)
+    canvas.setFont('NotoSans', 9)
+    canvas.drawCentredString(width / 2, 36, FOOTER[0])
+    canvas.drawCentredString(width / 2, 22, FOOTER[1])
+    canvas.restoreState()
+
+
+def _voucher_elements(kind, voucher, width):
+    styles = get_styles()
+    cell, header = styles['VoucherCell'], styles['VoucherHeader']
+    elements = []
+    logo = get_logo_image(width=1.5*inch, height=1.125*inch)
+    if logo is not None:
+        logo.hAlign = 'LEFT'
+        elements.append(logo)
+    elements.append(Spacer(1, 12))
+    elements.append(Paragraph(VOUCHERS[kind]['title'], styles['VoucherTitle']))
+
+    data = [[Paragraph("Field", header), Paragraph("Details", header)]]
+    data += [[Paragraph(label, cell), Paragraph(escape(text), cell)] for label, text in voucher_rows(kind, voucher)]
+    table = Table(data, colWidths=[width * 0.3, width * 0.7])
+    table.setStyle(TABLE_STYLE)
+    elements.append(table)
+    return elements
+
+
+def render_vouchers(kind, vouchers):
+    """PDF bytes with one page per voucher."""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=MARGIN, leftMargin=MARGIN,
+                            topMargin=MARGIN, bottomMargin=70)
+    elements = []
+    for voucher in vouchers:
+        if elements:
+            elements.append(PageBreak())
+        elements += _voucher_elements(kind, voucher, doc.width)
+    if not elements:
+        elements.append(Paragraph("No vouchers in this period.", get_styles()['VoucherCell']))
+    doc.build(elements, onFirstPage=_draw_footer, onLaterPages=_draw_footer)
+    return buffer.getvalue()
+
+
+def render_voucher(kind, voucher):
+    return render_vouchers(kind, [voucher])
+
+
+def render_voucher_html(kind, voucher):
+    """The xhtml2pdf version, as an HttpResponse."""
+    context = {kind: voucher, **html_pdf_assets()}
+    return render_to_pdf(VOUCHERS[kind]['template'], context)
+
+
+def voucher_response(kind, voucher):
+    if getattr(settings, 'VOUCHER_RENDERER', 'reportlab') == 'html':
+        return render_voucher_html(kind, voucher)
+    response = HttpResponse(render_voucher(kind, voucher), content_type='application/pdf')
+    response['Content-Disposition'] = f'filename="{kind}_{voucher.pk}.pdf"'
+    return response
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'Accounts.middleware.RequestStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,10 +89,33 @@ WSGI_APPLICATION = 'Mango_project.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # DB_NAME points a process at another database (e.g. manage.py benchmark_suite)
+        'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        # Keep connections open between requests (seconds); 0 closes them per request
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds to wait for a lock before "database is locked"
+            'timeout': 20,
+        },
     }
 }
 
+# Applied to every new SQLite connection (see Accounts/sqlite_profile.py).
+# SQLITE_PROFILE=default in the environment keeps SQLite's own defaults.
+SQLITE_PROFILES = {
+    'default': {},
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 20000,  # ms, same as the timeout above
+        'cache_size': -32000,  # KiB
+        'mmap_size': 268435456,  # bytes
+        'temp_store': 'MEMORY',
+    },
+}
+SQLITE_PRAGMAS = SQLITE_PROFILES[os.environ.get('SQLITE_PROFILE', 'production')]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -138,6 +163,29 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 #Manually Added
+# Rendered invoice PDFs, keyed by invoice version (see Accounts/pdf_cache.py)
+PDF_CACHE_ROOT = BASE_DIR / 'pdf_cache'
+# Requests slower than this, or with more queries, are logged (see Accounts/middleware.py)
+REQUEST_STATS_SLOW_MS = 500
+REQUEST_STATS_SLOW_QUERIES = 50
+if sys.argv[1:2] == ['test']:
+    # The tests render PDFs and save large invoices on purpose: don't log those
+    REQUEST_STATS_SLOW_MS = REQUEST_STATS_SLOW_QUERIES = None
+# Dashboard / home figures are cached per data version (see Accounts/dashboard_cache.py).
+# Per worker in memory by default; CACHE_DIR=/path shares one file cache between workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'star-mango',
+    } if not os.environ.get('CACHE_DIR') else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['CACHE_DIR'],
+    },
+}
+DASHBOARD_CACHE_TIMEOUT = 3600
+# Worker threads per process for the concurrent queries of the async views (see Accounts/fanout.py)
+ASYNC_QUERY_WORKERS = 4
+
 STATICFILES_FINDERS = [
     'django.contrib.staticfiles.finders.FileSystemFinder',
     'django.contrib.staticfiles.finders.AppDirectoriesFinder',